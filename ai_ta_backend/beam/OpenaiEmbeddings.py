@@ -11,8 +11,15 @@ This script parallelizes requests to the OpenAI API while throttling to stay und
 Features:
 - Streams requests from file, to avoid running out of memory for giant jobs
 - Makes requests concurrently, to maximize throughput
-- Throttles request and token usage, to stay under rate limits
-- Retries failed requests up to {max_attempts} times, to avoid missing data
+- Throttles request and token usage with token buckets, to stay under rate limits without polling
+- Retries failed requests up to {max_attempts} times, to avoid missing data. Each request backs off on its own
+  (honouring Retry-After), so one rate limit error doesn't pause the whole job. Rate limit errors don't use up
+  attempts, up to {max_rate_limit_retries} per request. Exhausted quota (`insufficient_quota`) is never retried,
+  and nothing is retried past {max_retry_seconds}
+- Packs embedding inputs into batched requests (bounded by input and token counts). A batch rejected as invalid
+  is split in half and retried, to isolate the bad input
+- Streams embeddings into one preallocated float32 array (row i = input i) and drops each response as it
+  arrives, so memory stays ~4 bytes x dims x inputs. The array can be a memmap on disk for very large jobs
 - Logs errors, to diagnose problems with requests
 
 Example command to call script:
@@ -62,6 +69,30 @@ Inputs:
 - max_attempts : int, optional
     - number of times to retry a failed request before giving up
     - if omitted, will default to 5
+- max_rate_limit_retries : int, optional
+    - number of rate limit errors a request may wait out without using up an attempt. After that, they count
+      as failed attempts, so a key that is permanently rate limited still fails the job
+    - if omitted, will default to 20
+- max_retry_seconds : float, optional
+    - no request is retried after this many seconds from the start of the job, so a job that keeps failing
+      reports its failures in time (e.g. inside a task timeout) instead of backing off for hours
+    - if omitted, retries are only limited by max_attempts
+- max_inputs_per_request : int, optional
+    - embeddings only: max number of inputs packed into one request (the API accepts up to 2048)
+    - if omitted, will default to 256
+- max_tokens_per_request : int, optional
+    - embeddings only: max total tokens packed into one request
+    - if omitted, will default to 100,000
+- spill_to_disk_path : str, optional
+    - embeddings only: store the embeddings array in a .npy memmap at this path instead of in memory
+    - if omitted, the array is kept in memory
+- on_embeddings : callable, optional
+    - embeddings only: called with the list of input indices as soon as their embeddings are stored, so the caller
+      can start using them (e.g. uploading to a vector DB) while the rest of the job is still running
+    - runs on a worker thread, one call at a time and in order, so it may block without stalling the requests
+- max_requests_in_flight : int, optional
+    - max number of requests sent (or waiting to retry) at once; requests are read lazily, only this far ahead
+    - if omitted, will default to 50
 - logging_level : int, optional
     - level of logging to use; higher numbers will log fewer messages
     - 40 = ERROR; will log only when requests fail after all retries
@@ -74,17 +105,18 @@ The script is structured as follows:
     - Imports
     - Define main()
         - Initialize things
-        - In main loop:
-            - Get next request if one is not already waiting for capacity
-            - Update available token & request capacity
-            - If enough capacity available, call API
-            - The loop pauses if a rate limit error is hit
-            - The loop breaks when no tasks remain
+        - For each request, once fewer than max_requests_in_flight are running:
+            - Start a task that waits for request & token capacity, then calls the API
+            - On error, the task sleeps for that request's Retry-After (or backoff) and tries again
+        - Wait for the remaining tasks
+    - Define TokenBucket (rate limit capacity, refilled continuously)
     - Define dataclasses
         - StatusTracker (stores script metadata counters; only one instance is created)
         - APIRequest (stores API inputs, outputs, metadata; one method to call API)
     - Define functions
+        - allocate_embeddings (the float32 array embeddings are streamed into)
         - api_endpoint_from_url (extracts API endpoint from request URL)
+        - retry_after_from_headers (reads Retry-After from a response)
         - append_to_jsonl (writes to results file)
         - num_tokens_consumed_from_request (bigger function to infer token usage from request)
         - task_id_generator_function (yields 1, 2, 3, ...)
@@ -98,16 +130,20 @@ The script is structured as follows:
 import asyncio
 import json
 import logging
+import math
 
 # import os
+import random
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 # for storing API inputs, outputs, and metadata
 from dataclasses import dataclass, field
-from typing import Any, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import aiohttp  # for making API calls concurrently
+import numpy as np  # compact storage for embeddings
 import tiktoken  # for counting tokens
 
 # from langchain.embeddings.openai import OpenAIEmbeddings
@@ -117,8 +153,22 @@ import tiktoken  # for counting tokens
 
 class OpenAIAPIProcessor:
 
-  def __init__(self, input_prompts_list, request_url, api_key, max_requests_per_minute, max_tokens_per_minute,
-               token_encoding_name, max_attempts, logging_level):
+  def __init__(self,
+               input_prompts_list,
+               request_url,
+               api_key,
+               max_requests_per_minute,
+               max_tokens_per_minute,
+               token_encoding_name,
+               max_attempts,
+               logging_level,
+               max_inputs_per_request=256,
+               max_tokens_per_request=100_000,
+               max_requests_in_flight=50,
+               max_rate_limit_retries=20,
+               max_retry_seconds: Optional[float] = None,
+               spill_to_disk_path=None,
+               on_embeddings: Optional[Callable[[List[int]], None]] = None):
     self.request_url = request_url
     self.api_key = api_key
     self.max_requests_per_minute = max_requests_per_minute
@@ -126,16 +176,23 @@ class OpenAIAPIProcessor:
     self.token_encoding_name = token_encoding_name
     self.max_attempts = max_attempts
     self.logging_level = logging_level
+    self.max_inputs_per_request = max_inputs_per_request
+    self.max_tokens_per_request = max_tokens_per_request
+    self.max_requests_in_flight = max_requests_in_flight
+    self.max_rate_limit_retries = max_rate_limit_retries
+    self.max_retry_seconds = max_retry_seconds
+    self.spill_to_disk_path = spill_to_disk_path
+    self.on_embeddings = on_embeddings
     self.input_prompts_list: List[dict] = input_prompts_list
-    self.results = []
+    self.results = []  # chat completions only, embeddings go to self.embeddings
     self.cleaned_results: List[str] = []
+    # embeddings only. Row i is the embedding of input_prompts_list[i], allocated when the first response arrives.
+    self.embeddings: Optional[np.ndarray] = None
+    self.embedded = np.zeros(len(input_prompts_list), dtype=bool)  # rows of self.embeddings that are filled
+    self.failed_inputs: Dict[int, list] = {}  # input index -> errors
 
   async def process_api_requests_from_file(self):
     """Processes API requests in parallel, throttling to stay under rate limits."""
-    # constants
-    seconds_to_pause_after_rate_limit_error = 15
-    seconds_to_sleep_each_loop = 0.001  # 1 ms limits max throughput to 1,000 requests per second
-
     # initialize logging
     logging.basicConfig(level=self.logging_level)
     logging.debug(f"Logging initialized at level {self.logging_level}")
@@ -145,106 +202,61 @@ class OpenAIAPIProcessor:
     request_header = {"Authorization": f"Bearer {self.api_key}"}
 
     # initialize trackers
-    queue_of_requests_to_retry = asyncio.Queue()
     task_id_generator = task_id_generator_function()  # generates integer IDs of 1, 2, 3, ...
     status_tracker = StatusTracker()  # single instance to track a collection of variables
-    next_request = None  # variable to hold the next request to call
-
-    # initialize available capacity counts
-    available_request_capacity = self.max_requests_per_minute
-    available_token_capacity = self.max_tokens_per_minute
-    last_update_time = time.time()
 
-    # initialize flags
-    file_not_finished = True  # after file is empty, we'll skip reading it
+    # rate limits are token buckets, dispatch sleeps exactly until there is capacity instead of polling
+    request_bucket = TokenBucket(self.max_requests_per_minute)
+    token_bucket = TokenBucket(self.max_tokens_per_minute)
+    # bounds concurrent requests, and how far ahead of the API we read (and tokenize) requests
+    in_flight = asyncio.Semaphore(self.max_requests_in_flight)
+    retry_deadline = time.monotonic() + self.max_retry_seconds if self.max_retry_seconds is not None else math.inf
     logging.debug("Initialization complete.")
 
-    requests = self.input_prompts_list.__iter__()
-
-    logging.debug("File opened. Entering main loop")
-
-    task_list = []
-
-    while True:
-      # get next request (if one is not already waiting for capacity)
-      if next_request is None:
-        if not queue_of_requests_to_retry.empty():
-          next_request = queue_of_requests_to_retry.get_nowait()
-          logging.debug(f"Retrying request {next_request.task_id}: {next_request}")
-        elif file_not_finished:
-          try:
-            # get new request
-            # request_json = json.loads(next(requests))
-            request_json = next(requests)
-
-            next_request = APIRequest(task_id=next(task_id_generator),
-                                      request_json=request_json,
-                                      token_consumption=num_tokens_consumed_from_request(
-                                          request_json, api_endpoint, self.token_encoding_name),
-                                      attempts_left=self.max_attempts,
-                                      metadata=request_json.pop("metadata", None))
-            status_tracker.num_tasks_started += 1
-            status_tracker.num_tasks_in_progress += 1
-            logging.debug(f"Reading request {next_request.task_id}: {next_request}")
-          except StopIteration:
-            # if file runs out, set flag to stop reading it
-            logging.debug("Read file exhausted")
-            file_not_finished = False
-
-      # update available capacity
-      current_time = time.time()
-      seconds_since_update = current_time - last_update_time
-      available_request_capacity = min(
-          available_request_capacity + self.max_requests_per_minute * seconds_since_update / 60.0,
-          self.max_requests_per_minute,
-      )
-      available_token_capacity = min(
-          available_token_capacity + self.max_tokens_per_minute * seconds_since_update / 60.0,
-          self.max_tokens_per_minute,
-      )
-      last_update_time = current_time
-
-      # if enough capacity available, call API
-      if next_request:
-        next_request_tokens = next_request.token_consumption
-        if (available_request_capacity >= 1 and available_token_capacity >= next_request_tokens):
-          # update counters
-          available_request_capacity -= 1
-          available_token_capacity -= next_request_tokens
-          next_request.attempts_left -= 1
-
-          # call API
-          # TODO: NOT SURE RESPONSE WILL WORK HERE
-          task = asyncio.create_task(
-              next_request.call_api(
-                  request_url=self.request_url,
-                  request_header=request_header,
-                  retry_queue=queue_of_requests_to_retry,
-                  status_tracker=status_tracker,
-              ))
-          task_list.append(task)
-          next_request = None  # reset next_request to empty
-
-          # print("status_tracker.num_tasks_in_progress", status_tracker.num_tasks_in_progress)
-          # one_task_result = task.result()
-          # print("one_task_result", one_task_result)
-
-      # if all tasks are finished, break
-      if status_tracker.num_tasks_in_progress == 0:
-        break
-
-      # main loop sleeps briefly so concurrent tasks can run
-      await asyncio.sleep(seconds_to_sleep_each_loop)
-
-      # if a rate limit error was hit recently, pause to cool down
-      seconds_since_rate_limit_error = (time.time() - status_tracker.time_of_last_rate_limit_error)
-      if seconds_since_rate_limit_error < seconds_to_pause_after_rate_limit_error:
-        remaining_seconds_to_pause = (seconds_to_pause_after_rate_limit_error - seconds_since_rate_limit_error)
-        await asyncio.sleep(remaining_seconds_to_pause)
-        # ^e.g., if pause is 15 seconds and final limit was hit 5 seconds ago
-        logging.warn(
-            f"Pausing to cool down until {time.ctime(status_tracker.time_of_last_rate_limit_error + seconds_to_pause_after_rate_limit_error)}"
-        )
+    if api_endpoint == "embeddings":
+      # one request per batch of inputs, instead of one request per input
+      requests = batch_embedding_requests(self.input_prompts_list, self.token_encoding_name,
+                                          self.max_inputs_per_request, self.max_tokens_per_request)
+    else:
+      requests = self.input_prompts_list.__iter__()
+
+    tasks = set()
+    # on_embeddings may block (uploads, cache writes), so it runs on its own thread instead of the event loop
+    self._callback_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='on-embeddings')
+    self._callback_futures: List[asyncio.Future] = []
+    # one session for the whole run, so connections are reused
+    connector = aiohttp.TCPConnector(limit=self.max_requests_in_flight)
+    async with aiohttp.ClientSession(connector=connector) as session:
+      for request_json in requests:
+        await in_flight.acquire()
+        metadata = request_json.pop("metadata", None)
+        next_request = APIRequest(
+            task_id=next(task_id_generator),
+            request_json=request_json,
+            # batches already know their token count, don't re-encode them
+            token_consumption=sum(metadata['input_tokens']) if is_embedding_batch(metadata) else
+            num_tokens_consumed_from_request(request_json, api_endpoint, self.token_encoding_name),
+            attempts_left=self.max_attempts,
+            rate_limit_retries_left=self.max_rate_limit_retries,
+            retry_deadline=retry_deadline,
+            metadata=metadata)
+        status_tracker.num_tasks_started += 1
+        status_tracker.num_tasks_in_progress += 1
+        logging.debug(f"Reading request {next_request.task_id}: {next_request}")
+
+        task = asyncio.create_task(
+            self.run_request(next_request, session, request_header, request_bucket, token_bucket, status_tracker))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        task.add_done_callback(lambda _: in_flight.release())
+
+      if tasks:
+        await asyncio.wait(list(tasks))
+
+    try:
+      await asyncio.gather(*self._callback_futures)
+    finally:
+      self._callback_executor.shutdown(wait=True)
 
     # after finishing, log final status
     logging.info("""Parallel processing complete. About to return.""")
@@ -253,16 +265,95 @@ class OpenAIAPIProcessor:
     if status_tracker.num_rate_limit_errors > 0:
       logging.warning(
           f"{status_tracker.num_rate_limit_errors} rate limit errors received. Consider running at a lower rate.")
-
-    # asyncio wait for task_list
-    await asyncio.wait(task_list)
-
-    for task in task_list:
-      openai_completion = task.result()
-      self.results.append(openai_completion)
+    if isinstance(self.embeddings, np.memmap):
+      self.embeddings.flush()
 
     self.cleaned_results: List[str] = extract_context_from_results(self.results)
 
+  async def run_request(self, request: 'APIRequest', session: aiohttp.ClientSession, request_header: dict,
+                        request_bucket: 'TokenBucket', token_bucket: 'TokenBucket', status_tracker: 'StatusTracker'):
+    """
+    Run one request to completion: wait for capacity, call the API, and retry with this request's own backoff.
+    A rate limited request waits out its Retry-After without holding up any other request.
+    """
+    pending = [request]
+    while pending:
+      request = pending.pop()
+      backoff_seconds = request.retry_at - time.monotonic()
+      if backoff_seconds > 0:
+        logging.debug(f"Request {request.task_id} backing off for {backoff_seconds:.2f} seconds")
+        await asyncio.sleep(backoff_seconds)
+      await request_bucket.acquire(1)
+      await token_bucket.acquire(request.token_consumption)
+      request.attempts_left -= 1
+
+      openai_completion, retries = await request.call_api(
+          session=session,
+          request_url=self.request_url,
+          request_header=request_header,
+          status_tracker=status_tracker,
+      )
+      pending.extend(retries)
+      if openai_completion is None:
+        continue
+      if len(openai_completion) == 3 and is_embedding_batch(openai_completion[2]):
+        stored_indices = self.store_embeddings(openai_completion)
+        if stored_indices and self.on_embeddings:
+          self._callback_futures.append(asyncio.get_running_loop().run_in_executor(self._callback_executor,
+                                                                                   self.on_embeddings, stored_indices))
+      else:
+        self.results.append(openai_completion)
+
+  def store_embeddings(self, data: list) -> List[int]:
+    """
+    Copy a batch's embeddings into their rows of `self.embeddings`. The response itself is not kept.
+    Returns the input indices that were stored.
+    """
+    _request_json, response, metadata = data
+    input_indices = metadata["input_indices"]
+    if not isinstance(response, dict):
+      for i in input_indices:
+        self.failed_inputs[i] = response
+      return []
+    stored_indices = []
+    for item in response["data"]:
+      if self.embeddings is None:
+        self.embeddings = allocate_embeddings((len(self.input_prompts_list), len(item["embedding"])),
+                                              self.spill_to_disk_path)
+      row = input_indices[item["index"]]
+      self.embeddings[row] = item["embedding"]
+      self.embedded[row] = True
+      stored_indices.append(row)
+    return stored_indices
+
+
+class TokenBucket:
+  """
+  Rate limit capacity that refills continuously, up to `capacity_per_minute`.
+  `acquire` sleeps exactly until enough capacity is available, waiters are served in order.
+  """
+
+  def __init__(self, capacity_per_minute: float):
+    self.capacity = capacity_per_minute
+    self.refill_per_second = capacity_per_minute / 60.0
+    self.available = capacity_per_minute
+    self.last_update_time = time.monotonic()
+    self.lock = asyncio.Lock()
+
+  def _refill(self):
+    now = time.monotonic()
+    self.available = min(self.capacity, self.available + (now - self.last_update_time) * self.refill_per_second)
+    self.last_update_time = now
+
+  async def acquire(self, amount: float):
+    amount = min(amount, self.capacity)  # an oversized request still has to run eventually
+    async with self.lock:
+      self._refill()
+      while self.available < amount:
+        await asyncio.sleep((amount - self.available) / self.refill_per_second)
+        self._refill()
+      self.available -= amount
+
 
 def extract_context_from_results(results: List[Any]) -> List[str]:
   assistant_contents = []
@@ -297,7 +388,6 @@ class StatusTracker:
   num_rate_limit_errors: int = 0
   num_api_errors: int = 0  # excluding rate limit errors, counted above
   num_other_errors: int = 0
-  time_of_last_rate_limit_error: float = 0  # used to cool off after hitting rate limits
 
 
 @dataclass
@@ -308,31 +398,41 @@ class APIRequest:
   request_json: dict
   token_consumption: int
   attempts_left: int
+  rate_limit_retries_left: int
   metadata: dict
   result: list = field(default_factory=list)
+  retry_at: float = 0  # time.monotonic() before which this request must not be retried
+  retry_deadline: float = math.inf  # time.monotonic() after which this request is not retried anymore
 
   async def call_api(
       self,
+      session: aiohttp.ClientSession,
       request_url: str,
       request_header: dict,
-      retry_queue: asyncio.Queue,
       status_tracker: StatusTracker,
-  ):
-    """Calls the OpenAI API and saves results."""
+  ) -> Tuple[Optional[list], List['APIRequest']]:
+    """
+    Calls the OpenAI API once.
+    Returns (result, requests_to_retry): the result is None if this attempt will be retried.
+    """
     # logging.info(f"Starting request #{self.task_id}")
     error = None
+    retry_after = None
     try:
-      async with aiohttp.ClientSession() as session:
-        async with session.post(url=request_url, headers=request_header, json=self.request_json) as response:
-          response = await response.json()
+      async with session.post(url=request_url, headers=request_header, json=self.request_json) as response:
+        retry_after = retry_after_from_headers(response.headers)
+        response = await response.json()
       if "error" in response:
         logging.warning(f"Request {self.task_id} failed with error {response['error']}")
         status_tracker.num_api_errors += 1
         error = response
-        if "Rate limit" in response["error"].get("message", ""):
-          status_tracker.time_of_last_rate_limit_error = time.time()
+        if "Rate limit" in response["error"].get("message", "") and not is_quota_exceeded_error(response):
           status_tracker.num_rate_limit_errors += 1
           status_tracker.num_api_errors -= 1  # rate limit errors are counted separately
+          if self.rate_limit_retries_left > 0:
+            # the request was never processed, waiting out the limit isn't a failed attempt
+            self.rate_limit_retries_left -= 1
+            self.attempts_left += 1
 
     except Exception as e:  # catching naked exceptions is bad practice, but in this case we'll log & save them
       logging.warning(f"Request {self.task_id} failed with Exception {e}")
@@ -340,16 +440,34 @@ class APIRequest:
       error = e
     if error:
       self.result.append(error)
-      if self.attempts_left:
-        retry_queue.put_nowait(self)
-      else:
-        logging.error(f"Request {self.request_json} failed after all attempts. Saving errors: {self.result}")
-        data = ([self.request_json, [str(e) for e in self.result], self.metadata]
-                if self.metadata else [self.request_json, [str(e) for e in self.result]])
-        #append_to_jsonl(data, save_filepath)
-        status_tracker.num_tasks_in_progress -= 1
-        status_tracker.num_tasks_failed += 1
-        return data
+      if is_invalid_request_error(error) and is_embedding_batch(self.metadata) and len(self.request_json['input']) > 1:
+        # One bad input fails the whole batch. Split it in half and retry each half, to isolate the bad input.
+        logging.warning(f"Batch request {self.task_id} was rejected, splitting it in two and retrying.")
+        status_tracker.num_tasks_in_progress += 1  # one task became two
+        return None, [
+            APIRequest(task_id=self.task_id,
+                       request_json=half[0],
+                       token_consumption=sum(half[1]['input_tokens']),
+                       attempts_left=self.attempts_left + 1,
+                       rate_limit_retries_left=self.rate_limit_retries_left,
+                       retry_deadline=self.retry_deadline,
+                       metadata=half[1]) for half in split_embedding_request(self.request_json, self.metadata)
+        ]
+      if self.attempts_left and not is_invalid_request_error(error) and not is_quota_exceeded_error(error):
+        # Honour Retry-After when the API sends it, otherwise exponential backoff with jitter.
+        attempt = len(self.result)
+        delay = retry_after if retry_after is not None else min(60.0, 2**(attempt - 1)) * random.uniform(0.5, 1.5)
+        if time.monotonic() + delay <= self.retry_deadline:
+          self.retry_at = time.monotonic() + delay
+          return None, [self]
+        logging.warning(f"Request {self.task_id} would retry past the job's retry deadline, giving up.")
+      logging.error(f"Request {self.request_json} failed after all attempts. Saving errors: {self.result}")
+      data = ([self.request_json, [str(e) for e in self.result], self.metadata]
+              if self.metadata else [self.request_json, [str(e) for e in self.result]])
+      #append_to_jsonl(data, save_filepath)
+      status_tracker.num_tasks_in_progress -= 1
+      status_tracker.num_tasks_failed += 1
+      return data, []
     else:
       data = ([self.request_json, response, self.metadata] if self.metadata else [self.request_json, response]
              )  # type: ignore
@@ -358,7 +476,7 @@ class APIRequest:
       status_tracker.num_tasks_succeeded += 1
       # logging.debug(f"Request {self.task_id} saved to {save_filepath}")
 
-      return data
+      return data, []
 
 
 # functions
@@ -369,10 +487,93 @@ def api_endpoint_from_url(request_url: str):
   if 'text-embedding-ada-002' in request_url:
     return 'embeddings'
   else:
-    match = re.search('^https://[^/]+/v\\d+/(.+)$', request_url)
+    match = re.search('^https?://[^/]+/v\\d+/(.+)$', request_url)
     return match[1]  # type: ignore
 
 
+def batch_embedding_requests(input_prompts_list: List[dict], token_encoding_name: str, max_inputs_per_request: int,
+                             max_tokens_per_request: int):
+  """
+  Pack single-input embedding requests into batched requests, in order.
+  Each batch's metadata remembers the index (in `input_prompts_list`) and token count of every input.
+  """
+  encoding = tiktoken.get_encoding(token_encoding_name)
+  batch_inputs: List[str] = []
+  batch_indices: List[int] = []
+  batch_tokens: List[int] = []
+  model = None
+
+  def make_batch():
+    request_json = {"input": batch_inputs, "metadata": {"input_indices": batch_indices, "input_tokens": batch_tokens}}
+    if model:
+      request_json["model"] = model
+    return request_json
+
+  for index, request_json in enumerate(input_prompts_list):
+    num_tokens = len(encoding.encode(request_json["input"]))
+    batch_is_full = (len(batch_inputs) >= max_inputs_per_request or
+                     sum(batch_tokens) + num_tokens > max_tokens_per_request)
+    if batch_inputs and (batch_is_full or request_json.get("model") != model):
+      yield make_batch()
+      batch_inputs, batch_indices, batch_tokens = [], [], []
+    model = request_json.get("model")
+    batch_inputs.append(request_json["input"])
+    batch_indices.append(index)
+    batch_tokens.append(num_tokens)
+
+  if batch_inputs:
+    yield make_batch()
+
+
+def is_embedding_batch(metadata) -> bool:
+  return isinstance(metadata, dict) and "input_indices" in metadata
+
+
+def is_invalid_request_error(error) -> bool:
+  """The API rejected the request itself (e.g. an input is too long). Retrying it unchanged won't help."""
+  details = error.get("error") if isinstance(error, dict) else None
+  return isinstance(details, dict) and details.get("type") == "invalid_request_error"
+
+
+def is_quota_exceeded_error(error) -> bool:
+  """The account is out of credits. OpenAI sends this as a 429 too, but waiting won't help."""
+  details = error.get("error") if isinstance(error, dict) else None
+  return isinstance(details, dict) and "insufficient_quota" in (details.get("type"), details.get("code"))
+
+
+def split_embedding_request(request_json: dict, metadata: dict):
+  """Split a batched embedding request into two halves: [(request_json, metadata), (request_json, metadata)]."""
+  middle = len(request_json["input"]) // 2
+  halves = []
+  for part in (slice(None, middle), slice(middle, None)):
+    halves.append(({
+        **request_json, "input": request_json["input"][part]
+    }, {
+        "input_indices": metadata["input_indices"][part],
+        "input_tokens": metadata["input_tokens"][part]
+    }))
+  return halves
+
+
+def allocate_embeddings(shape: Tuple[int, int], spill_to_disk_path: Optional[str] = None) -> np.ndarray:
+  """A float32 array for all embeddings of a job, in memory or as a memmapped .npy file."""
+  if spill_to_disk_path:
+    return np.lib.format.open_memmap(spill_to_disk_path, mode='w+', dtype=np.float32, shape=shape)
+  return np.zeros(shape, dtype=np.float32)
+
+
+def retry_after_from_headers(headers) -> Optional[float]:
+  """Seconds to wait before retrying, from the `retry-after-ms` or `retry-after` response headers, if present."""
+  try:
+    if headers.get("retry-after-ms"):
+      return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+      return float(headers["retry-after"])
+  except ValueError:
+    pass  # retry-after can also be an HTTP date, fall back to our own backoff
+  return None
+
+
 def append_to_jsonl(data, filename: str) -> None:
   """Append a json payload to the end of a jsonl file."""
   json_string = json.dumps(data)
@@ -0,0 +1,118 @@
+"""
+Persistent embedding cache, keyed by (model, sha256(text)).
+
+Identical chunks show up across files, projects and re-ingests (boilerplate headers, syllabus policies,
+shared public doc groups). Looking them up here before calling the embeddings API makes repeat content free.
+
+Backed by Redis when `EMBEDDING_CACHE_REDIS_URL` is set (shared by every ingest container), otherwise by a
+SQLite file on the ingest cache volume. Embeddings are stored as float32 bytes, not JSON.
+Failures are logged and treated as cache misses, the cache must never fail an ingest.
+"""
+
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+SQLITE_CACHE_PATH = os.path.join(os.getenv('INGEST_CACHE_DIR', './ingest_cache'), 'embeddings.sqlite3')
+
+# SQLite's default limit on host parameters is 999.
+SQLITE_BATCH_SIZE = 500
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+  return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+def encode_embedding(embedding: np.ndarray) -> bytes:
+  return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def decode_embedding(blob: bytes) -> np.ndarray:
+  return np.frombuffer(blob, dtype=np.float32)
+
+
+def encode_embeddings_b64(embeddings: Sequence[np.ndarray]) -> str:
+  """All of a document's embeddings as one base64 float32 (little-endian, row-major) blob, for Supabase."""
+  return base64.b64encode(np.asarray(embeddings, dtype='<f4').tobytes()).decode('ascii')
+
+
+class EmbeddingCache:
+
+  def __init__(self, redis_url: Optional[str] = None, sqlite_path: str = SQLITE_CACHE_PATH):
+    redis_url = redis_url or os.getenv('EMBEDDING_CACHE_REDIS_URL')
+    self.redis_client = None
+    self.sqlite_conn = None
+    self.lock = threading.Lock()
+    self.ttl_seconds = int(os.getenv('EMBEDDING_CACHE_TTL_SECONDS', 0)) or None
+    try:
+      if redis_url:
+        import redis
+        self.redis_client = redis.Redis.from_url(redis_url)
+      else:
+        os.makedirs(os.path.dirname(sqlite_path), exist_ok=True)
+        # The volume is shared by every ingest container. WAL needs shared memory between the processes, so it is
+        # only safe on one host: use the rollback journal (also undoing WAL on older cache files). Writers from
+        # other containers wait for the lock, up to `timeout` seconds.
+        self.sqlite_conn = sqlite3.connect(sqlite_path, timeout=30, check_same_thread=False)
+        self.sqlite_conn.execute('PRAGMA journal_mode=DELETE')
+        self.sqlite_conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB NOT NULL)')
+        self.sqlite_conn.commit()
+    except Exception as e:
+      print(f"Embedding cache unavailable, continuing without it: {e}")
+      self.redis_client = None
+      self.sqlite_conn = None
+
+  def get_many(self, model: str, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+    """Returns {text: embedding} for the texts that are cached."""
+    keys_to_texts = {embedding_cache_key(model, text): text for text in texts}
+    if not keys_to_texts:
+      return {}
+    try:
+      if self.redis_client is not None:
+        keys = list(keys_to_texts)
+        blobs = self.redis_client.mget(keys)
+        return {keys_to_texts[key]: decode_embedding(blob) for key, blob in zip(keys, blobs) if blob is not None}
+      if self.sqlite_conn is not None:
+        found: Dict[str, np.ndarray] = {}
+        keys = list(keys_to_texts)
+        with self.lock:
+          for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+            batch = keys[start:start + SQLITE_BATCH_SIZE]
+            rows = self.sqlite_conn.execute(
+                f"SELECT key, embedding FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch).fetchall()
+            found.update({keys_to_texts[key]: decode_embedding(blob) for key, blob in rows})
+        return found
+    except Exception as e:
+      print(f"Error reading embedding cache: {e}")
+    return {}
+
+  def put_many(self, model: str, embeddings: Dict[str, np.ndarray]):
+    """Store {text: embedding}."""
+    if not embeddings:
+      return
+    rows = [(embedding_cache_key(model, text), encode_embedding(embedding)) for text, embedding in embeddings.items()]
+    try:
+      if self.redis_client is not None:
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for key, blob in rows:
+          pipeline.set(key, blob, ex=self.ttl_seconds)
+        pipeline.execute()
+      elif self.sqlite_conn is not None:
+        with self.lock:
+          self.sqlite_conn.executemany('INSERT OR IGNORE INTO embeddings (key, embedding) VALUES (?, ?)', rows)
+          self.sqlite_conn.commit()
+    except Exception as e:
+      print(f"Error writing embedding cache: {e}")
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache() -> EmbeddingCache:
+  """The cache shared by every ingest in this process, so each task doesn't reconnect to Redis or reopen SQLite."""
+  return EmbeddingCache()
@@ -3,70 +3,72 @@ To deploy: beam deploy ingest.py:ingest
 Use CAII gmail to auth.
 """
 
-from typing import Any, Callable, Dict, List, Optional, Union, cast
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Union, cast
 
 import beam
 from beam import BotContext  # To obtain task_id
 from beam import QueueDepthAutoscaler  # RequestLatencyAutoscaler,
 
-if beam.env.is_remote():
-  # Only import these in the Cloud container, not when building the container.
+if beam.env.is_remote() or os.getenv('INGEST_LOCAL_WORKER'):
+  # Only import these in the Cloud container (or the local worker, see local_worker.py), not when building the container.
   import asyncio
+  import hashlib
   import inspect
   import json
   import logging
-  import mimetypes
-  import os
+  import math
   import re
   import shutil
-  import subprocess
   import time
   import traceback
   import uuid
+  from concurrent.futures import ThreadPoolExecutor, as_completed
   from pathlib import Path
-  from tempfile import NamedTemporaryFile
+  from tempfile import NamedTemporaryFile, TemporaryDirectory
 
   # from typing import Any, Callable, Dict, List, Optional, Union
   import beam
   import boto3
   import fitz
+  import numpy as np
   import openai
-  import pdfplumber
   import pytesseract
   import sentry_sdk
   import supabase
   from bs4 import BeautifulSoup
+  from embedding_cache import encode_embeddings_b64, get_embedding_cache
   from git.repo import Repo
+  from ingest_checkpoints import IngestCheckpoint, schedule_checkpoint_pruning
   from langchain.document_loaders import (
       Docx2txtLoader,
       GitLoader,
       PythonLoader,
-      TextLoader,
       UnstructuredExcelLoader,
       UnstructuredPowerPointLoader,
   )
-  from langchain.document_loaders.csv_loader import CSVLoader
   from langchain.embeddings.openai import OpenAIEmbeddings
   from langchain.schema import Document
-  from langchain.text_splitter import RecursiveCharacterTextSplitter
   from langchain.vectorstores import Qdrant
+  from media_transcription import transcribe_media
   from OpenaiEmbeddings import OpenAIAPIProcessor
+  from pdf_extraction import extract_pdf_pages, get_executor
   from PIL import Image
   from posthog import Posthog
-  from pydub import AudioSegment
   from qdrant_client import QdrantClient, models
   from qdrant_client.models import PointStruct
+  from qdrant_uploader import QdrantUploader
   from requests.exceptions import Timeout
+  from s3_file import S3File
+  from sentry_sampling import sentry_sampling_options
   from supabase.client import ClientOptions
+  from tabular_ingest import OPENPYXL_SUFFIXES, csv_row_blocks, excel_row_blocks
+  from text_splitting import get_text_splitter
+  from transcript_chunking import chunk_cues, parse_subtitle_cues
 
-  sentry_sdk.init(
-      dsn=os.getenv("SENTRY_DSN"),
-      # Set traces_sample_rate to 1.0 to capture 100% of transactions for performance monitoring.
-      traces_sample_rate=1.0,
-      # Set profiles_sample_rate to 1.0 to profile 100% of sampled transactions.
-      # We recommend adjusting this value in production.
-      profiles_sample_rate=1.0,
-      enable_tracing=True)
+  # Tracing and profiling rates are set by the sampling policy, see sentry_sampling.py
+  sentry_sdk.init(dsn=os.getenv("SENTRY_DSN"), **sentry_sampling_options())
 
 requirements = [
     "openai<1.0",
@@ -77,9 +79,7 @@ requirements = [
     "qdrant-client==1.7.3",
     "langchain==0.0.331",
     "posthog==3.1.0",
-    "pysrt==1.1.2",
     "docx2txt==0.8",
-    "pydub==0.25.1",
     "ffmpeg-python==0.2.0",
     "ffprobe==0.5",
     "ffmpeg==1.4",
@@ -92,7 +92,8 @@ requirements = [
     "GitPython==3.1.40",
     "beautifulsoup4==4.12.2",
     "sentry-sdk==1.39.1",
-    "pdfplumber==0.11.0",  # PDF OCR, better performance than Fitz/PyMuPDF in my Gies PDF testing.
+    "numpy",
+    "redis",  # optional, shared embedding cache
 ]
 
 image = (beam.Image(
@@ -101,6 +102,9 @@ image = (beam.Image(
     python_packages=requirements,
 ))
 
+# Persistent cache shared by all ingest containers (e.g. OCR output). Must match INGEST_CACHE_DIR.
+volume_path = "./ingest_cache"
+
 # autoscaler = RequestLatencyAutoscaler(desired_latency=30, max_replicas=2)
 autoscaler = QueueDepthAutoscaler(tasks_per_container=300, max_containers=3)
 
@@ -158,6 +162,7 @@ def loader():
       's3',
       aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
       aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+      endpoint_url=os.getenv('S3_ENDPOINT_URL'),  # e.g. MinIO for the local worker, unset for AWS
   )
 
   # Create a Supabase client
@@ -174,7 +179,16 @@ def loader():
   #     openai_api_version=os.getenv('OPENAI_API_VERSION'),  #type:ignore
   #     openai_api_type=OPENAI_API_TYPE)
 
-  posthog = Posthog(sync_mode=True, project_api_key=os.environ['POSTHOG_API_KEY'], host='https://app.posthog.com')
+  # Events are uploaded in batches by the client's background thread, not one request per capture.
+  posthog = Posthog(sync_mode=False,
+                    project_api_key=os.getenv('POSTHOG_API_KEY', ''),
+                    host='https://app.posthog.com',
+                    disabled=not os.getenv('POSTHOG_API_KEY'))
+
+  # Open the embedding cache at worker start rather than in the first task
+  get_embedding_cache()
+  # Create the PDF process pool here, not lazily from bulk_ingest's threads
+  get_executor()
 
   return qdrant_client, cropwizard_qdrant_client, vectorstore, s3_client, supabase_client, posthog
 
@@ -193,9 +207,18 @@ def loader():
     secrets=ourSecrets,
     on_start=loader,
     image=image,
-    autoscaler=autoscaler)
+    autoscaler=autoscaler,
+    volumes=[beam.Volume(name="ingest_cache", mount_path=volume_path)])
 def ingest(context, **inputs: Dict[str | List[str], Any]):
-  qdrant_client, cropwizard_qdrant_client, vectorstore, s3_client, supabase_client, posthog = context.on_start_value
+  return process_ingest_task(context.on_start_value, **inputs)
+
+
+def process_ingest_task(clients, **inputs: Dict[str | List[str], Any]) -> str:
+  """
+  Run one ingest task. `clients` is what `loader()` returns. Called by the Beam task queue and by the local worker.
+  Returns the JSON encoded success_fail_dict.
+  """
+  qdrant_client, cropwizard_qdrant_client, vectorstore, s3_client, supabase_client, posthog = clients
   course_name: List[str] | str = inputs.get('course_name', '')
   s3_paths: List[str] | str = inputs.get('s3_paths', '')
   url: List[str] | str | None = inputs.get('url', None)
@@ -241,8 +264,15 @@ def ingest(context, **inputs: Dict[str | List[str], Any]):
 
   # Retry failed ingests (but not unexpected exceptions)
   if success_fail_dict.get('failure_ingest'):
-    success_fail_dict = retry_ingest(supabase_client, posthog, run_ingest, course_name, s3_paths, base_url, url,
-                                     readable_filename, content, doc_groups)
+    if isinstance(s3_paths, list) and success_fail_dict.get('results'):
+      # Multi-file ingest: only retry the files that failed, keep the results of the rest
+      failed_s3_paths = [path for path, result in success_fail_dict['results'].items() if result['status'] == 'failure']
+      retry_result = retry_ingest(supabase_client, posthog, run_ingest, course_name, failed_s3_paths, base_url, url,
+                                  readable_filename, content, doc_groups)
+      success_fail_dict = merge_bulk_ingest_results(success_fail_dict, retry_result, failed_s3_paths)
+    else:
+      success_fail_dict = retry_ingest(supabase_client, posthog, run_ingest, course_name, s3_paths, base_url, url,
+                                       readable_filename, content, doc_groups)
     if isinstance(success_fail_dict, str) or success_fail_dict.get('failure_ingest'):
       error = str(success_fail_dict if isinstance(success_fail_dict, str) else success_fail_dict['failure_ingest'])
       handle_ingest_failure(supabase_client, posthog, course_name, s3_paths, readable_filename, url, base_url, error)
@@ -319,6 +349,24 @@ def handle_ingest_failure(supabase_client, posthog, course_name, s3_paths, reada
                   })
 
 
+def merge_bulk_ingest_results(first_result: Dict[str, Any], retry_result: Dict[str, Any] | str,
+                              retried_s3_paths: List[str]) -> Dict[str, Any]:
+  """Update a multi-file bulk_ingest result with the result of retrying some of its files."""
+  results = dict(first_result['results'])
+  if isinstance(retry_result, dict) and retry_result.get('results'):
+    results.update(retry_result['results'])
+  else:
+    # The retry failed as a whole, every retried file keeps failing with that error
+    error = str(retry_result if isinstance(retry_result, str) else retry_result.get('failure_ingest'))
+    results.update({path: {'status': 'failure', 'error': error} for path in retried_s3_paths})
+  successes = [path for path, result in results.items() if result['status'] == 'success']
+  failures = [{
+      's3_path': path,
+      'error': result['error']
+  } for path, result in results.items() if result['status'] == 'failure']
+  return {"success_ingest": successes or None, "failure_ingest": failures or None, "results": results}
+
+
 def retry_ingest(supabase_client, posthog, run_ingest, course_name, s3_paths, base_url, url, readable_filename, content,
                  doc_groups):
   num_retries = 3
@@ -351,24 +399,32 @@ class Ingest():
     self.s3_client = s3_client
     self.supabase_client = supabase_client
     self.posthog = posthog
+    self.embedding_cache = get_embedding_cache()
+    schedule_checkpoint_pruning()
+    # Files ingested at once by bulk_ingest
+    self.bulk_ingest_max_workers = int(os.getenv('BULK_INGEST_MAX_WORKERS', 4))
+
+  @contextmanager
+  def _open_s3_file(self, s3_path: str, s3_file: Optional['S3File'] = None):
+    """Reuse the file `bulk_ingest` already downloaded, or download it once when an ingest method is called directly."""
+    if s3_file is not None:
+      yield s3_file
+    else:
+      with S3File(self.s3_client, s3_path) as downloaded_file:
+        yield downloaded_file
 
   def bulk_ingest(self, course_name: str, s3_paths: Union[str, List[str]],
-                  **kwargs) -> Dict[str, None | str | Dict[str, str]]:
+                  **kwargs) -> Dict[str, None | str | Dict[str, str] | List[Any]]:
     """ 
     Bulk ingest a list of s3 paths into the vectorstore, and also into the supabase database.
-    -> Dict[str, str | Dict[str, str]]
+    Files are ingested concurrently, up to `self.bulk_ingest_max_workers` at a time.
+
+    Returns a dict with a per-file result map under `results`: {s3_path: {'status': 'success' | 'failure', 'error'?}}.
+    `success_ingest` / `failure_ingest` summarize it: for a single file, the s3_path / {'s3_path', 'error'} as
+    before; for several files, a list of those (or None).
     """
     print('s3 path from bulk ingest', s3_paths)
 
-    def _ingest_single(ingest_method: Callable, s3_path, *args, **kwargs):
-      """Handle running an arbitrary ingest function for an individual file."""
-      # RUN INGEST METHOD
-      ret = ingest_method(s3_path, *args, **kwargs)
-      if ret == "Success":
-        success_status['success_ingest'] = str(s3_path)
-      else:
-        success_status['failure_ingest'] = {'s3_path': str(s3_path), 'error': str(ret)}
-
     # 👇👇👇👇 ADD NEW INGEST METHODS HERE 👇👇👇👇🎉
     file_ingest_methods = {
         '.html': self._ingest_html,
@@ -405,80 +461,106 @@ class Ingest():
         'text': self._ingest_single_txt,
         'image': self._ingest_single_image,
     }
-    # 👆👆👆👆 ADD NEW INGEST METHODhe 👆👆👆👆🎉
 
-    print(f"Top of ingest, Course_name {course_name}. S3 paths {s3_paths}")
-    success_status: Dict[str, None | str | Dict[str, str]] = {"success_ingest": None, "failure_ingest": None}
-    try:
-      if isinstance(s3_paths, str):
-        s3_paths = [s3_paths]
-
-      for s3_path in s3_paths:
-        file_extension = Path(s3_path).suffix
-        with NamedTemporaryFile(suffix=file_extension) as tmpfile:
-          self.s3_client.download_fileobj(Bucket=os.environ['S3_BUCKET_NAME'], Key=s3_path, Fileobj=tmpfile)
-          mime_type = str(mimetypes.guess_type(tmpfile.name, strict=False)[0])
-          mime_category = mime_type.split('/')[0] if '/' in mime_type else mime_type
-
-        if file_extension in file_ingest_methods:
-          # Use specialized functions when possible, fallback to mimetype. Else raise error.
-          ingest_method = file_ingest_methods[file_extension]
-          _ingest_single(ingest_method, s3_path, course_name, **kwargs)
-        elif mime_category in mimetype_ingest_methods:
-          # fallback to MimeType
-          print("mime category", mime_category)
-          ingest_method = mimetype_ingest_methods[mime_category]
-          _ingest_single(ingest_method, s3_path, course_name, **kwargs)
-        else:
-          # No supported ingest... Fallback to attempting utf-8 decoding, otherwise fail.
-          try:
-            self._ingest_single_txt(s3_path, course_name, **kwargs)
-            success_status['success_ingest'] = s3_path
-            print(f"No ingest methods -- Falling back to UTF-8 INGEST... s3_path = {s3_path}")
-          except Exception as e:
-            sentry_sdk.capture_exception(e)
-            print(
-                f"We don't have a ingest method for this filetype: {file_extension}. As a last-ditch effort, we tried to ingest the file as utf-8 text, but that failed too. File is unsupported: {s3_path}. UTF-8 ingest error: {e}"
-            )
-            success_status['failure_ingest'] = {
-                's3_path':
-                    s3_path,
-                'error':
-                    f"We don't have a ingest method for this filetype: {file_extension} (with generic type {mime_type}), for file: {s3_path}"
-            }
-            self.posthog.capture(
-                'distinct_id_of_the_user',
-                event='ingest_failure',
-                properties={
-                    'course_name':
-                        course_name,
-                    's3_path':
-                        s3_paths,
-                    'kwargs':
-                        kwargs,
-                    'error':
-                        f"We don't have a ingest method for this filetype: {file_extension} (with generic type {mime_type}), for file: {s3_path}"
-                })
-
-      return success_status
-    except Exception as e:
-      err = f"❌❌ Error in /ingest: `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
-      )  # type: ignore
-      sentry_sdk.capture_exception(e)
+    # 👆👆👆👆 ADD NEW INGEST METHODhe 👆👆👆👆🎉
 
-      success_status['failure_ingest'] = {'s3_path': s3_path, 'error': f"MAJOR ERROR DURING INGEST: {err}"}
-      self.posthog.capture('distinct_id_of_the_user',
-                           event='ingest_failure',
-                           properties={
-                               'course_name': course_name,
-                               's3_path': s3_paths,
-                               'kwargs': kwargs,
-                               'error': err
-                           })
+    def _ingest_file(s3_path: str) -> Dict[str, str]:
+      """Download, detect the type of, and ingest one file. Runs on a worker thread. Returns its result entry."""
+      file_extension = Path(s3_path).suffix
+      try:
+        # Download ONCE. The same local file is shared by type detection and the ingest method.
+        with S3File(self.s3_client, s3_path) as s3_file:
+          mime_type = s3_file.mime_type
+          mime_category = s3_file.mime_category
+
+          # Duplicate uploads short-circuit here, before any parsing or embedding.
+          if self.find_duplicate(course_name, s3_path, kwargs.get('url', ''), s3_file.sha256):
+            return {'status': 'success'}
+
+          # Retry of a file that was already parsed (and OCR'd/transcribed): start from its extracted text.
+          parsed = IngestCheckpoint(course_name, s3_path, kwargs.get('url', ''), s3_file.sha256).load_parsed()
+          if parsed is not None:
+            print(f"Resuming {s3_path} from its parsed text checkpoint")
+            texts, metadatas = parsed
+            self.split_and_upload(texts=texts, metadatas=metadatas, content_hash=s3_file.sha256, **kwargs)
+            return {'status': 'success'}
+
+          if file_extension in file_ingest_methods:
+            # Use specialized functions when possible, fallback to mimetype. Else raise error.
+            ingest_method = file_ingest_methods[file_extension]
+          elif mime_category in mimetype_ingest_methods:
+            # fallback to MimeType
+            print("mime category", mime_category)
+            ingest_method = mimetype_ingest_methods[mime_category]
+          else:
+            # No supported ingest... Fallback to attempting utf-8 decoding, otherwise fail.
+            try:
+              print(f"No ingest methods -- Falling back to UTF-8 INGEST... s3_path = {s3_path}")
+              self._ingest_single_txt(s3_path, course_name, s3_file=s3_file, content_hash=s3_file.sha256, **kwargs)
+              return {'status': 'success'}
+            except Exception as e:
+              sentry_sdk.capture_exception(e)
+              print(
+                  f"We don't have a ingest method for this filetype: {file_extension}. As a last-ditch effort, we tried to ingest the file as utf-8 text, but that failed too. File is unsupported: {s3_path}. UTF-8 ingest error: {e}"
+              )
+              error = f"We don't have a ingest method for this filetype: {file_extension} (with generic type {mime_type}), for file: {s3_path}"
+              self.posthog.capture('distinct_id_of_the_user',
+                                   event='ingest_failure',
+                                   properties={
+                                       'course_name': course_name,
+                                       's3_path': s3_paths,
+                                       'kwargs': kwargs,
+                                       'error': error
+                                   })
+              return {'status': 'failure', 'error': error}
+
+          # RUN INGEST METHOD
+          ret = ingest_method(s3_path, course_name, s3_file=s3_file, content_hash=s3_file.sha256, **kwargs)
+          if ret == "Success":
+            return {'status': 'success'}
+          return {'status': 'failure', 'error': str(ret)}
+      except Exception as e:
+        err = f"❌❌ Error in /ingest: `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
+        )  # type: ignore
+        sentry_sdk.capture_exception(e)
+        self.posthog.capture('distinct_id_of_the_user',
+                             event='ingest_failure',
+                             properties={
+                                 'course_name': course_name,
+                                 's3_path': s3_path,
+                                 'kwargs': kwargs,
+                                 'error': err
+                             })
+        print(f"MAJOR ERROR IN /bulk_ingest: {str(e)}")
+        return {'status': 'failure', 'error': f"MAJOR ERROR DURING INGEST: {err}"}
 
-      sentry_sdk.capture_exception(e)
-      print(f"MAJOR ERROR IN /bulk_ingest: {str(e)}")
-      return success_status
+    print(f"Top of ingest, Course_name {course_name}. S3 paths {s3_paths}")
+    single_file = isinstance(s3_paths, str)
+    if isinstance(s3_paths, str):
+      s3_paths = [s3_paths]
+
+    # Threads, because per file the work is mostly waiting on S3, OpenAI, Qdrant and Supabase.
+    # CPU-heavy parsing (PDF pages) runs on the process pool shared by all files, see pdf_extraction.
+    results: Dict[str, Dict[str, str]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(self.bulk_ingest_max_workers, len(s3_paths)))) as executor:
+      futures = {executor.submit(_ingest_file, s3_path): s3_path for s3_path in s3_paths}
+      for future in as_completed(futures):
+        results[futures[future]] = future.result()
+    results = {s3_path: results[s3_path] for s3_path in s3_paths}  # input order
+
+    successes = [s3_path for s3_path, result in results.items() if result['status'] == 'success']
+    failures = [{
+        's3_path': s3_path,
+        'error': result['error']
+    } for s3_path, result in results.items() if result['status'] == 'failure']
+    print(f"Bulk ingest finished: {len(successes)} succeeded, {len(failures)} failed")
+    if single_file:
+      return {
+          "success_ingest": successes[0] if successes else None,
+          "failure_ingest": failures[0] if failures else None,
+          "results": results,
+      }
+    return {"success_ingest": successes or None, "failure_ingest": failures or None, "results": results}
 
   def ingest_single_web_text(self, course_name: str, base_url: str, url: str, content: str, readable_filename: str,
                              **kwargs):
@@ -495,6 +577,11 @@ class Ingest():
                          })
     success_or_failure: Dict[str, None | str | Dict[str, str]] = {"success_ingest": None, "failure_ingest": None}
     try:
+      content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+      if self.find_duplicate(course_name, '', url, content_hash):
+        success_or_failure['success_ingest'] = url
+        return success_or_failure
+
       # if not, ingest the text
       text = [content]
       metadatas: List[Dict[str, Any]] = [{
@@ -506,7 +593,7 @@ class Ingest():
           'url': url,
           'base_url': base_url,
       }]
-      self.split_and_upload(texts=text, metadatas=metadatas, **kwargs)
+      self.split_and_upload(texts=text, metadatas=metadatas, content_hash=content_hash, **kwargs)
       self.posthog.capture('distinct_id_of_the_user',
                            event='ingest_single_web_text_succeeded',
                            properties={
@@ -525,16 +612,11 @@ class Ingest():
       success_or_failure['failure_ingest'] = {'url': url, 'error': str(err)}
       return success_or_failure
 
-  def _ingest_single_py(self, s3_path: str, course_name: str, **kwargs):
+  def _ingest_single_py(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs):
     try:
-      file_name = s3_path.split("/")[-1]
-      os.makedirs("../media", exist_ok=True)
-      file_path = "../media/" + file_name  # download from s3 to local folder for ingest
-
-      self.s3_client.download_file(os.getenv('S3_BUCKET_NAME'), s3_path, file_path)
-
-      loader = PythonLoader(file_path)
-      documents = loader.load()
+      with self._open_s3_file(s3_path, s3_file) as py_file:
+        loader = PythonLoader(py_file.name)
+        documents = loader.load()
 
       texts = [doc.page_content for doc in documents]
 
@@ -549,7 +631,6 @@ class Ingest():
           'base_url': kwargs.get('base_url', ''),
       } for doc in documents]
       #print(texts)
-      os.remove(file_path)
 
       success_or_failure = self.split_and_upload(texts=texts, metadatas=metadatas, **kwargs)
       print("Python ingest: ", success_or_failure)
@@ -562,31 +643,39 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return err
 
-  def _ingest_single_vtt(self, s3_path: str, course_name: str, **kwargs):
+  def _ingest_transcript(self, s3_path: str, course_name: str, cues: List[Dict], **kwargs) -> str:
+    """
+    Shared by video/audio, .srt and .vtt ingest. Cues (`text`, `start`, `end` in seconds) are packed into short
+    time-aligned chunks. Each chunk's `timestamp` is where it starts in the media (seconds), `timestamp_end` where it ends.
+    """
+    chunks = chunk_cues(cues)
+    texts = [chunk['text'] for chunk in chunks]
+    metadatas: List[Dict[str, Any]] = [{
+        'course_name': course_name,
+        's3_path': s3_path,
+        'readable_filename': kwargs.get('readable_filename',
+                                        Path(s3_path).name[37:]),
+        'pagenumber': '',
+        'timestamp': int(chunk['start']),
+        'timestamp_end': int(math.ceil(chunk['end'])),
+        'url': kwargs.get('url', ''),
+        'base_url': kwargs.get('base_url', ''),
+    } for chunk in chunks]
+    print(f"Transcript of {s3_path}: {len(cues)} cues packed into {len(chunks)} time-aligned chunks")
+    return self.split_and_upload(texts=texts, metadatas=metadatas, **kwargs)
+
+  def _ingest_single_vtt(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs):
     """
     Ingest a single .vtt file from S3.
     """
     try:
-      with NamedTemporaryFile() as tmpfile:
-        # download from S3 into vtt_tmpfile
-        self.s3_client.download_fileobj(Bucket=os.environ['S3_BUCKET_NAME'], Key=s3_path, Fileobj=tmpfile)
-        loader = TextLoader(tmpfile.name)
-        documents = loader.load()
-        texts = [doc.page_content for doc in documents]
+      with self._open_s3_file(s3_path, s3_file) as vtt_file:
+        raw_text = vtt_file.read_text()
 
-        metadatas: List[Dict[str, Any]] = [{
-            'course_name': course_name,
-            's3_path': s3_path,
-            'readable_filename': kwargs.get('readable_filename',
-                                            Path(s3_path).name[37:]),
-            'pagenumber': '',
-            'timestamp': '',
-            'url': kwargs.get('url', ''),
-            'base_url': kwargs.get('base_url', ''),
-        } for doc in documents]
-
-        success_or_failure = self.split_and_upload(texts=texts, metadatas=metadatas, **kwargs)
-        return success_or_failure
+      cues = parse_subtitle_cues(raw_text)
+      if not cues:
+        return "Error: VTT file has no cues. Skipping."
+      return self._ingest_transcript(s3_path, course_name, cues, **kwargs)
     except Exception as e:
       err = f"❌❌ Error in (VTT ingest): `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
       )
@@ -594,11 +683,11 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return err
 
-  def _ingest_html(self, s3_path: str, course_name: str, **kwargs) -> str:
+  def _ingest_html(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs) -> str:
     print(f"IN _ingest_html s3_path `{s3_path}` kwargs: {kwargs}")
     try:
-      response = self.s3_client.get_object(Bucket=os.environ['S3_BUCKET_NAME'], Key=s3_path)
-      raw_html = response['Body'].read().decode('utf-8', errors='ignore')
+      with self._open_s3_file(s3_path, s3_file) as html_file:
+        raw_html = html_file.read_text()
 
       soup = BeautifulSoup(raw_html, 'html.parser')
       title = s3_path.replace("courses/" + course_name, "")
@@ -628,106 +717,21 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return err
 
-  def _ingest_single_video(self, s3_path: str, course_name: str, **kwargs) -> str:
+  def _ingest_single_video(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs) -> str:
     """
-    Ingest a single video file from S3.
+    Ingest a single video or audio file from S3, as time-aligned transcript chunks.
     """
     print("Starting ingest video or audio")
     try:
-      # Ensure the media directory exists
-      media_dir = "media"
-      if not os.path.exists(media_dir):
-        os.makedirs(media_dir)
-
-      # check for file extension
-      file_ext = Path(s3_path).suffix
       openai.api_key = os.getenv('VLADS_OPENAI_KEY')
-      transcript_list = []
-      with NamedTemporaryFile(suffix=file_ext) as video_tmpfile:
-        # download from S3 into an video tmpfile
-        self.s3_client.download_fileobj(Bucket=os.environ['S3_BUCKET_NAME'], Key=s3_path, Fileobj=video_tmpfile)
-
-        # try with original file first
-        try:
-          mp4_version = AudioSegment.from_file(video_tmpfile.name, file_ext[1:])
-        except Exception as e:
-          print("Applying moov atom fix and retrying...")
-          # Fix the moov atom issue using FFmpeg
-          fixed_video_tmpfile = NamedTemporaryFile(suffix=file_ext, delete=False)
-          try:
-            result = subprocess.run([
-                'ffmpeg', '-y', '-i', video_tmpfile.name, '-c', 'copy', '-movflags', 'faststart',
-                fixed_video_tmpfile.name
-            ],
-                                    check=True,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE)
-            #print(result.stdout.decode())
-            #print(result.stderr.decode())
-          except subprocess.CalledProcessError as e:
-            #print(e.stdout.decode())
-            #print(e.stderr.decode())
-            print("Error in FFmpeg command: ", e)
-            raise e
-
-          # extract audio from video tmpfile
-          mp4_version = AudioSegment.from_file(fixed_video_tmpfile.name, file_ext[1:])
-
-      # save the extracted audio as a temporary webm file
-      with NamedTemporaryFile(suffix=".webm", dir=media_dir, delete=False) as webm_tmpfile:
-        mp4_version.export(webm_tmpfile, format="webm")
-
-      # check file size
-      file_size = os.path.getsize(webm_tmpfile.name)
-      # split the audio into 25MB chunks
-      if file_size > 26214400:
-        # load the webm file into audio object
-        full_audio = AudioSegment.from_file(webm_tmpfile.name, "webm")
-        file_count = file_size // 26214400 + 1
-        split_segment = 35 * 60 * 1000
-        start = 0
-        count = 0
-
-        while count < file_count:
-          with NamedTemporaryFile(suffix=".webm", dir=media_dir, delete=False) as split_tmp:
-            if count == file_count - 1:
-              # last segment
-              audio_chunk = full_audio[start:]
-            else:
-              audio_chunk = full_audio[start:split_segment]
-
-            audio_chunk.export(split_tmp.name, format="webm")
-
-            # transcribe the split file and store the text in dictionary
-            with open(split_tmp.name, "rb") as f:
-              transcript = openai.Audio.transcribe("whisper-1", f)
-            transcript_list.append(transcript['text'])  # type: ignore
-          start += split_segment
-          split_segment += split_segment
-          count += 1
-          os.remove(split_tmp.name)
-      else:
-        # transcribe the full audio
-        with open(webm_tmpfile.name, "rb") as f:
-          transcript = openai.Audio.transcribe("whisper-1", f)
-        transcript_list.append(transcript['text'])  # type: ignore
-
-      os.remove(webm_tmpfile.name)
-
-      text = [txt for txt in transcript_list]
-      metadatas: List[Dict[str, Any]] = [{
-          'course_name': course_name,
-          's3_path': s3_path,
-          'readable_filename': kwargs.get('readable_filename',
-                                          Path(s3_path).name[37:]),
-          'pagenumber': '',
-          'timestamp': text.index(txt),
-          'url': kwargs.get('url', ''),
-          'base_url': kwargs.get('base_url', ''),
-      } for txt in text]
-
-      self.split_and_upload(texts=text, metadatas=metadatas, **kwargs)
-      return "Success"
+      # ffmpeg streams the audio into small segments on disk, they are transcribed concurrently.
+      with self._open_s3_file(s3_path, s3_file) as video_tmpfile, TemporaryDirectory() as segments_dir:
+        transcript_segments = transcribe_media(video_tmpfile.name, segments_dir)
+
+      cues = [piece for segment in transcript_segments for piece in segment['pieces']]
+      if not cues:
+        return f"No speech found in {s3_path}"
+      return self._ingest_transcript(s3_path, course_name, cues, **kwargs)
     except Exception as e:
       err = f"❌❌ Error in (VIDEO ingest): `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
       )
@@ -735,11 +739,9 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return str(err)
 
-  def _ingest_single_docx(self, s3_path: str, course_name: str, **kwargs) -> str:
+  def _ingest_single_docx(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs) -> str:
     try:
-      with NamedTemporaryFile() as tmpfile:
-        self.s3_client.download_fileobj(Bucket=os.getenv('S3_BUCKET_NAME'), Key=s3_path, Fileobj=tmpfile)
-
+      with self._open_s3_file(s3_path, s3_file) as tmpfile:
         loader = Docx2txtLoader(tmpfile.name)
         documents = loader.load()
 
@@ -764,35 +766,15 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return str(err)
 
-  def _ingest_single_srt(self, s3_path: str, course_name: str, **kwargs) -> str:
+  def _ingest_single_srt(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs) -> str:
     try:
-      import pysrt
-
-      # NOTE: slightly different method for .txt files, no need for download. It's part of the 'body'
-      response = self.s3_client.get_object(Bucket=os.environ['S3_BUCKET_NAME'], Key=s3_path)
-      raw_text = response['Body'].read().decode('utf-8', errors='ignore')
+      with self._open_s3_file(s3_path, s3_file) as srt_file:
+        raw_text = srt_file.read_text()
 
-      print("UTF-8 text to ingest as SRT:", raw_text)
-      parsed_info = pysrt.from_string(raw_text)
-      text = " ".join([t.text for t in parsed_info])  # type: ignore
-      print(f"Final SRT ingest: {text}")
-
-      texts = [text]
-      metadatas: List[Dict[str, Any]] = [{
-          'course_name': course_name,
-          's3_path': s3_path,
-          'readable_filename': kwargs.get('readable_filename',
-                                          Path(s3_path).name[37:]),
-          'pagenumber': '',
-          'timestamp': '',
-          'url': kwargs.get('url', ''),
-          'base_url': kwargs.get('base_url', ''),
-      }]
-      if len(text) == 0:
+      cues = parse_subtitle_cues(raw_text)
+      if not cues:
         return "Error: SRT file appears empty. Skipping."
-
-      self.split_and_upload(texts=texts, metadatas=metadatas, **kwargs)
-      return "Success"
+      return self._ingest_transcript(s3_path, course_name, cues, **kwargs)
     except Exception as e:
       err = f"❌❌ Error in (SRT ingest): `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
       )
@@ -800,17 +782,18 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return str(err)
 
-  def _ingest_single_excel(self, s3_path: str, course_name: str, **kwargs) -> str:
+  def _ingest_single_excel(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs) -> str:
     try:
-      with NamedTemporaryFile() as tmpfile:
-        # download from S3 into pdf_tmpfile
-        self.s3_client.download_fileobj(Bucket=os.getenv('S3_BUCKET_NAME'), Key=s3_path, Fileobj=tmpfile)
-
-        loader = UnstructuredExcelLoader(tmpfile.name, mode="elements")
-        # loader = SRTLoader(tmpfile.name)
-        documents = loader.load()
-
-        texts = [doc.page_content for doc in documents]
+      with self._open_s3_file(s3_path, s3_file) as tmpfile:
+        if Path(s3_path).suffix.lower() in OPENPYXL_SUFFIXES:
+          texts = excel_row_blocks(tmpfile.name)
+        else:
+          # Legacy formats (.xls, .xlsb, ...) that openpyxl can't stream. The splitter merges the small elements.
+          loader = UnstructuredExcelLoader(tmpfile.name, mode="elements")
+          texts = [doc.page_content for doc in loader.load()]
+        if not texts:
+          print(f"Empty spreadsheet: {s3_path}")
+          return "Failed ingest: Could not detect ANY content in the spreadsheet. It appears to be empty."
         metadatas: List[Dict[str, Any]] = [{
             'course_name': course_name,
             's3_path': s3_path,
@@ -820,7 +803,7 @@ class Ingest():
             'timestamp': '',
             'url': kwargs.get('url', ''),
             'base_url': kwargs.get('base_url', ''),
-        } for doc in documents]
+        } for _ in texts]
 
         self.split_and_upload(texts=texts, metadatas=metadatas, **kwargs)
         return "Success"
@@ -831,11 +814,9 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return str(err)
 
-  def _ingest_single_image(self, s3_path: str, course_name: str, **kwargs) -> str:
+  def _ingest_single_image(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs) -> str:
     try:
-      with NamedTemporaryFile() as tmpfile:
-        # download from S3 into pdf_tmpfile
-        self.s3_client.download_fileobj(Bucket=os.getenv('S3_BUCKET_NAME'), Key=s3_path, Fileobj=tmpfile)
+      with self._open_s3_file(s3_path, s3_file) as tmpfile:
         """
         # Unstructured image loader makes the install too large (700MB --> 6GB. 3min -> 12 min build times). AND nobody uses it.
         # The "hi_res" strategy will identify the layout of the document using detectron2. "ocr_only" uses pdfminer.six. https://unstructured-io.github.io/unstructured/core/partition.html#partition-image
@@ -868,16 +849,13 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return str(err)
 
-  def _ingest_single_csv(self, s3_path: str, course_name: str, **kwargs) -> str:
+  def _ingest_single_csv(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs) -> str:
     try:
-      with NamedTemporaryFile() as tmpfile:
-        # download from S3 into pdf_tmpfile
-        self.s3_client.download_fileobj(Bucket=os.getenv('S3_BUCKET_NAME'), Key=s3_path, Fileobj=tmpfile)
-
-        loader = CSVLoader(file_path=tmpfile.name)
-        documents = loader.load()
-
-        texts = [doc.page_content for doc in documents]
+      with self._open_s3_file(s3_path, s3_file) as tmpfile:
+        texts = csv_row_blocks(tmpfile.name)
+        if not texts:
+          print(f"Empty CSV file: {s3_path}")
+          return "Failed ingest: Could not detect ANY content in the CSV. It appears to be empty."
         metadatas: List[Dict[str, Any]] = [{
             'course_name': course_name,
             's3_path': s3_path,
@@ -887,7 +865,7 @@ class Ingest():
             'timestamp': '',
             'url': kwargs.get('url', ''),
             'base_url': kwargs.get('base_url', ''),
-        } for doc in documents]
+        } for _ in texts]
 
         self.split_and_upload(texts=texts, metadatas=metadatas, **kwargs)
         return "Success"
@@ -898,148 +876,98 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return str(err)
 
-  def _ingest_single_pdf(self, s3_path: str, course_name: str, **kwargs):
+  def _ingest_single_pdf(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs):
     """
-    Both OCR the PDF. And grab the first image as a PNG.
+    Extract the text of every page (in parallel), OCR-ing only the pages that need it. And grab the first image as a PNG.
       LangChain `Documents` have .metadata and .page_content attributes.
     Be sure to use TemporaryFile() to avoid memory leaks!
     """
     print("IN PDF ingest: s3_path: ", s3_path, "and kwargs:", kwargs)
 
     try:
-      with NamedTemporaryFile() as pdf_tmpfile:
-        # download from S3 into pdf_tmpfile
-        self.s3_client.download_fileobj(Bucket=os.getenv('S3_BUCKET_NAME'), Key=s3_path, Fileobj=pdf_tmpfile)
-        ### READ OCR of PDF
+      with self._open_s3_file(s3_path, s3_file) as pdf_tmpfile:
         try:
           doc = fitz.open(pdf_tmpfile.name)  # type: ignore
         except fitz.fitz.EmptyFileError as e:
           print(f"Empty PDF file: {s3_path}")
           return "Failed ingest: Could not detect ANY text in the PDF. OCR did not help. PDF appears empty of text."
 
-        # improve quality of the image
-        zoom_x = 2.0  # horizontal zoom
-        zoom_y = 2.0  # vertical zoom
-        mat = fitz.Matrix(zoom_x, zoom_y)  # zoom factor 2 in each dimension
-
-        pdf_pages_no_OCR: List[Dict] = []
-        for i, page in enumerate(doc):  # type: ignore
-
-          # UPLOAD FIRST PAGE IMAGE to S3
-          if i == 0:
-            with NamedTemporaryFile(suffix=".png") as first_page_png:
-              pix = page.get_pixmap(matrix=mat)
-              pix.save(first_page_png)  # store image as a PNG
-
-              s3_upload_path = str(Path(s3_path)).rsplit('.pdf')[0] + "-pg1-thumb.png"
-              first_page_png.seek(0)  # Seek the file pointer back to the beginning
-              with open(first_page_png.name, 'rb') as f:
-                print("Uploading image png to S3")
-                self.s3_client.upload_fileobj(f, os.getenv('S3_BUCKET_NAME'), s3_upload_path)
-
-          # Extract text
-          text = page.get_text().encode("utf8").decode("utf8", errors='ignore')  # get plain text (is in UTF-8)
-          pdf_pages_no_OCR.append(dict(text=text, page_number=i, readable_filename=Path(s3_path).name[37:]))
-
-        metadatas: List[Dict[str, Any]] = [
-            {
-                'course_name': course_name,
-                's3_path': s3_path,
-                'pagenumber': page['page_number'] + 1,  # +1 for human indexing
-                'timestamp': '',
-                'readable_filename': kwargs.get('readable_filename', page['readable_filename']),
-                'url': kwargs.get('url', ''),
-                'base_url': kwargs.get('base_url', ''),
-            } for page in pdf_pages_no_OCR
-        ]
-        pdf_texts = [page['text'] for page in pdf_pages_no_OCR]
-
-        # count the total number of words in the pdf_texts. If it's less than 100, we'll OCR the PDF
-        has_words = any(text.strip() for text in pdf_texts)
-        if has_words:
-          success_or_failure = self.split_and_upload(texts=pdf_texts, metadatas=metadatas, **kwargs)
-        else:
-          print("⚠️ PDF IS EMPTY -- OCR-ing the PDF.")
-          success_or_failure = self._ocr_pdf(s3_path=s3_path, course_name=course_name, **kwargs)
-
-        return success_or_failure
-    except Exception as e:
-      err = f"❌❌ Error in PDF ingest (no OCR): `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
-      )  # type: ignore
-      print(err)
-      sentry_sdk.capture_exception(e)
-      return err
-    return "Success"
-
-  def _ocr_pdf(self, s3_path: str, course_name: str, **kwargs):
-    self.posthog.capture('distinct_id_of_the_user',
-                         event='ocr_pdf_invoked',
-                         properties={
-                             'course_name': course_name,
-                             's3_path': s3_path,
-                         })
-
-    pdf_pages_OCRed: List[Dict] = []
-    try:
-      with NamedTemporaryFile() as pdf_tmpfile:
-        # download from S3 into pdf_tmpfile
-        self.s3_client.download_fileobj(Bucket=os.getenv('S3_BUCKET_NAME'), Key=s3_path, Fileobj=pdf_tmpfile)
-
-        with pdfplumber.open(pdf_tmpfile.name) as pdf:
-          # for page in :
-          for i, page in enumerate(pdf.pages):
-            im = page.to_image()
-            text = pytesseract.image_to_string(im.original)
-            print("Page number: ", i, "Text: ", text[:100])
-            pdf_pages_OCRed.append(dict(text=text, page_number=i, readable_filename=Path(s3_path).name[37:]))
+        # UPLOAD FIRST PAGE IMAGE to S3
+        if doc.page_count > 0:
+          # improve quality of the image
+          zoom_x = 2.0  # horizontal zoom
+          zoom_y = 2.0  # vertical zoom
+          mat = fitz.Matrix(zoom_x, zoom_y)  # zoom factor 2 in each dimension
+          with NamedTemporaryFile(suffix=".png") as first_page_png:
+            pix = doc[0].get_pixmap(matrix=mat)
+            pix.save(first_page_png)  # store image as a PNG
+
+            s3_upload_path = str(Path(s3_path)).rsplit('.pdf')[0] + "-pg1-thumb.png"
+            first_page_png.seek(0)  # Seek the file pointer back to the beginning
+            with open(first_page_png.name, 'rb') as f:
+              print("Uploading image png to S3")
+              self.s3_client.upload_fileobj(f, os.getenv('S3_BUCKET_NAME'), s3_upload_path)
+        doc.close()
+
+        ### Extract text, page-parallel. Only pages with a sparse or missing text layer are OCR'd (cached by page hash).
+        extraction_start_time = time.monotonic()
+        pdf_pages = extract_pdf_pages(pdf_tmpfile.name)
+        num_ocr_pages = sum(1 for page in pdf_pages if page['ocr'])
+        print(
+            f"⏰ PDF text extraction runtime: {(time.monotonic() - extraction_start_time):.2f} seconds. {len(pdf_pages)} pages, {num_ocr_pages} OCR'd."
+        )
+
+      if num_ocr_pages > 0:
+        self.posthog.capture('distinct_id_of_the_user',
+                             event='ocr_pdf_succeeded',
+                             properties={
+                                 'course_name': course_name,
+                                 's3_path': s3_path,
+                                 'num_pages': len(pdf_pages),
+                                 'num_ocr_pages': num_ocr_pages,
+                             })
 
+      readable_filename = kwargs.get('readable_filename', Path(s3_path).name[37:])
       metadatas: List[Dict[str, Any]] = [
           {
               'course_name': course_name,
               's3_path': s3_path,
               'pagenumber': page['page_number'] + 1,  # +1 for human indexing
               'timestamp': '',
-              'readable_filename': kwargs.get('readable_filename', page['readable_filename']),
+              'readable_filename': readable_filename,
               'url': kwargs.get('url', ''),
               'base_url': kwargs.get('base_url', ''),
-          } for page in pdf_pages_OCRed
+          } for page in pdf_pages
       ]
-      pdf_texts = [page['text'] for page in pdf_pages_OCRed]
-      self.posthog.capture('distinct_id_of_the_user',
-                           event='ocr_pdf_succeeded',
-                           properties={
-                               'course_name': course_name,
-                               's3_path': s3_path,
-                           })
+      pdf_texts = [page['text'] for page in pdf_pages]
 
       has_words = any(text.strip() for text in pdf_texts)
       if not has_words:
-        raise ValueError(
-            "Failed ingest: Could not detect ANY text in the PDF. OCR did not help. PDF appears empty of text.")
+        return "Failed ingest: Could not detect ANY text in the PDF. OCR did not help. PDF appears empty of text."
 
       success_or_failure = self.split_and_upload(texts=pdf_texts, metadatas=metadatas, **kwargs)
       return success_or_failure
     except Exception as e:
-      err = f"❌❌ Error in PDF ingest (with OCR): `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
-      )
+      err = f"❌❌ Error in PDF ingest: `{inspect.currentframe().f_code.co_name}`: {e}\nTraceback:\n", traceback.format_exc(
+      )  # type: ignore
       print(err)
       sentry_sdk.capture_exception(e)
       return err
 
-  def _ingest_single_txt(self, s3_path: str, course_name: str, **kwargs) -> str:
+  def _ingest_single_txt(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs) -> str:
     """Ingest a single .txt or .md file from S3.
     Args:
         s3_path (str): A path to a .txt file in S3
         course_name (str): The name of the course
+        s3_file (S3File, optional): The already-downloaded file, if `bulk_ingest` fetched it.
     Returns:
         str: "Success" or an error message
     """
     print("In text ingest, UTF-8")
     print("kwargs", kwargs)
     try:
-      # NOTE: slightly different method for .txt files, no need for download. It's part of the 'body'
-      response = self.s3_client.get_object(Bucket=os.environ['S3_BUCKET_NAME'], Key=s3_path)
-      text = response['Body'].read().decode('utf-8', errors='ignore')
+      with self._open_s3_file(s3_path, s3_file) as txt_file:
+        text = txt_file.read_text()
       print("UTF-8 text to ignest (from s3)", text)
       text = [text]
 
@@ -1064,16 +992,12 @@ class Ingest():
       sentry_sdk.capture_exception(e)
       return str(err)
 
-  def _ingest_single_ppt(self, s3_path: str, course_name: str, **kwargs) -> str:
+  def _ingest_single_ppt(self, s3_path: str, course_name: str, s3_file: Optional['S3File'] = None, **kwargs) -> str:
     """
     Ingest a single .ppt or .pptx file from S3.
     """
     try:
-      with NamedTemporaryFile() as tmpfile:
-        # download from S3 into pdf_tmpfile
-        #print("in ingest PPTX")
-        self.s3_client.download_fileobj(Bucket=os.environ['S3_BUCKET_NAME'], Key=s3_path, Fileobj=tmpfile)
-
+      with self._open_s3_file(s3_path, s3_file) as tmpfile:
         loader = UnstructuredPowerPointLoader(tmpfile.name)
         documents = loader.load()
 
@@ -1167,25 +1091,25 @@ class Ingest():
         metadatas
     ), f'must have equal number of text strings and metadata dicts. len(texts) is {len(texts)}. len(metadatas) is {len(metadatas)}'
 
+    # Hash of the raw file bytes when we have them (bulk_ingest), else of the extracted text.
+    content_hash = kwargs.get('content_hash') or hashlib.sha256('\n'.join(texts).encode('utf-8')).hexdigest()
+    checkpoint = IngestCheckpoint(metadatas[0]['course_name'], metadatas[0].get('s3_path'), metadatas[0].get('url'),
+                                  content_hash)
     try:
       chunk_size = 2_000
       if metadatas[0].get('course_name') == 'GROWMARK-Crop-Protection-Guide':
         # Special case for this project, try to embed entire PDF page as 1 chunk (better at tables)
         chunk_size = 6_000
 
-      text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-          chunk_size=chunk_size,
-          chunk_overlap=150,
-          separators=[
-              "\n\n", "\n", ". ", " ", ""
-          ]  # try to split on paragraphs... fallback to sentences, then chars, ensure we always fit in context window
-      )
+      # splits on paragraphs... fallback to lines, sentences, then words, ensure we always fit in context window
+      text_splitter = get_text_splitter(chunk_size=chunk_size, chunk_overlap=150)
       contexts: List[Document] = text_splitter.create_documents(texts=texts, metadatas=metadatas)
       input_texts = [{'input': context.page_content, 'model': 'text-embedding-ada-002'} for context in contexts]
 
       # check for duplicates
-      is_duplicate = self.check_for_duplicates(input_texts, metadatas)
-      if is_duplicate:
+      previous_doc = self.find_previous_version(metadatas)
+      if previous_doc is not None and self.is_same_contents(previous_doc, input_texts, content_hash):
+        checkpoint.clear()
         self.posthog.capture('distinct_id_of_the_user',
                              event='split_and_upload_succeeded',
                              properties={
@@ -1203,64 +1127,146 @@ class Ingest():
       for i, context in enumerate(contexts):
         context.metadata['chunk_index'] = i
         context.metadata['doc_groups'] = kwargs.get('groups', [])
+        context.metadata['chunk_hash'] = hashlib.sha256(context.page_content.encode('utf-8')).hexdigest()
+      chunk_hashes = [context.metadata['chunk_hash'] for context in contexts]
+
+      # !DONE: Updated the payload so each key is top level (no more payload.metadata.course_name. Instead, use payload.course_name), great for creating indexes.
+      payloads = [{**context.metadata, "page_content": context.page_content} for context in contexts]
+
+      # A retry after a later failure: reuse the embeddings, and the points, that an earlier attempt already made.
+      checkpointed_embeddings = checkpoint.load_embeddings(chunk_hashes)
+      checkpointed_point_ids = checkpoint.load_upserted(chunk_hashes) if checkpointed_embeddings is not None else None
+
+      # Updated file (same filename, new contents): reuse the embeddings and point IDs of unchanged chunks.
+      reused_points: Dict[int, Any] = {}
+      stale_point_ids: List[Any] = []
+      if checkpointed_point_ids is not None:
+        print(f"Resuming from checkpoint: all {len(contexts)} chunks are already in Qdrant")
+        reused_points = {
+            i: models.Record(id=point_id, payload=payloads[i]) for i, point_id in enumerate(checkpointed_point_ids)
+        }
+      elif previous_doc is not None:
+        print(f"Updated file detected! Same filename, new contents. Previous document id: {previous_doc['id']}")
+        previous_points = self._get_previous_points(metadatas[0]['course_name'], previous_doc)
+        for i, context in enumerate(contexts):
+          if previous_points.get(context.metadata['chunk_hash']):
+            reused_points[i] = previous_points[context.metadata['chunk_hash']].pop()
+        stale_point_ids = [point.id for points in previous_points.values() for point in points]
+        print(f"Incremental re-ingest: {len(reused_points)} unchanged chunks reused, "
+              f"{len(contexts) - len(reused_points)} to embed, {len(stale_point_ids)} stale chunks to delete.")
 
       openai_embeddings_key = os.getenv('VLADS_OPENAI_KEY')
       if metadatas[0].get('course_name') == 'cropwizard-1.5':
         print("Using Cropwizard OpenAI key")
         openai_embeddings_key = os.getenv('CROPWIZARD_OPENAI_KEY')
 
-      print("Starting to call embeddings API")
-      embeddings_start_time = time.monotonic()
-      oai = OpenAIAPIProcessor(
-          input_prompts_list=input_texts,
-          request_url='https://api.openai.com/v1/embeddings',
-          api_key=openai_embeddings_key,
-          # request_url='https://uiuc-chat-canada-east.openai.azure.com/openai/deployments/text-embedding-ada-002/embeddings?api-version=2023-05-15',
-          # api_key=os.getenv('AZURE_OPENAI_KEY'),
-          max_requests_per_minute=10_000,
-          max_tokens_per_minute=10_000_000,
-          max_attempts=1_000,
-          logging_level=logging.INFO,
-          token_encoding_name='cl100k_base')
-      asyncio.run(oai.process_api_requests_from_file())
-      print(f"⏰ embeddings runtime: {(time.monotonic() - embeddings_start_time):.2f} seconds")
-      # parse results into dict of shape page_content -> embedding
-      embeddings_dict: dict[str, List[float]] = {
-          item[0]['input']: item[1]['data'][0]['embedding'] for item in oai.results
-      }
-
-      ### BULK upload to Qdrant ###
-      vectors: list[PointStruct] = []
-      for context in contexts:
-        # !DONE: Updated the payload so each key is top level (no more payload.metadata.course_name. Instead, use payload.course_name), great for creating indexes.
-        upload_metadata = {**context.metadata, "page_content": context.page_content}
-        vectors.append(
-            PointStruct(id=str(uuid.uuid4()), vector=embeddings_dict[context.page_content], payload=upload_metadata))
-
-      try:
-        # ----------------------------
-        # SPECIAL CASE FOR CROPWIZARD INGEST
-        # ----------------------------
-        if metadatas[0].get('course_name') == 'cropwizard-1.5':
-          print("Uploading to cropwizard collection...")
-          self.cropwizard_qdrant_client.upsert(
-              collection_name='cropwizard',
-              points=vectors,
-          )
-        else:
-          self.qdrant_client.upsert(
-              collection_name=os.environ['QDRANT_COLLECTION_NAME'],
-              points=vectors,
-          )
-      except Exception as e:
-        logging.error("Error in QDRANT upload: ", exc_info=True)
-        err = f"Error in QDRANT upload: {e}"
-        if "timed out" in str(e):
-          # timed out error is fine, task will continue in background
-          pass
-        else:
+      # Every embedding is a float32 row (of the checkpoint, the cache or `oai.embeddings`), never a list of floats.
+      embedding_rows: Dict[str, np.ndarray] = {}
+      if checkpointed_embeddings is not None:
+        embedding_rows.update(zip((context.page_content for context in contexts), checkpointed_embeddings))
+      else:
+        embedding_rows.update({
+            contexts[i].page_content: np.asarray(point.vector, dtype=np.float32) for i, point in reused_points.items()
+        })
+      # Global cache keyed by (model, sha256(text)): repeated content across files and projects costs no API calls.
+      embedding_rows.update(
+          self.embedding_cache.get_many(
+              'text-embedding-ada-002',
+              [context.page_content for context in contexts if context.page_content not in embedding_rows]))
+      # Fixed up front, so the upserted checkpoint can record the point of every chunk.
+      point_ids = [reused_points[i].id if i in reused_points else str(uuid.uuid4()) for i in range(len(contexts))]
+
+      ### Pipelined upload to Qdrant: points are upserted in batches as soon as their embeddings exist ###
+      qdrant_client, collection_name = self._get_qdrant_collection(metadatas[0].get('course_name'))
+      with QdrantUploader(qdrant_client, collection_name) as uploader, TemporaryDirectory() as spill_dir:
+        try:
+          # Points that need no embeddings call go first: cache hits. Unchanged chunks keep their point.
+          # Vectors only become lists inside a point, and points are released once their batch is upserted.
+          uploader.add([
+              PointStruct(id=point_ids[i], vector=embedding_rows[context.page_content].tolist(), payload=payloads[i])
+              for i, context in enumerate(contexts)
+              if i not in reused_points and context.page_content in embedding_rows
+          ])
+
+          # Embed each distinct text once. Its chunks are uploaded as soon as its batch comes back.
+          chunks_by_text: Dict[str, List[int]] = {}
+          for i, context in enumerate(contexts):
+            if i not in reused_points and context.page_content not in embedding_rows:
+              chunks_by_text.setdefault(context.page_content, []).append(i)
+          input_texts = [{'input': text, 'model': 'text-embedding-ada-002'} for text in chunks_by_text]
+
+          def upload_new_embeddings(input_indices: List[int]):
+            # Row j of oai.embeddings is input_texts[j], kept as a view of that row
+            new_embeddings = {input_texts[j]['input']: oai.embeddings[j] for j in input_indices}
+            self.embedding_cache.put_many('text-embedding-ada-002', new_embeddings)
+            embedding_rows.update(new_embeddings)
+            uploader.add([
+                PointStruct(id=point_ids[i], vector=embedding.tolist(), payload=payloads[i])
+                for text, embedding in new_embeddings.items()
+                for i in chunks_by_text[text]
+            ])
+
+          print(f"Embedding {len(input_texts)} texts ({len(embedding_rows)} reused or cached)")
+          embeddings_start_time = time.monotonic()
+          # Large documents keep their embeddings in a memmap on local disk instead of in memory.
+          spill_to_disk = len(input_texts) > int(os.getenv('EMBEDDINGS_SPILL_THRESHOLD', 20_000))
+          oai = OpenAIAPIProcessor(
+              input_prompts_list=input_texts,
+              request_url=os.getenv('OPENAI_EMBEDDINGS_URL', 'https://api.openai.com/v1/embeddings'),
+              api_key=openai_embeddings_key,
+              # request_url='https://uiuc-chat-canada-east.openai.azure.com/openai/deployments/text-embedding-ada-002/embeddings?api-version=2023-05-15',
+              # api_key=os.getenv('AZURE_OPENAI_KEY'),
+              max_requests_per_minute=10_000,
+              max_tokens_per_minute=10_000_000,
+              max_attempts=20,
+              # fail the document inside the 25 minute task timeout instead of backing off past it
+              max_retry_seconds=10 * 60,
+              logging_level=logging.INFO,
+              token_encoding_name='cl100k_base',
+              spill_to_disk_path=os.path.join(spill_dir, 'embeddings.npy') if spill_to_disk else None,
+              on_embeddings=upload_new_embeddings)
+          if input_texts:
+            asyncio.run(oai.process_api_requests_from_file())
+          print(f"⏰ embeddings runtime: {(time.monotonic() - embeddings_start_time):.2f} seconds")
+          num_failed_embeddings = len(input_texts) - int(oai.embedded.sum())
+          if num_failed_embeddings:
+            raise ValueError(f"Failed to embed {num_failed_embeddings} of {len(input_texts)} chunks")
+          # Row views in chunk order. The checkpoint and the Supabase blob are both packed straight from them,
+          # while a spilled `oai.embeddings` still exists.
+          chunk_embeddings = [embedding_rows[context.page_content] for context in contexts]
+          if input_texts:
+            checkpoint.save_embeddings(chunk_hashes, chunk_embeddings)
+          context_embeddings_b64 = encode_embeddings_b64(chunk_embeddings)
+
+          num_uploaded = uploader.flush()
+          print(f"Uploaded {num_uploaded} points to {collection_name} collection "
+                f"({len(uploader.operation_ids)} upsert operations)")
+          # Upserts were only acknowledged. Only report success once every chunk is actually in Qdrant.
+          uploader.wait_for_count(point_ids)
+          # The previous version is only changed once the new chunks are all in: kept chunks whose payload moved
+          # (e.g. chunk_index, s3_path) are overwritten, waiting for Qdrant, then its leftover chunks are deleted.
+          moved = {i: point for i, point in reused_points.items() if point.payload != payloads[i]}
+          moved_points = [
+              PointStruct(id=point.id, vector=point.vector, payload=payloads[i]) for i, point in moved.items()
+          ]
+          previous_points = [
+              PointStruct(id=point.id, vector=point.vector, payload=point.payload) for point in moved.values()
+          ]
+          uploader.replace(moved_points, previous=previous_points)
+          if stale_point_ids:
+            qdrant_client.delete(collection_name=collection_name,
+                                 points_selector=models.PointIdsList(points=stale_point_ids),
+                                 wait=True)
+          checkpoint.save_upserted(chunk_hashes, point_ids)
+        except Exception as e:
+          logging.error("Error in QDRANT upload: ", exc_info=True)
+          err = f"Error in QDRANT upload: {e}"
           print(err)
           sentry_sdk.capture_exception(e)
+          # Don't leave a half-indexed document behind: new points are removed and kept points get their previous
+          # payload back. Stale points are only deleted last, so the previous version is searchable as it was.
+          uploader.rollback()
+          checkpoint.discard('upserted')
           raise Exception(err)
 
       ### Supabase SQL ###
@@ -1268,8 +1274,9 @@ class Ingest():
           "text": context.page_content,
           "pagenumber": context.metadata.get('pagenumber'),
           "timestamp": context.metadata.get('timestamp'),
+          "timestamp_end": context.metadata.get('timestamp_end'),
           "chunk_index": context.metadata.get('chunk_index'),
-          "embedding": embeddings_dict[context.page_content]
+          "chunk_hash": context.metadata.get('chunk_hash'),
       } for context in contexts]
 
       document = {
@@ -1278,7 +1285,10 @@ class Ingest():
           "readable_filename": contexts[0].metadata.get('readable_filename'),
           "url": contexts[0].metadata.get('url'),
           "base_url": contexts[0].metadata.get('base_url'),
+          "content_hash": content_hash,
           "contexts": contexts_for_supa,
+          # One float32 blob, row i is contexts[i]. ~4x smaller than JSON floats, and readers decode it with NumPy.
+          "context_embeddings": context_embeddings_b64,
       }
 
       # Calculate the size of the document object in MB
@@ -1288,6 +1298,10 @@ class Ingest():
       response = self.supabase_client.table(
           os.getenv('REFACTORED_MATERIALS_SUPABASE_TABLE')).insert(document).execute()  # type: ignore
 
+      if previous_doc is not None:
+        # Points were already handled above, only the old row (and the old upload, if replaced) remain.
+        self._delete_previous_version(metadatas[0]['course_name'], previous_doc, document['s3_path'])
+
       # need to update Supabase tables with doc group info
       if len(response.data) > 0:
         # get groups from kwargs
@@ -1327,6 +1341,7 @@ class Ingest():
                                'base_url': metadatas[0].get('base_url', None),
                                'is_duplicate': False,
                            })
+      checkpoint.clear()
       print("successful END OF split_and_upload")
       return "Success"
     except Exception as e:
@@ -1334,12 +1349,44 @@ class Ingest():
       print(err)
       sentry_sdk.capture_exception(e)
       sentry_sdk.flush(timeout=20)
+      # Only a failed ingest keeps its parsed text, so the retry skips parsing and OCR. Successful ones never write it.
+      checkpoint.save_parsed(texts, metadatas)
       raise Exception(err)
 
-  def check_for_duplicates(self, texts: List[Dict], metadatas: List[Dict[str, Any]]) -> bool:
+  def find_duplicate(self, course_name: str, s3_path: str, url: str, content_hash: str) -> bool:
     """
-    For given metadata, fetch docs from Supabase based on S3 path or URL.
-    If docs exists, concatenate the texts and compare with current texts, if same, return True.
+    Content-addressed duplicate check. Runs BEFORE parsing, so duplicate uploads skip parsing, OCR and embedding.
+    One indexed lookup on (course_name, content_hash) that only transfers paths, never contexts.
+    A duplicate is the same contents under the same original filename (for uploads) or the same url (for web pages).
+    """
+    if not content_hash:
+      return False
+    response = self.supabase_client.table(os.getenv('REFACTORED_MATERIALS_SUPABASE_TABLE')).select(
+        'id', 's3_path', 'url').eq('course_name', course_name).eq('content_hash', content_hash).execute()
+
+    for record in response.data:
+      if s3_path:
+        if record.get('s3_path') and self._original_filename(record['s3_path']) == self._original_filename(s3_path):
+          print(f"Duplicate ingested! 📄 s3_path: {s3_path} matches document id {record['id']}.")
+          return True
+      elif url and record.get('url') == url:
+        print(f"Duplicate ingested! 📄 url: {url} matches document id {record['id']}.")
+        return True
+    return False
+
+  def _original_filename(self, s3_path: str) -> str:
+    """Filename without the uuid prefix we add on upload -- not all s3_paths have uuids!"""
+    filename = s3_path.split('/')[-1]
+    pattern = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}',
+                         re.I)  # uuid V4 pattern, and v4 only.
+    if bool(pattern.search(filename)):
+      return filename[37:]
+    return filename
+
+  def find_previous_version(self, metadatas: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    For given metadata, fetch docs from Supabase based on S3 path or URL (ids and hashes only, no contexts).
+    Returns the existing doc with the same filename (uuid removed) or url, if any.
     """
     doc_table = os.getenv('REFACTORED_MATERIALS_SUPABASE_TABLE')
     course_name = metadatas[0]['course_name']
@@ -1347,20 +1394,10 @@ class Ingest():
     url = metadatas[0]['url']
 
     if incoming_s3_path:
-      # check if uuid exists in s3_path -- not all s3_paths have uuids!
-      incoming_filename = incoming_s3_path.split('/')[-1]
-      # print("Full filename: ", incoming_filename)
-      pattern = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}',
-                           re.I)  # uuid V4 pattern, and v4 only.
-      if bool(pattern.search(incoming_filename)):
-        # uuid pattern exists -- remove the uuid and proceed with duplicate checking
-        original_filename = incoming_filename[37:]
-      else:
-        # do not remove anything and proceed with duplicate checking
-        original_filename = incoming_filename
+      original_filename = self._original_filename(incoming_s3_path)
       print(f"Filename after removing uuid: {original_filename}")
 
-      supabase_contents = self.supabase_client.table(doc_table).select('id', 'contexts', 's3_path').eq(
+      supabase_contents = self.supabase_client.table(doc_table).select('id', 's3_path', 'url', 'content_hash').eq(
           'course_name', course_name).like('s3_path', '%' + original_filename + '%').order('id', desc=True).execute()
       supabase_contents = supabase_contents.data
       print(f"No. of S3 path based records retrieved: {len(supabase_contents)}"
@@ -1368,72 +1405,99 @@ class Ingest():
 
     elif url:
       original_filename = url
-      supabase_contents = self.supabase_client.table(doc_table).select('id', 'contexts', 'url').eq(
+      supabase_contents = self.supabase_client.table(doc_table).select('id', 's3_path', 'url', 'content_hash').eq(
           'course_name', course_name).eq('url', url).order('id', desc=True).execute()
       supabase_contents = supabase_contents.data
       print(f"No. of URL-based records retrieved: {len(supabase_contents)}")
     else:
-      original_filename = None
-      supabase_contents = []
-
-    supabase_whole_text = ""
-    exact_doc_exists = False
-    if len(supabase_contents) > 0:  # a doc with same filename exists in Supabase
-      for record in supabase_contents:
-        if incoming_s3_path:
-          curr_filename = record['s3_path'].split('/')[-1]
-          older_s3_path = record['s3_path']
-          if bool(pattern.search(curr_filename)):
-            # uuid pattern exists -- remove the uuid and proceed with duplicate checking
-            sql_filename = curr_filename[37:]
-          else:
-            # do not remove anything and proceed with duplicate checking
-            sql_filename = curr_filename
-        elif url:
-          print("URL retrieved from SQL: ", record.keys())
-          sql_filename = record['url']
-        else:
-          continue
-        print("Original filename: ", original_filename, "Current SQL filename: ", sql_filename)
-
-        if original_filename == sql_filename:  # compare og s3_path/url with incoming s3_path/url
-          supabase_contexts = record
+      return None
 
-          exact_doc_exists = True
-          print("Exact doc exists in Supabase:", sql_filename)
-          break
+    for record in supabase_contents:
+      sql_filename = self._original_filename(record['s3_path']) if incoming_s3_path else record['url']
+      if original_filename == sql_filename:  # compare og s3_path/url with incoming s3_path/url
+        print("Exact doc exists in Supabase:", sql_filename)
+        return record
 
-      if exact_doc_exists:
-        # concatenate og texts
-        for text in supabase_contexts['contexts']:
-          supabase_whole_text += text['text']
+    print(f"NOT a duplicate! 📄s3_path: {original_filename}")
+    return None
 
-        current_whole_text = ""
-        for text in texts:
-          current_whole_text += text['input']
-
-        if supabase_whole_text == current_whole_text:  # matches the previous file
-          print(f"Duplicate ingested! 📄 s3_path/url: {original_filename}.")
-          return True
-
-        else:  # the file is updated
-          print(f"Updated file detected! Same filename, new contents. 📄s3_path/url: {original_filename}")
-
-          # call the delete function on older doc
-          print("older s3_path/url to be deleted: ", sql_filename)
-          if incoming_s3_path:
-            delete_status = self.delete_data(course_name, older_s3_path, '')
-          else:
-            delete_status = self.delete_data(course_name, '', url)
-          print("delete_status: ", delete_status)
-          return False
-      else:
-        print(f"NOT a duplicate! 📄s3_path: {original_filename}")
-        return False
+  def is_same_contents(self, previous_doc: Dict[str, Any], texts: List[Dict], content_hash: str) -> bool:
+    """Same hash means a duplicate. Legacy docs from before content hashes fall back to comparing text."""
+    if previous_doc.get('content_hash'):
+      is_same = previous_doc['content_hash'] == content_hash
+    else:
+      is_same = self._legacy_contexts_match(previous_doc['id'], texts)
+    if is_same:
+      print(f"Duplicate ingested! 📄 s3_path/url: {previous_doc.get('s3_path') or previous_doc.get('url')}.")
+    return is_same
+
+  def _get_qdrant_collection(self, course_name: str):
+    # ----------------------------
+    # SPECIAL CASE FOR CROPWIZARD INGEST
+    # ----------------------------
+    if course_name == 'cropwizard-1.5':
+      return self.cropwizard_qdrant_client, 'cropwizard'
+    return self.qdrant_client, os.environ['QDRANT_COLLECTION_NAME']
+
+  def _document_filter(self, course_name: str, s3_path: Optional[str], url: Optional[str]) -> 'models.Filter':
+    """Qdrant filter for all chunks of one document: by s3_path when it has one, else by url."""
+    key, value = ('s3_path', s3_path) if s3_path else ('url', url)
+    return models.Filter(must=[
+        models.FieldCondition(key='course_name', match=models.MatchValue(value=course_name)),
+        models.FieldCondition(key=key, match=models.MatchValue(value=value)),
+    ])
+
+  def _get_previous_points(self, course_name: str, previous_doc: Dict[str, Any]) -> Dict[str, List[Any]]:
+    """
+    All Qdrant points (with vectors) of the previous version of a doc, grouped by chunk hash.
+    Older points have no `chunk_hash` in their payload, so it's computed from their `page_content`.
+    """
+    qdrant_client, collection_name = self._get_qdrant_collection(course_name)
+    points_by_hash: Dict[str, List[Any]] = {}
+    offset = None
+    while True:
+      points, offset = qdrant_client.scroll(
+          collection_name=collection_name,
+          scroll_filter=self._document_filter(course_name, previous_doc.get('s3_path'), previous_doc.get('url')),
+          limit=256,
+          offset=offset,
+          with_payload=True,
+          with_vectors=True,
+      )
+      for point in points:
+        chunk_hash = point.payload.get('chunk_hash')
+        if not chunk_hash:
+          chunk_hash = hashlib.sha256(point.payload.get('page_content', '').encode('utf-8')).hexdigest()
+        points_by_hash.setdefault(chunk_hash, []).append(point)
+      if offset is None:
+        break
+    return points_by_hash
+
+  def _delete_previous_version(self, course_name: str, previous_doc: Dict[str, Any], incoming_s3_path: str):
+    """Delete the older Supabase row, and its S3 file if the upload replaced it. Qdrant points are handled by the caller."""
+    try:
+      self.supabase_client.table(os.environ['REFACTORED_MATERIALS_SUPABASE_TABLE']).delete().eq(
+          'id', previous_doc['id']).execute()
+    except Exception as e:
+      print("Error in deleting previous version from supabase:", e)
+      sentry_sdk.capture_exception(e)
 
-    else:  # filename does not already exist in Supabase, so its a brand new file
-      print(f"NOT a duplicate! 📄s3_path: {original_filename}")
+    if previous_doc.get('s3_path') and previous_doc['s3_path'] != incoming_s3_path:
+      try:
+        self.s3_client.delete_object(Bucket=os.getenv('S3_BUCKET_NAME'), Key=previous_doc['s3_path'])
+      except Exception as e:
+        print("Error in deleting previous version from s3:", e)
+        sentry_sdk.capture_exception(e)
+
+  def _legacy_contexts_match(self, doc_id: int, texts: List[Dict]) -> bool:
+    """Text comparison for documents ingested before `content_hash` existed."""
+    response = self.supabase_client.table(os.getenv('REFACTORED_MATERIALS_SUPABASE_TABLE')).select('contexts').eq(
+        'id', doc_id).execute()
+    if not response.data:
       return False
+    supabase_whole_text = "".join(context['text'] for context in response.data[0]['contexts'])
+    current_whole_text = "".join(text['input'] for text in texts)
+    return supabase_whole_text == current_whole_text
 
   def delete_data(self, course_name: str, s3_path: str, source_url: str):
     """Delete file from S3, Qdrant, and Supabase."""
@@ -0,0 +1,154 @@
+"""
+Stage checkpoints for resumable ingest.
+
+A failed ingest is retried from the top: download, parse, OCR, embed, upsert, insert. On a transient failure late
+in the pipeline (e.g. the Supabase insert) that paid for parsing, OCR and embeddings again. Each stage's output
+is saved here, keyed by the document (course, s3_path, url) and the hash of its contents, so a retry skips every
+stage that already finished:
+
+  parsed      the extracted texts and metadatas handed to `split_and_upload`, saved only when it fails
+  embeddings  one float32 row per chunk, valid only for the same chunk hashes
+  upserted    the Qdrant point id of every chunk, once all of them were confirmed in Qdrant
+
+Checkpoints live on the ingest cache volume, shared by all ingest containers. They are removed when the
+document is fully ingested, and pruned after `INGEST_CHECKPOINT_MAX_AGE_SECONDS` when it never is.
+Like the embedding cache, checkpoint errors are logged and ignored, they must never fail an ingest.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+CHECKPOINT_DIR = os.path.join(os.getenv('INGEST_CACHE_DIR', './ingest_cache'), 'checkpoints')
+CHECKPOINT_MAX_AGE_SECONDS = int(os.getenv('INGEST_CHECKPOINT_MAX_AGE_SECONDS', 7 * 24 * 3600))
+# How often each process prunes, pruning walks the whole checkpoint directory.
+CHECKPOINT_PRUNE_INTERVAL_SECONDS = 3600
+
+_last_pruned_at: Optional[float] = None
+_prune_lock = threading.Lock()
+
+
+class IngestCheckpoint:
+
+  def __init__(self,
+               course_name: str,
+               s3_path: Optional[str],
+               url: Optional[str],
+               content_hash: str,
+               root: str = CHECKPOINT_DIR):
+    key = json.dumps([course_name, s3_path or '', url or '', content_hash])
+    self.path = os.path.join(root, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+  def save_parsed(self, texts: List[str], metadatas: List[Dict[str, Any]]):
+    if os.path.exists(self._file('parsed.json.gz')):
+      return
+    try:
+      data = gzip.compress(json.dumps({'texts': texts, 'metadatas': metadatas}).encode('utf-8'))
+    except Exception as e:
+      print(f"Error writing ingest checkpoint {self._file('parsed.json.gz')}: {e}")
+      return
+    self._write('parsed.json.gz', data)
+
+  def load_parsed(self) -> Optional[Tuple[List[str], List[Dict[str, Any]]]]:
+    data = self._read('parsed.json.gz')
+    if data is None:
+      return None
+    try:
+      parsed = json.loads(gzip.decompress(data))
+      return parsed['texts'], parsed['metadatas']
+    except Exception as e:
+      print(f"Ignoring unreadable ingest checkpoint {self._file('parsed.json.gz')}: {e}")
+      return None
+
+  def save_embeddings(self, chunk_hashes: List[str], embeddings: Sequence[np.ndarray]):
+    self._write('embeddings.json', json.dumps(chunk_hashes).encode('utf-8'))
+    self._write('embeddings.f32', np.asarray(embeddings, dtype=np.float32).tobytes())
+
+  def load_embeddings(self, chunk_hashes: List[str]) -> Optional[np.ndarray]:
+    """The checkpointed embeddings, or None unless they were made for exactly these chunks."""
+    saved_hashes, blob = self._read('embeddings.json'), self._read('embeddings.f32')
+    if not chunk_hashes or saved_hashes is None or blob is None or json.loads(saved_hashes) != chunk_hashes:
+      return None
+    return np.frombuffer(blob, dtype=np.float32).reshape(len(chunk_hashes), -1)
+
+  def save_upserted(self, chunk_hashes: List[str], point_ids: List[Any]):
+    self._write('upserted.json', json.dumps({'chunk_hashes': chunk_hashes, 'point_ids': point_ids}).encode('utf-8'))
+
+  def load_upserted(self, chunk_hashes: List[str]) -> Optional[List[Any]]:
+    """Point id of every chunk, or None unless exactly these chunks were upserted."""
+    data = self._read('upserted.json')
+    if data is None:
+      return None
+    upserted = json.loads(data)
+    return upserted['point_ids'] if upserted['chunk_hashes'] == chunk_hashes else None
+
+  def discard(self, stage: str):
+    for filename in {
+        'parsed': ['parsed.json.gz'],
+        'embeddings': ['embeddings.json', 'embeddings.f32'],
+        'upserted': ['upserted.json']
+    }[stage]:
+      try:
+        os.remove(self._file(filename))
+      except FileNotFoundError:
+        pass
+      except Exception as e:
+        print(f"Error removing ingest checkpoint {self._file(filename)}: {e}")
+
+  def clear(self):
+    shutil.rmtree(self.path, ignore_errors=True)
+
+  def _file(self, filename: str) -> str:
+    return os.path.join(self.path, filename)
+
+  def _write(self, filename: str, data: bytes):
+    try:
+      os.makedirs(self.path, exist_ok=True)
+      tmp_path = f"{self._file(filename)}.{os.getpid()}.tmp"
+      with open(tmp_path, 'wb') as f:
+        f.write(data)
+      os.replace(tmp_path, self._file(filename))  # atomic: readers never see half a checkpoint
+    except Exception as e:
+      print(f"Error writing ingest checkpoint {self._file(filename)}: {e}")
+
+  def _read(self, filename: str) -> Optional[bytes]:
+    try:
+      with open(self._file(filename), 'rb') as f:
+        return f.read()
+    except FileNotFoundError:
+      return None
+    except Exception as e:
+      print(f"Error reading ingest checkpoint {self._file(filename)}: {e}")
+      return None
+
+
+def schedule_checkpoint_pruning():
+  """Prune on a background thread, at most once per CHECKPOINT_PRUNE_INTERVAL_SECONDS per process."""
+  global _last_pruned_at
+  with _prune_lock:
+    if _last_pruned_at is not None and time.monotonic() - _last_pruned_at < CHECKPOINT_PRUNE_INTERVAL_SECONDS:
+      return
+    _last_pruned_at = time.monotonic()
+  threading.Thread(target=prune_checkpoints, name='prune-ingest-checkpoints', daemon=True).start()
+
+
+def prune_checkpoints(root: str = CHECKPOINT_DIR, max_age_seconds: int = CHECKPOINT_MAX_AGE_SECONDS):
+  """Remove the checkpoints of documents that were never finished, e.g. files that failed every retry."""
+  try:
+    entries = list(os.scandir(root))
+  except FileNotFoundError:
+    return
+  cutoff = time.time() - max_age_seconds
+  for entry in entries:
+    try:
+      if entry.is_dir() and entry.stat().st_mtime < cutoff:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    except Exception as e:
+      print(f"Error pruning ingest checkpoint {entry.path}: {e}")
@@ -0,0 +1,209 @@
+"""
+Run the ingest engine without Beam: a queue consumer with configurable concurrency.
+
+Jobs are the same JSON inputs the Beam `ingest` task takes (course_name, s3_paths, readable_filename, url,
+base_url, content, groups). They are read from a Redis list, so any number of workers on any number of
+machines can share one queue, or from a local directory of `*.json` files.
+
+Every backend is picked by the usual env vars, so the worker runs against stand-ins as well as production:
+  S3        S3_ENDPOINT_URL (e.g. MinIO at http://localhost:9000), AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, S3_BUCKET_NAME
+  Qdrant    QDRANT_URL (e.g. a local `qdrant/qdrant` container), QDRANT_API_KEY, QDRANT_COLLECTION_NAME
+  Supabase  SUPABASE_URL, SUPABASE_API_KEY (e.g. the Postgres + PostgREST stack of `supabase start`)
+  OpenAI    VLADS_OPENAI_KEY, OPENAI_EMBEDDINGS_URL (e.g. benchmarks/fake_embeddings_server.py)
+PostHog is disabled when POSTHOG_API_KEY is unset. Requires the Beam client package (ingest.py imports it, but
+nothing runs on Beam) and the packages in ingest.py's `requirements`.
+
+  python ai_ta_backend/beam/local_worker.py --redis_url redis://localhost:6379 --concurrency 8
+  python ai_ta_backend/beam/local_worker.py --jobs_dir ./ingest_jobs
+  python ai_ta_backend/beam/local_worker.py --jobs_dir ./ingest_jobs submit --course_name demo --s3_paths courses/demo/a.pdf
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+# Must be set before ingest.py is imported, it only imports its dependencies in a Beam container otherwise.
+os.environ.setdefault('INGEST_LOCAL_WORKER', '1')
+
+from ingest import loader, process_ingest_task  # noqa: E402
+
+DEFAULT_QUEUE = 'ingest_jobs'
+POLL_TIMEOUT_SECONDS = 5
+
+
+class RedisJobQueue:
+  """
+  Jobs are JSON strings in a Redis list (LPUSH to submit). A job is moved to a per-queue processing list while it
+  runs, so jobs of a worker that died are not lost: `requeue_stale` puts them back.
+  """
+
+  def __init__(self, redis_url: str, queue_name: str = DEFAULT_QUEUE):
+    import redis
+    self.redis_client = redis.Redis.from_url(redis_url)
+    self.queue_name = queue_name
+    self.processing_name = f"{queue_name}:processing"
+    self.results_name = f"{queue_name}:results"
+
+  def submit(self, job: Dict[str, Any]) -> str:
+    job = {'job_id': str(uuid.uuid4()), **job}
+    self.redis_client.lpush(self.queue_name, json.dumps(job))
+    return job['job_id']
+
+  def get(self) -> Optional[Tuple[Dict[str, Any], Any]]:
+    raw = self.redis_client.brpoplpush(self.queue_name, self.processing_name, timeout=POLL_TIMEOUT_SECONDS)
+    if raw is None:
+      return None
+    return json.loads(raw), raw
+
+  def done(self, receipt: Any, result: Dict[str, Any]):
+    pipeline = self.redis_client.pipeline()
+    pipeline.lpush(self.results_name, json.dumps(result))
+    pipeline.lrem(self.processing_name, 1, receipt)
+    pipeline.execute()
+
+  def requeue_stale(self):
+    """Move jobs left in the processing list (by crashed workers) back to the queue. Only safe while no worker runs."""
+    while self.redis_client.rpoplpush(self.processing_name, self.queue_name) is not None:
+      pass
+
+
+class DirectoryJobQueue:
+  """
+  Jobs are `*.json` files in a directory. A worker claims one by renaming it (atomic, so no two workers get the
+  same job) and writes the result next to it as `<job>.done.json` or `<job>.failed.json`.
+  """
+
+  def __init__(self, jobs_dir: str):
+    self.jobs_dir = jobs_dir
+    os.makedirs(jobs_dir, exist_ok=True)
+
+  def submit(self, job: Dict[str, Any]) -> str:
+    job = {'job_id': str(uuid.uuid4()), **job}
+    tmp_path = os.path.join(self.jobs_dir, f".{job['job_id']}.tmp")
+    with open(tmp_path, 'w') as f:
+      json.dump(job, f)
+    os.replace(tmp_path, os.path.join(self.jobs_dir, f"{job['job_id']}.json"))
+    return job['job_id']
+
+  def get(self) -> Optional[Tuple[Dict[str, Any], Any]]:
+    deadline = time.monotonic() + POLL_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+      for filename in sorted(os.listdir(self.jobs_dir)):
+        if not filename.endswith('.json') or filename.endswith(('.done.json', '.failed.json')):
+          continue
+        claimed_path = os.path.join(self.jobs_dir, filename[:-len('.json')] + '.processing')
+        try:
+          os.rename(os.path.join(self.jobs_dir, filename), claimed_path)
+        except FileNotFoundError:
+          continue  # another worker claimed it first
+        with open(claimed_path) as f:
+          return json.load(f), claimed_path
+      time.sleep(0.5)
+    return None
+
+  def done(self, receipt: Any, result: Dict[str, Any]):
+    status = 'failed' if result.get('error') or result.get('result', {}).get('failure_ingest') else 'done'
+    with open(receipt[:-len('.processing')] + f'.{status}.json', 'w') as f:
+      json.dump(result, f, indent=2)
+    os.remove(receipt)
+
+  def requeue_stale(self):
+    for filename in os.listdir(self.jobs_dir):
+      if filename.endswith('.processing'):
+        path = os.path.join(self.jobs_dir, filename)
+        os.replace(path, path[:-len('.processing')] + '.json')
+
+
+def run_job(clients, job: Dict[str, Any]) -> Dict[str, Any]:
+  start_time = time.monotonic()
+  inputs = {key: value for key, value in job.items() if key != 'job_id'}
+  try:
+    result: Dict[str, Any] = {'result': json.loads(process_ingest_task(clients, **inputs))}
+  except Exception as e:
+    traceback.print_exc()
+    result = {'error': str(e)}
+  return {'job_id': job.get('job_id'), **result, 'runtime_seconds': round(time.monotonic() - start_time, 3)}
+
+
+def run_worker(queue, concurrency: int, max_jobs: Optional[int] = None, requeue_stale: bool = False):
+  """Process jobs on `concurrency` threads until interrupted (or until `max_jobs` jobs are done)."""
+  clients = loader()  # shared by all threads, like the Beam container shares them across tasks
+  if requeue_stale:
+    queue.requeue_stale()
+  stop = threading.Event()
+  lock = threading.Lock()
+  jobs_done = 0
+
+  def consume():
+    nonlocal jobs_done
+    while not stop.is_set():
+      claimed = queue.get()
+      if claimed is None:
+        continue
+      job, receipt = claimed
+      print(f"Starting job {job.get('job_id')}: {job.get('course_name')} {job.get('s3_paths') or job.get('url')}")
+      result = run_job(clients, job)
+      queue.done(receipt, result)
+      print(f"Finished job {job.get('job_id')} in {result['runtime_seconds']}s")
+      with lock:
+        jobs_done += 1
+        if max_jobs is not None and jobs_done >= max_jobs:
+          stop.set()
+
+  threads = [threading.Thread(target=consume, name=f'ingest-worker-{i}', daemon=True) for i in range(concurrency)]
+  for thread in threads:
+    thread.start()
+  try:
+    while any(thread.is_alive() for thread in threads):
+      for thread in threads:
+        thread.join(timeout=1)
+  except KeyboardInterrupt:
+    print("Stopping, waiting for running jobs to finish...")
+    stop.set()
+    for thread in threads:
+      thread.join()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  source = parser.add_mutually_exclusive_group(required=True)
+  source.add_argument('--redis_url', help='Read jobs from a Redis list')
+  source.add_argument('--jobs_dir', help='Read jobs from *.json files in a directory')
+  parser.add_argument('--queue_name', default=DEFAULT_QUEUE, help='Redis list name')
+  parser.add_argument('--concurrency', type=int, default=int(os.getenv('INGEST_WORKER_CONCURRENCY', 4)))
+  parser.add_argument('--max_jobs', type=int, default=None, help='Exit after this many jobs (e.g. for benchmarks)')
+  parser.add_argument('--requeue_stale',
+                      action='store_true',
+                      help='On startup, requeue jobs of crashed workers. Only when no other worker is running.')
+  subparsers = parser.add_subparsers(dest='command')
+  submit = subparsers.add_parser('submit', help='Queue one job instead of running the worker')
+  submit.add_argument('--course_name', required=True)
+  submit.add_argument('--s3_paths', nargs='+', default=[])
+  submit.add_argument('--readable_filename', default='')
+  submit.add_argument('--url', default=None)
+  submit.add_argument('--base_url', default=None)
+  submit.add_argument('--groups', nargs='*', default=[])
+  args = parser.parse_args()
+
+  queue = RedisJobQueue(args.redis_url, args.queue_name) if args.redis_url else DirectoryJobQueue(args.jobs_dir)
+  if args.command == 'submit':
+    job_id = queue.submit({
+        'course_name': args.course_name,
+        's3_paths': args.s3_paths[0] if len(args.s3_paths) == 1 else args.s3_paths,
+        'readable_filename': args.readable_filename,
+        'url': args.url,
+        'base_url': args.base_url,
+        'groups': args.groups,
+    })
+    print(f"Submitted job {job_id}")
+    return
+  run_worker(queue, concurrency=args.concurrency, max_jobs=args.max_jobs, requeue_stale=args.requeue_stale)
+
+
+if __name__ == '__main__':
+  main()
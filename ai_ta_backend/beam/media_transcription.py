@@ -0,0 +1,101 @@
+"""
+Streaming audio segmentation and concurrent transcription for video/audio ingest.
+
+ffmpeg extracts the audio track straight into small mono Opus files on disk (its segment muxer streams,
+the media is never decoded into memory), and records when each segment starts. Segments are transcribed
+concurrently with Whisper, and every returned piece of text keeps its absolute start/end time in the media.
+"""
+
+import csv
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import openai
+
+# 10 minutes of 32 kbps mono Opus is ~2.4 MB, far below Whisper's 25 MB upload limit,
+# and small enough that a lecture splits into several segments to transcribe in parallel.
+SEGMENT_SECONDS = int(os.getenv('TRANSCRIPTION_SEGMENT_SECONDS', 600))
+AUDIO_BITRATE = '32k'
+TRANSCRIPTION_MAX_WORKERS = int(os.getenv('TRANSCRIPTION_MAX_WORKERS', 4))
+WHISPER_MAX_FILE_BYTES = 25 * 1024 * 1024
+
+
+def segment_audio(media_path: str, output_dir: str, segment_seconds: int = SEGMENT_SECONDS) -> List[Dict]:
+  """
+  Extract the audio of `media_path` into consecutive segments in `output_dir`.
+
+  Returns:
+      List[Dict]: One dict per segment, in order: `path`, `start` and `end` (seconds from the start of the media).
+  """
+  try:
+    return _run_segmenter(media_path, output_dir, segment_seconds)
+  except subprocess.CalledProcessError as e:
+    # Usually an mp4 with its moov atom at the end (e.g. an interrupted recording). Remux it and try again.
+    print(f"ffmpeg couldn't segment the file, applying moov atom fix and retrying. Error: {e.stderr[-2000:]!r}")
+    fixed_path = os.path.join(output_dir, 'faststart' + os.path.splitext(media_path)[1])
+    subprocess.run(['ffmpeg', '-nostdin', '-y', '-i', media_path, '-c', 'copy', '-movflags', 'faststart', fixed_path],
+                   check=True,
+                   capture_output=True)
+    try:
+      return _run_segmenter(fixed_path, output_dir, segment_seconds)
+    finally:
+      os.remove(fixed_path)
+
+
+def _run_segmenter(media_path: str, output_dir: str, segment_seconds: int) -> List[Dict]:
+  segment_list = os.path.join(output_dir, 'segments.csv')
+  command = ['ffmpeg', '-nostdin', '-y', '-i', media_path]
+  command += ['-vn', '-ac', '1', '-ar', '16000', '-c:a', 'libopus', '-b:a', AUDIO_BITRATE]
+  command += ['-f', 'segment', '-segment_time', str(segment_seconds), '-reset_timestamps', '1']
+  command += ['-segment_list', segment_list, '-segment_list_type', 'csv']
+  command.append(os.path.join(output_dir, 'segment_%05d.webm'))
+  subprocess.run(command, check=True, capture_output=True, text=True)
+  segments = []
+  with open(segment_list, newline='') as f:
+    for filename, start, end in csv.reader(f):
+      segments.append({'path': os.path.join(output_dir, filename), 'start': float(start), 'end': float(end)})
+  return segments
+
+
+def transcribe_segment(segment: Dict) -> List[Dict]:
+  """
+  Transcribe one audio segment with Whisper.
+
+  Returns:
+      List[Dict]: Whisper's own segments (a sentence or so each): `text`, `start` and `end`, in seconds from the
+      start of the whole media, not of this segment.
+  """
+  if os.path.getsize(segment['path']) > WHISPER_MAX_FILE_BYTES:
+    raise ValueError(f"Audio segment {segment['path']} is over Whisper's 25 MB limit, lower SEGMENT_SECONDS")
+  with open(segment['path'], 'rb') as f:
+    transcript = openai.Audio.transcribe("whisper-1", f, response_format="verbose_json")
+  pieces = [{
+      'text': piece['text'].strip(),
+      'start': segment['start'] + piece['start'],
+      'end': segment['start'] + piece['end'],
+  } for piece in transcript.get('segments', [])]  # type: ignore
+  if not pieces and transcript.get('text', '').strip():  # type: ignore
+    pieces = [{'text': transcript['text'].strip(), 'start': segment['start'], 'end': segment['end']}]  # type: ignore
+  return [piece for piece in pieces if piece['text']]
+
+
+def transcribe_media(media_path: str, output_dir: str, max_workers: int = TRANSCRIPTION_MAX_WORKERS) -> List[Dict]:
+  """
+  Segment and transcribe a video or audio file. Segments are transcribed concurrently.
+
+  Returns:
+      List[Dict]: One dict per audio segment, in media order: `start`, `end`, the segment's full `text`, and its
+      timestamped `pieces` (see `transcribe_segment`).
+  """
+  segments = segment_audio(media_path, output_dir)
+  print(f"Transcribing {len(segments)} audio segments")
+  with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(segments)))) as executor:
+    transcripts = list(executor.map(transcribe_segment, segments))
+  return [{
+      'start': segment['start'],
+      'end': segment['end'],
+      'text': ' '.join(piece['text'] for piece in pieces),
+      'pieces': pieces,
+  } for segment, pieces in zip(segments, transcripts)]
@@ -0,0 +1,162 @@
+"""
+Page-parallel PDF text extraction.
+
+Pages are split into contiguous ranges and each range is handled by its own process, which opens the
+PDF independently (PyMuPDF documents can't be shared across processes). All PDFs share one process pool,
+so several files ingested at once queue for the same CPUs instead of each starting a pool of their own. OCR is decided per page:
+only pages whose text layer is missing or too sparse for their size are rendered with PyMuPDF and
+OCR'd, whether the scan is an embedded image or drawn as vector paths. OCR output is cached by a hash of the rendered page, so re-ingesting
+the same PDF never re-OCRs it.
+"""
+
+import hashlib
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+import fitz
+import pytesseract
+from PIL import Image
+
+# Below this, process start-up costs more than it saves.
+MIN_PAGES_FOR_PARALLEL = 8
+
+# Render resolution for OCR. Tesseract accuracy drops off quickly below ~200 DPI.
+OCR_DPI = int(os.getenv('PDF_OCR_DPI', 200))
+
+# Non-whitespace characters per square inch of page. Sparser pages get OCR'd.
+# A letter page is ~94 sq. inches, so the default is roughly "fewer than 94 characters on the page".
+OCR_TEXT_DENSITY_THRESHOLD = float(os.getenv('PDF_OCR_TEXT_DENSITY_THRESHOLD', 1.0))
+
+# Shared with the other ingest caches, mounted as a Beam Volume so it survives between containers.
+OCR_CACHE_DIR = os.path.join(os.getenv('INGEST_CACHE_DIR', './ingest_cache'), 'ocr')
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+  """
+  The process pool shared by every extraction in this container. `loader()` creates it before any ingest thread
+  starts. Workers come from a forkserver, never a fork of this (multithreaded) process, which could copy a lock
+  held by another thread and deadlock the child.
+  """
+  global _executor
+  with _executor_lock:
+    if _executor is None:
+      _executor = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                      mp_context=multiprocessing.get_context('forkserver'))
+    return _executor
+
+
+def _reset_executor():
+  global _executor
+  with _executor_lock:
+    _executor = None
+
+
+def extract_pdf_pages(pdf_path: str, max_workers: Optional[int] = None, dpi: int = OCR_DPI) -> List[Dict]:
+  """
+  Extract the text of every page of a PDF, in page order.
+
+  Args:
+      pdf_path (str): Local path to the PDF.
+      max_workers (int, optional): Number of page ranges to split the PDF into. Defaults to the number of CPUs.
+      dpi (int, optional): Render resolution for pages that need OCR.
+
+  Returns:
+      List[Dict]: One dict per page: `text`, `page_number` (0-indexed) and `ocr` (whether OCR produced the text).
+  """
+  with fitz.open(pdf_path) as doc:  # type: ignore
+    num_pages = doc.page_count
+
+  max_workers = max_workers or os.cpu_count() or 1
+  if num_pages < MIN_PAGES_FOR_PARALLEL or max_workers == 1:
+    return extract_page_range(pdf_path, 0, num_pages, dpi)
+
+  page_ranges = split_page_ranges(num_pages, max_workers)
+  try:
+    results = get_executor().map(extract_page_range, [pdf_path] * len(page_ranges), [start for start, _ in page_ranges],
+                                 [end for _, end in page_ranges], [dpi] * len(page_ranges))
+    return [page for page_range in results for page in page_range]
+  except BrokenProcessPool:
+    _reset_executor()  # a worker died (e.g. OOM), start a fresh pool for the next file
+    raise
+
+
+def split_page_ranges(num_pages: int, num_ranges: int) -> List[Tuple[int, int]]:
+  """Split [0, num_pages) into at most `num_ranges` contiguous [start, end) ranges."""
+  pages_per_range = max(1, math.ceil(num_pages / num_ranges))
+  return [(start, min(start + pages_per_range, num_pages)) for start in range(0, num_pages, pages_per_range)]
+
+
+def extract_page_range(pdf_path: str, start: int, end: int, dpi: int = OCR_DPI) -> List[Dict]:
+  """Extract pages [start, end). Runs inside a worker process, so it opens its own copy of the PDF."""
+  pages: List[Dict] = []
+  with fitz.open(pdf_path) as doc:  # type: ignore
+    for page_number in range(start, end):
+      page = doc[page_number]
+      text = page.get_text().encode("utf8").decode("utf8", errors='ignore')
+      ocr = False
+      if needs_ocr(page, text):
+        ocr_text = ocr_page(page, dpi)
+        # Keep whichever found more, a sparse text layer can still beat a bad scan.
+        if len(ocr_text.strip()) > len(text.strip()):
+          text = ocr_text
+          ocr = True
+      pages.append(dict(text=text, page_number=page_number, ocr=ocr))
+  return pages
+
+
+def needs_ocr(page, text: str) -> bool:
+  """
+  True if the page's text layer is empty or too sparse for its size. Deliberately not conditional on embedded
+  images: scans can also be vector paths or outlined glyphs. The page is rendered, so OCR sees either.
+  """
+  area_sq_inches = (page.rect.width / 72) * (page.rect.height / 72)
+  num_chars = len(''.join(text.split()))
+  return num_chars / max(area_sq_inches, 1.0) < OCR_TEXT_DENSITY_THRESHOLD
+
+
+def ocr_page(page, dpi: int = OCR_DPI) -> str:
+  """Render the page with PyMuPDF and OCR it. Cached by the hash of the rendered pixels."""
+  pix = page.get_pixmap(dpi=dpi)
+  page_hash = hashlib.sha256(f"{pix.width}x{pix.height}x{pix.n}".encode() + pix.samples).hexdigest()
+
+  cached_text = _read_ocr_cache(page_hash)
+  if cached_text is not None:
+    return cached_text
+
+  mode = "RGBA" if pix.alpha else "RGB"
+  text = pytesseract.image_to_string(Image.frombytes(mode, (pix.width, pix.height), pix.samples))
+  _write_ocr_cache(page_hash, text)
+  return text
+
+
+def _ocr_cache_path(page_hash: str) -> str:
+  return os.path.join(OCR_CACHE_DIR, page_hash[:2], page_hash + '.txt')
+
+
+def _read_ocr_cache(page_hash: str) -> Optional[str]:
+  try:
+    with open(_ocr_cache_path(page_hash), 'r', encoding='utf-8') as f:
+      return f.read()
+  except OSError:
+    return None
+
+
+def _write_ocr_cache(page_hash: str, text: str):
+  """Best effort. Write to a temp file then rename, so concurrent workers never read a partial entry."""
+  path = _ocr_cache_path(page_hash)
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+      f.write(text)
+    os.replace(tmp_path, path)
+  except OSError as e:
+    print(f"Failed to write OCR cache for page {page_hash}: {e}")
@@ -0,0 +1,143 @@
+"""
+Streaming, batched Qdrant upserts.
+
+Points are added as soon as they are ready (e.g. as each embeddings batch comes back) and upserted in
+fixed-size batches on a small thread pool, so uploading overlaps with embedding instead of waiting for
+one giant upsert at the end. The number of batches waiting to upload is bounded: `add` blocks when the
+uploads fall behind, which in turn slows the embedding side down instead of buffering the whole document.
+
+Batches are sent with `wait=False`: Qdrant acknowledges each one with an operation id and applies it in the
+background. Because of that, an acknowledged upload isn't proof the points are searchable, `wait_for_count`
+polls an exact count of the document's point ids until every one of them is there. Points that already exist
+(e.g. kept chunks that only get a new payload) are overwritten with `replace`, which waits for Qdrant to apply them,
+since a count can't tell their old version from the new one.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, List, Optional
+
+from qdrant_client import models
+from qdrant_client.models import PointStruct
+
+UPSERT_BATCH_SIZE = int(os.getenv('QDRANT_UPSERT_BATCH_SIZE', 256))
+UPSERT_PARALLELISM = int(os.getenv('QDRANT_UPSERT_PARALLELISM', 4))
+# How long to wait for acknowledged (wait=False) upserts to become visible before failing the ingest.
+CONSISTENCY_TIMEOUT_SECONDS = float(os.getenv('QDRANT_CONSISTENCY_TIMEOUT_SECONDS', 120))
+
+
+class QdrantUploader:
+
+  def __init__(self,
+               qdrant_client,
+               collection_name: str,
+               batch_size: int = UPSERT_BATCH_SIZE,
+               parallelism: int = UPSERT_PARALLELISM,
+               wait: bool = False):
+    self.qdrant_client = qdrant_client
+    self.collection_name = collection_name
+    self.batch_size = batch_size
+    self.wait = wait
+    self.executor = ThreadPoolExecutor(max_workers=parallelism)
+    # at most `parallelism` batches uploading plus `parallelism` queued
+    self.pending_batches = threading.BoundedSemaphore(2 * parallelism)
+    self.buffer: List[PointStruct] = []
+    self.futures: List[Future] = []
+    self.uploaded_ids: List[Any] = []
+    self.operation_ids: List[Optional[int]] = []
+    self.replaced: List[PointStruct] = []  # previous versions of the points overwritten by `replace`
+    self.lock = threading.Lock()
+
+  def __enter__(self) -> 'QdrantUploader':
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.executor.shutdown(wait=True)
+
+  def add(self, points: List[PointStruct]):
+    """Queue points for upload. Full batches are submitted right away."""
+    self.buffer.extend(points)
+    while len(self.buffer) >= self.batch_size:
+      self._submit(self.buffer[:self.batch_size])
+      self.buffer = self.buffer[self.batch_size:]
+
+  def flush(self) -> int:
+    """Upload whatever is still buffered and wait for every batch. Raises the first upload error.
+    Returns the number of points uploaded."""
+    if self.buffer:
+      self._submit(self.buffer)
+      self.buffer = []
+    for future in self.futures:
+      future.result()
+    return len(self.uploaded_ids)
+
+  def wait_for_count(self, point_ids: List[Any], timeout_seconds: float = CONSISTENCY_TIMEOUT_SECONDS) -> int:
+    """
+    Poll an exact count of `point_ids` (every point the document should have, uploaded now or kept from before)
+    until all of them exist. Only these ids are counted, so leftover points of older versions can't make up for
+    missing ones. Raises if they don't all show up within the timeout, i.e. some acknowledged upserts were never applied.
+    """
+    expected_count = len(set(point_ids))
+    count_filter = models.Filter(must=[models.HasIdCondition(has_id=list(point_ids))])
+    deadline = time.monotonic() + timeout_seconds
+    delay = 0.25
+    while True:
+      count = self.qdrant_client.count(collection_name=self.collection_name, count_filter=count_filter,
+                                       exact=True).count
+      if count == expected_count:
+        return count
+      if time.monotonic() >= deadline:
+        raise RuntimeError(f"Qdrant has {count} of {expected_count} points for this document after "
+                           f"{timeout_seconds:.0f}s ({len(self.operation_ids)} upsert operations, last operation id "
+                           f"{self.operation_ids[-1] if self.operation_ids else None})")
+      time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+      delay = min(delay * 2, 5.0)
+
+  def replace(self, points: List[PointStruct], previous: List[PointStruct]):
+    """
+    Overwrite existing points, in batches, waiting until Qdrant has applied each one. Raises if one wasn't.
+    `previous` are their current versions, which `rollback` puts back.
+    """
+    self.replaced.extend(previous)
+    for start in range(0, len(points), self.batch_size):
+      batch = points[start:start + self.batch_size]
+      result = self.qdrant_client.upsert(collection_name=self.collection_name, points=batch, wait=True)
+      if result.status != models.UpdateStatus.COMPLETED:
+        raise RuntimeError(f"Qdrant update of {len(batch)} existing points returned status {result.status} "
+                           f"(operation id {result.operation_id})")
+
+  def rollback(self):
+    """
+    Best effort undo, e.g. after a later step failed: remove the points this uploader added, and put back the
+    previous version of the points it replaced.
+    """
+    for future in self.futures:
+      future.exception()  # only waits, errors are raised by flush()
+    if self.uploaded_ids:
+      try:
+        self.qdrant_client.delete(collection_name=self.collection_name,
+                                  points_selector=models.PointIdsList(points=self.uploaded_ids))
+      except Exception as e:
+        print(f"Failed to roll back {len(self.uploaded_ids)} uploaded points: {e}")
+    if self.replaced:
+      try:
+        self.qdrant_client.upsert(collection_name=self.collection_name, points=self.replaced, wait=True)
+      except Exception as e:
+        print(f"Failed to restore {len(self.replaced)} replaced points: {e}")
+
+  def _submit(self, batch: List[PointStruct]):
+    self.pending_batches.acquire()
+    future = self.executor.submit(self._upsert, batch)
+    future.add_done_callback(lambda _: self.pending_batches.release())
+    self.futures.append(future)
+
+  def _upsert(self, batch: List[PointStruct]):
+    result = self.qdrant_client.upsert(collection_name=self.collection_name, points=batch, wait=self.wait)
+    if result.status not in (models.UpdateStatus.ACKNOWLEDGED, models.UpdateStatus.COMPLETED):
+      raise RuntimeError(f"Qdrant upsert of {len(batch)} points returned status {result.status} "
+                         f"(operation id {result.operation_id})")
+    with self.lock:
+      self.uploaded_ids.extend(point.id for point in batch)
+      self.operation_ids.append(result.operation_id)
@@ -0,0 +1,129 @@
+"""
+A single S3 object, downloaded exactly once per ingest.
+
+`bulk_ingest` used to download every object just to guess its mimetype, then each `_ingest_single_*`
+method downloaded it again (and PDF OCR a third time). `S3File` streams the object to one temp file
+and is passed through the ingest methods, so type detection and every parser share the same bytes.
+The SHA-256 of the raw bytes is computed while streaming, for content-hash duplicate detection.
+"""
+
+import hashlib
+import mimetypes
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Optional
+
+# Leading bytes of the formats we can ingest. Used when neither the key nor S3 tells us the type.
+MAGIC_BYTES = [
+    (b'%PDF', 0, 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 0, 'image/png'),
+    (b'\xff\xd8\xff', 0, 'image/jpeg'),
+    (b'GIF8', 0, 'image/gif'),
+    (b'ftyp', 4, 'video/mp4'),
+    (b'\x1a\x45\xdf\xa3', 0, 'video/webm'),
+    (b'ID3', 0, 'audio/mpeg'),
+    (b'OggS', 0, 'audio/ogg'),
+    (b'fLaC', 0, 'audio/flac'),
+    (b'WAVE', 8, 'audio/wav'),
+    (b'WEBVTT', 0, 'text/vtt'),
+    (b'PK\x03\x04', 0, 'application/zip'),  # docx, pptx and xlsx are all zip containers
+]
+
+# S3 gives everything uploaded without an explicit type this, it tells us nothing.
+GENERIC_CONTENT_TYPES = {'binary/octet-stream', 'application/octet-stream', ''}
+
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8 MB
+
+
+class S3File:
+  """
+  Download an S3 object once into a named temp file (most loaders need a real path) and share it.
+  Use as a context manager, the temp file is removed on exit. Using it after that raises ValueError,
+  rather than quietly downloading the object again.
+  """
+
+  def __init__(self, s3_client, s3_path: str, bucket_name: Optional[str] = None):
+    self.s3_client = s3_client
+    self.s3_path = s3_path
+    self.bucket_name = bucket_name or os.environ['S3_BUCKET_NAME']
+    self.suffix = Path(s3_path).suffix
+    self.content_type: str = ''
+    self.size: int = 0
+    self.sha256: str = ''
+    self._tmpfile = None
+    self._closed = False
+
+  def __enter__(self) -> 'S3File':
+    return self.download()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def download(self) -> 'S3File':
+    """Stream the object to disk. Only hits S3 the first time it's called."""
+    if self._closed:
+      raise ValueError(f"S3File {self.s3_path} is closed, its temp file has been removed")
+    if self._tmpfile is not None:
+      return self
+    response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self.s3_path)
+    self.content_type = response.get('ContentType', '') or ''
+    self._tmpfile = NamedTemporaryFile(suffix=self.suffix)
+    file_hash = hashlib.sha256()
+    body = response['Body']
+    while True:
+      chunk = body.read(DOWNLOAD_CHUNK_SIZE)
+      if not chunk:
+        break
+      file_hash.update(chunk)
+      self._tmpfile.write(chunk)
+    self._tmpfile.flush()
+    self.size = self._tmpfile.tell()
+    self.sha256 = file_hash.hexdigest()
+    return self
+
+  @property
+  def name(self) -> str:
+    """Local path of the downloaded object, for loaders that only accept a filename."""
+    return self.download()._tmpfile.name  # type: ignore
+
+  def read_bytes(self) -> bytes:
+    with open(self.name, 'rb') as f:
+      return f.read()
+
+  def read_text(self, encoding: str = 'utf-8') -> str:
+    return self.read_bytes().decode(encoding, errors='ignore')
+
+  def head(self, num_bytes: int = 32) -> bytes:
+    with open(self.name, 'rb') as f:
+      return f.read(num_bytes)
+
+  @property
+  def mime_type(self) -> str:
+    """Best guess of the type: from the key first, then the S3 Content-Type header, then magic bytes."""
+    guessed = mimetypes.guess_type(self.s3_path, strict=False)[0]
+    if guessed:
+      return guessed
+    self.download()
+    if self.content_type.split(';')[0].strip() not in GENERIC_CONTENT_TYPES:
+      return self.content_type.split(';')[0].strip()
+    return sniff_mime_type(self.head()) or 'None'
+
+  @property
+  def mime_category(self) -> str:
+    mime_type = self.mime_type
+    return mime_type.split('/')[0] if '/' in mime_type else mime_type
+
+  def close(self):
+    self._closed = True
+    if self._tmpfile is not None:
+      self._tmpfile.close()
+      self._tmpfile = None
+
+
+def sniff_mime_type(header: bytes) -> Optional[str]:
+  """Detect the type from the first bytes of a file. Returns None if unknown."""
+  for magic, offset, mime_type in MAGIC_BYTES:
+    if header[offset:offset + len(magic)] == magic:
+      return mime_type
+  return None
@@ -0,0 +1,162 @@
+"""
+Sentry tracing and profiling sampling, shared by the Flask app (SentryService) and the Beam ingest workers.
+It lives next to the Beam apps because `beam deploy` only ships this directory; the Flask app imports it as
+`ai_ta_backend.beam.sentry_sampling`. Standard library only.
+
+  sentry_sdk.init(dsn=os.getenv("SENTRY_DSN"), **sentry_sampling_options())
+
+The policy:
+  * SENTRY_RECORD_SAMPLE_RATE of transactions are recorded (more for routes with a higher rate), and the keep/drop
+    decision is made when they finish (before_send_transaction). Recorded transactions that errored, or took longer
+    than SENTRY_SLOW_TRANSACTION_SECONDS, are always kept. Any other is kept so that its route's rate holds overall,
+    using the rate it was actually recorded at.
+  * Route rates default to SENTRY_TRACES_SAMPLE_RATE and can be overridden per route (request path, or
+    transaction name outside Flask) with SENTRY_ROUTE_SAMPLE_RATES, e.g. {"/getTopContexts": 0.02}.
+    Routes with rate 0 (by default / and /metrics) are never recorded.
+  * Under load, once a process would record more than SENTRY_MAX_TRANSACTIONS_PER_MINUTE transactions a minute,
+    it records only that many on average. Recording is what costs time on the request path, and errors still reach
+    Sentry as error events either way.
+  * Profiles are taken for SENTRY_PROFILES_SAMPLE_RATE of the recorded transactions.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+DEFAULT_ROUTE_SAMPLE_RATES = {'/': 0.0, '/metrics': 0.0}
+
+# Set on the active transaction when an exception is captured during it, so handled errors are kept too.
+ERROR_TAG = 'sampling.error_captured'
+
+# Head rates of transactions that haven't finished yet, by span id. Unrecorded ones never finish here, so it's bounded.
+MAX_PENDING_HEAD_RATES = 10_000
+
+
+class SamplingPolicy:
+
+  def __init__(self,
+               traces_sample_rate: float = 0.05,
+               profiles_sample_rate: float = 0.01,
+               route_sample_rates: Optional[Dict[str, float]] = None,
+               slow_transaction_seconds: float = 5.0,
+               max_transactions_per_minute: float = 600,
+               record_sample_rate: float = 0.25):
+    self.traces_sample_rate = traces_sample_rate
+    self.profiles_sample_rate = profiles_sample_rate
+    self.route_sample_rates = {**DEFAULT_ROUTE_SAMPLE_RATES, **(route_sample_rates or {})}
+    self.slow_transaction_seconds = slow_transaction_seconds
+    self.max_transactions_per_minute = max_transactions_per_minute
+    self.record_sample_rate = record_sample_rate
+    self._started: deque = deque()  # (start time, record rate before load shedding) of recent transactions
+    self._to_record = 0.0  # sum of the record rates in `_started`
+    self._head_rates: 'OrderedDict[str, float]' = OrderedDict()
+    self._lock = threading.Lock()
+
+  @classmethod
+  def from_env(cls) -> 'SamplingPolicy':
+    return cls(traces_sample_rate=float(os.getenv('SENTRY_TRACES_SAMPLE_RATE', 0.05)),
+               profiles_sample_rate=float(os.getenv('SENTRY_PROFILES_SAMPLE_RATE', 0.01)),
+               route_sample_rates=json.loads(os.getenv('SENTRY_ROUTE_SAMPLE_RATES') or '{}'),
+               slow_transaction_seconds=float(os.getenv('SENTRY_SLOW_TRANSACTION_SECONDS', 5)),
+               max_transactions_per_minute=float(os.getenv('SENTRY_MAX_TRANSACTIONS_PER_MINUTE', 600)),
+               record_sample_rate=float(os.getenv('SENTRY_RECORD_SAMPLE_RATE', 0.25)))
+
+  def route_rate(self, route: str) -> float:
+    return self.route_sample_rates.get(route, self.traces_sample_rate)
+
+  def load_factor(self) -> float:
+    """Share of the transactions to record that are recorded right now: 1.0 until this process would exceed the
+    per-minute budget."""
+    now = time.monotonic()
+    with self._lock:
+      while self._started and self._started[0][0] < now - 60:
+        self._to_record -= self._started.popleft()[1]
+      to_record_last_minute = self._to_record if self._started else 0.0
+    if to_record_last_minute <= self.max_transactions_per_minute:
+      return 1.0
+    return self.max_transactions_per_minute / to_record_last_minute
+
+  def traces_sampler(self, sampling_context: Dict[str, Any]) -> float:
+    """Head decision: record the transaction or not. The real keep/drop happens in `before_send_transaction`."""
+    parent_sampled = sampling_context.get('parent_sampled')
+    if parent_sampled is not None:
+      head_rate = 1.0 if parent_sampled else 0.0
+    else:
+      route_rate = self.route_rate(_sampling_context_route(sampling_context))
+      if route_rate <= 0:
+        return 0.0
+      record_rate = min(1.0, max(route_rate, self.record_sample_rate))
+      with self._lock:
+        self._started.append((time.monotonic(), record_rate))
+        self._to_record += record_rate
+      head_rate = record_rate * self.load_factor()
+    span_id = (sampling_context.get('transaction_context') or {}).get('span_id')
+    if head_rate > 0 and span_id:
+      with self._lock:
+        self._head_rates[span_id] = head_rate
+        if len(self._head_rates) > MAX_PENDING_HEAD_RATES:
+          self._head_rates.popitem(last=False)
+    return head_rate
+
+  def before_send_transaction(self, event: Dict[str, Any], hint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Tail decision: keep errored and slow transactions, and a route-rate share of the rest."""
+    trace_context = event.get('contexts', {}).get('trace', {})
+    with self._lock:
+      # Unknown if it outlived MAX_PENDING_HEAD_RATES newer transactions, assume it was always going to be recorded.
+      head_rate = self._head_rates.pop(trace_context.get('span_id'), 1.0)
+    if trace_context.get('status') not in (None, 'ok') or event.get('tags', {}).get(ERROR_TAG):
+      return event
+    duration = _duration_seconds(event)
+    if duration is not None and duration >= self.slow_transaction_seconds:
+      return event
+    # Only `head_rate` of these transactions were recorded, keep enough of them that the route rate holds overall.
+    keep_probability = self.route_rate(_event_route(event)) / max(head_rate, 1e-6)
+    return event if random.random() < keep_probability else None
+
+  def before_send(self, event: Dict[str, Any], hint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Error events are always sent, and mark the transaction they happened in as one to keep."""
+    import sentry_sdk
+    transaction = sentry_sdk.Hub.current.scope.transaction
+    if transaction is not None:
+      transaction.set_tag(ERROR_TAG, 'true')
+    return event
+
+
+def sentry_sampling_options(policy: Optional[SamplingPolicy] = None) -> Dict[str, Any]:
+  """Keyword arguments for `sentry_sdk.init` that apply the sampling policy (from the environment by default)."""
+  policy = policy or SamplingPolicy.from_env()
+  return {
+      'traces_sampler': policy.traces_sampler,
+      'profiles_sample_rate': policy.profiles_sample_rate,
+      'before_send_transaction': policy.before_send_transaction,
+      'before_send': policy.before_send,
+  }
+
+
+def _sampling_context_route(sampling_context: Dict[str, Any]) -> str:
+  environ = sampling_context.get('wsgi_environ')
+  if environ:
+    return environ.get('PATH_INFO') or '/'
+  return (sampling_context.get('transaction_context') or {}).get('name') or ''
+
+
+def _event_route(event: Dict[str, Any]) -> str:
+  url = (event.get('request') or {}).get('url')
+  if url:
+    return urlparse(url).path or '/'
+  return event.get('transaction') or ''
+
+
+def _duration_seconds(event: Dict[str, Any]) -> Optional[float]:
+  start, end = event.get('start_timestamp'), event.get('timestamp')
+  if isinstance(start, datetime) and isinstance(end, datetime):
+    return (end - start).total_seconds()
+  if isinstance(start, (int, float)) and isinstance(end, (int, float)):
+    return end - start
+  return None
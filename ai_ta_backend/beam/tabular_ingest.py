@@ -0,0 +1,133 @@
+"""
+Columnar ingest for CSV and Excel files.
+
+`CSVLoader` made one document per row and Unstructured's element mode one per cell group, so a modest sheet
+became thousands of near-empty chunks and embedding inputs. Here rows are streamed (pandas reads CSVs in
+chunks, openpyxl reads workbooks in read-only mode) and packed into blocks of at most `max_tokens` tokens.
+Every block starts with the sheet name, its row range and the header line, so each chunk is readable on its own.
+Only the block texts are kept in memory, never the whole table.
+"""
+
+import os
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+
+import tiktoken
+
+# Blocks stay above half the ingest chunk size (2,000 tokens) so the splitter never merges two of them.
+TABULAR_BLOCK_TOKENS = int(os.getenv('TABULAR_BLOCK_TOKENS', 1_500))
+CSV_READ_ROWS = 10_000
+COLUMN_SEPARATOR = ' | '
+
+# openpyxl only reads the OOXML formats, anything else goes through Unstructured.
+OPENPYXL_SUFFIXES = {'.xlsx', '.xlsm', '.xltx', '.xltm'}
+
+
+def csv_row_blocks(path: str, max_tokens: int = TABULAR_BLOCK_TOKENS, encoding_name: str = 'cl100k_base') -> List[str]:
+  """Read a CSV `CSV_READ_ROWS` rows at a time and pack it into header-prefixed blocks. Empty for an empty file."""
+  import pandas as pd
+
+  def rows() -> Iterator[List[str]]:
+    try:
+      reader = pd.read_csv(path,
+                           chunksize=CSV_READ_ROWS,
+                           dtype=str,
+                           keep_default_na=False,
+                           skip_blank_lines=True,
+                           on_bad_lines='warn',
+                           encoding_errors='replace')
+    except pd.errors.EmptyDataError:
+      return  # no header row, nothing to ingest
+    first = True
+    for frame in reader:
+      if first:
+        yield [_header_name(column) for column in frame.columns]
+        first = False
+      yield from frame.itertuples(index=False, name=None)
+
+  return list(pack_rows(rows(), max_tokens=max_tokens, encoding_name=encoding_name))
+
+
+def excel_row_blocks(path: str,
+                     max_tokens: int = TABULAR_BLOCK_TOKENS,
+                     encoding_name: str = 'cl100k_base') -> List[str]:
+  """Stream every sheet of an .xlsx-family workbook into header-prefixed blocks. The first non-empty row of a sheet
+  is its header."""
+  from openpyxl import load_workbook
+
+  workbook = load_workbook(path, read_only=True, data_only=True)
+  try:
+    blocks: List[str] = []
+    for sheet in workbook.worksheets:
+      blocks.extend(
+          pack_rows(sheet.iter_rows(values_only=True),
+                    sheet_name=sheet.title,
+                    max_tokens=max_tokens,
+                    encoding_name=encoding_name))
+    return blocks
+  finally:
+    workbook.close()
+
+
+def pack_rows(rows: Iterable[Sequence[Any]],
+              sheet_name: Optional[str] = None,
+              max_tokens: int = TABULAR_BLOCK_TOKENS,
+              encoding_name: str = 'cl100k_base') -> Iterator[str]:
+  """
+  Pack rows into text blocks of at most `max_tokens` tokens (a single longer row gets a block of its own).
+  The first non-empty row is the header and is repeated at the top of every block. Each row is tokenized once.
+  """
+  encoding = tiktoken.get_encoding(encoding_name)
+  header: Optional[str] = None
+  block: List[str] = []
+  block_tokens = 0
+  first_row = last_row = 0
+  row_number = 0
+
+  def close_block() -> Iterator[str]:
+    if block:
+      title = f"Sheet: {sheet_name}, " if sheet_name else ''
+      yield f"{title}rows {first_row}-{last_row}\n{header}\n" + '\n'.join(block)
+
+  for values in rows:
+    row_number += 1
+    line = _format_row(values)
+    if not line:
+      continue
+    if header is None:
+      header = line
+      header_tokens = len(encoding.encode_ordinary(header)) + 10  # + the sheet/row range line
+      continue
+    line_tokens = len(encoding.encode_ordinary(line)) + 1
+    if block and header_tokens + block_tokens + line_tokens > max_tokens:
+      yield from close_block()
+      block, block_tokens = [], 0
+    if not block:
+      first_row = row_number
+    block.append(line)
+    block_tokens += line_tokens
+    last_row = row_number
+  if block:
+    yield from close_block()
+  elif header is not None:
+    yield header  # a sheet with only a header row
+
+
+def _format_row(values: Sequence[Any]) -> str:
+  """The row's cells joined by `COLUMN_SEPARATOR`, without its trailing empty cells. Empty for an empty row."""
+  cells = [_format_cell(value) for value in values]
+  while cells and not cells[-1]:
+    cells.pop()
+  return COLUMN_SEPARATOR.join(cells)
+
+
+def _format_cell(value: Any) -> str:
+  if value is None:
+    return ''
+  if isinstance(value, float) and value.is_integer():
+    value = int(value)
+  return ' '.join(str(value).split())  # one row per line, whatever newlines the cell had
+
+
+def _header_name(column: Any) -> str:
+  name = str(column)
+  return '' if name.startswith('Unnamed: ') else name
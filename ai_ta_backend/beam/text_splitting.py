@@ -0,0 +1,130 @@
+"""
+Token-aware text splitting for ingest.
+
+Replaces `RecursiveCharacterTextSplitter.from_tiktoken_encoder`, which was rebuilt (loading the encoder) on every
+`split_and_upload` call and re-tokenized every candidate piece while recursing through separators. Here each
+text is tokenized once and cut directly on token offsets, preferring the latest paragraph, line, sentence or word
+boundary before the chunk size. Runs of tiny documents with the same metadata (e.g. the thousands of
+elements a spreadsheet loader yields) are merged into full chunks instead of becoming one chunk each.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import tiktoken
+from langchain.schema import Document
+
+# Boundary ranks, best first. A cut before token i is ranked by the text around it.
+PARAGRAPH, LINE, SENTENCE, WORD, ANYWHERE = 4, 3, 2, 1, 0
+SENTENCE_ENDS = ('.', '?', '!')
+MERGE_SEPARATOR = '\n\n'
+
+
+class TokenTextSplitter:
+
+  def __init__(self, chunk_size: int = 2_000, chunk_overlap: int = 150, encoding_name: str = 'cl100k_base'):
+    if chunk_overlap >= chunk_size:
+      raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+    self.chunk_size = chunk_size
+    self.chunk_overlap = chunk_overlap
+    self.encoding = tiktoken.get_encoding(encoding_name)
+    self.separator_tokens = len(self.encoding.encode(MERGE_SEPARATOR))
+
+  def create_documents(self,
+                       texts: Sequence[str],
+                       metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> List[Document]:
+    """
+    Chunk `texts` into Documents, in order. Consecutive texts with equal metadata are joined (up to `chunk_size`
+    tokens) before chunking, longer texts are split. Each Document gets its own copy of the metadata.
+    """
+    metadatas = metadatas if metadatas is not None else [{} for _ in texts]
+    documents: List[Document] = []
+    group: List[str] = []
+    group_metadata: Dict[str, Any] = {}
+    group_tokens = 0
+
+    def close_group():
+      nonlocal group, group_tokens
+      if group:
+        documents.append(Document(page_content=MERGE_SEPARATOR.join(group), metadata=dict(group_metadata)))
+      group, group_tokens = [], 0
+
+    for text, metadata in zip(texts, metadatas):
+      text = text.strip()
+      if not text:
+        continue
+      tokens = self.encoding.encode(text, disallowed_special=())
+      if len(tokens) > self.chunk_size:
+        close_group()
+        documents.extend(Document(page_content=chunk, metadata=dict(metadata)) for chunk in self._split_tokens(tokens))
+        continue
+      if group and (metadata != group_metadata or group_tokens + self.separator_tokens + len(tokens) > self.chunk_size):
+        close_group()
+      if not group:
+        group_metadata = metadata
+      group.append(text)
+      group_tokens += len(tokens) + (self.separator_tokens if len(group) > 1 else 0)
+    close_group()
+    return documents
+
+  def split_text(self, text: str) -> List[str]:
+    tokens = self.encoding.encode(text, disallowed_special=())
+    if len(tokens) <= self.chunk_size:
+      return [text.strip()] if text.strip() else []
+    return self._split_tokens(tokens)
+
+  def _split_tokens(self, tokens: List[int]) -> List[str]:
+    text, offsets = self.encoding.decode_with_offsets(tokens)
+    num_tokens = len(tokens)
+    chunks: List[str] = []
+    start = 0
+    while start < num_tokens:
+      end = num_tokens
+      if start + self.chunk_size < num_tokens:
+        # latest best boundary in the back half of the window
+        end = self._best_cut(text, offsets, start + self.chunk_size, start + self.chunk_size // 2, latest=True)
+      chunk = text[offsets[start]:offsets[end] if end < num_tokens else len(text)].strip()
+      if chunk:
+        chunks.append(chunk)
+      if end >= num_tokens:
+        break
+      next_start = end
+      if self.chunk_overlap:
+        # earliest best boundary within the overlap, so the next chunk starts on a clean break
+        next_start = self._best_cut(text, offsets, end - 1, end - self.chunk_overlap, latest=False)
+      start = max(next_start, start + 1)
+    return chunks
+
+  def _best_cut(self, text: str, offsets: List[int], high: int, low: int, latest: bool) -> int:
+    """Best ranked cut position in [low, high]. Ties go to the latest (or earliest) position."""
+    low = max(low, 1)
+    positions = range(high, low - 1, -1) if latest else range(low, high + 1)
+    best, best_rank = high if latest else low, -1
+    for i in positions:
+      rank = _boundary_rank(text, offsets[i])
+      if rank > best_rank:
+        best, best_rank = i, rank
+        if rank == PARAGRAPH:
+          break
+    return best
+
+
+def _boundary_rank(text: str, cut: int) -> int:
+  before, after = text[max(0, cut - 2):cut], text[cut:cut + 1]
+  if before.endswith('\n\n'):
+    return PARAGRAPH
+  if before.endswith('\n'):
+    return LINE
+  if before.endswith(SENTENCE_ENDS) and (after.isspace() or not after):
+    return SENTENCE
+  if before[:1] in SENTENCE_ENDS and before.endswith(' '):
+    return SENTENCE
+  if after.isspace() or before[-1:].isspace():
+    return WORD
+  return ANYWHERE
+
+
+@lru_cache(maxsize=None)
+def get_text_splitter(chunk_size: int = 2_000, chunk_overlap: int = 150) -> TokenTextSplitter:
+  """Shared splitter per configuration, so the encoder is only loaded once per process."""
+  return TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
@@ -1,11 +1,12 @@
 import os
-from typing import Dict, TypedDict, List, Union
-
-from injector import inject
+from typing import Dict, List, TypedDict, Union
 
 import supabase
+from injector import inject
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from ai_ta_backend.utils.metrics import instrument_dependency_methods
+
 
 class ProjectStats(TypedDict):
     total_messages: int
@@ -26,6 +27,8 @@ class ModelUsage(TypedDict):
     count: int
     percentage: float
 
+
+@instrument_dependency_methods('supabase')
 class SQLDatabase:
 
   @inject
@@ -8,7 +8,10 @@ from langchain.vectorstores import Qdrant
 from qdrant_client import QdrantClient, models
 from qdrant_client.http.models import FieldCondition, MatchAny, MatchValue
 
+from ai_ta_backend.utils.metrics import instrument_dependency_methods
 
+
+@instrument_dependency_methods('qdrant')
 class VectorDatabase():
   """
   Contains all methods for building and using vector databases.
@@ -1,6 +1,8 @@
 from flask_executor import Executor
 from injector import inject
 
+from ai_ta_backend.utils.metrics import track_executor_task
+
 
 class ExecutorInterface:
 
@@ -20,4 +22,4 @@ class FlaskExecutorAdapter(ExecutorInterface):
     self.executor = executor
 
   def submit(self, fn, *args, **kwargs):
-    return self.executor.submit(fn, *args, **kwargs)
+    return track_executor_task('flask', fn, self.executor.submit(fn, *args, **kwargs))
@@ -1,5 +1,7 @@
 from concurrent.futures import ProcessPoolExecutor
 
+from ai_ta_backend.utils.metrics import track_executor_task
+
 
 class ProcessPoolExecutorInterface:
 
@@ -23,7 +25,7 @@ class ProcessPoolExecutorAdapter(ProcessPoolExecutorInterface):
     self.executor = ProcessPoolExecutor(max_workers=max_workers)
 
   def submit(self, fn, *args, **kwargs):
-    return self.executor.submit(fn, *args, **kwargs)
+    return track_executor_task('process_pool', fn, self.executor.submit(fn, *args, **kwargs))
 
   def map(self, fn, *iterables, timeout=None, chunksize=1):
     return self.executor.map(fn, *iterables, timeout=timeout, chunksize=chunksize)
@@ -9,6 +9,7 @@ from flask import (
     Flask,
     Response,
     abort,
+    g,
     jsonify,
     make_response,
     request,
@@ -42,8 +43,19 @@ from ai_ta_backend.service.retrieval_service import RetrievalService
 from ai_ta_backend.service.sentry_service import SentryService
 from ai_ta_backend.service.workflow_service import WorkflowService
 from ai_ta_backend.utils.email.send_transactional_email import send_email
+from ai_ta_backend.utils.metrics import (
+    HTTP_REQUEST_DURATION_SECONDS,
+    HTTP_REQUESTS_IN_PROGRESS,
+    HTTP_REQUESTS_TOTAL,
+    render_metrics,
+)
 from ai_ta_backend.utils.pubmed_extraction import extractPubmedData
 from ai_ta_backend.utils.rerun_webcrawl_for_project import webscrape_documents
+from ai_ta_backend.utils.stage_timing import (
+    end_request,
+    server_timing_header,
+    start_request,
+)
 
 app = Flask(__name__)
 CORS(app)
@@ -55,6 +67,32 @@ executor = Executor(app)
 load_dotenv()
 
 
+@app.before_request
+def start_request_metrics() -> None:
+  g.request_start_time = time.monotonic()
+  HTTP_REQUESTS_IN_PROGRESS.inc()
+  start_request()
+
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+  server_timing = server_timing_header()
+  if server_timing:
+    response.headers['Server-Timing'] = server_timing
+  if 'request_start_time' in g:
+    endpoint = request.endpoint or 'unmatched'
+    HTTP_REQUESTS_TOTAL.labels(request.method, endpoint, response.status_code).inc()
+    HTTP_REQUEST_DURATION_SECONDS.labels(request.method, endpoint).observe(time.monotonic() - g.request_start_time)
+  return response
+
+
+@app.teardown_request
+def end_request_metrics(exception) -> None:
+  if 'request_start_time' in g:
+    HTTP_REQUESTS_IN_PROGRESS.dec()
+  end_request()
+
+
 @app.route('/')
 def index() -> Response:
   """_summary_
@@ -71,6 +109,13 @@ def index() -> Response:
   return response
 
 
+@app.route('/metrics')
+def metrics() -> Response:
+  """Prometheus metrics, aggregated over all gunicorn workers. See ai_ta_backend/utils/metrics.py."""
+  payload, content_type = render_metrics()
+  return Response(payload, content_type=content_type)
+
+
 @app.route('/getTopContexts', methods=['POST'])
 def getTopContexts(service: RetrievalService) -> Response:
   """Get most relevant contexts for a given search query.
@@ -108,7 +153,6 @@ def getTopContexts(service: RetrievalService) -> Response:
   Exception
       Testing how exceptions are handled.
   """
-  start_time = time.monotonic()
   data = request.get_json()
   search_query: str = data.get('search_query', '')
   course_name: str = data.get('course_name', '')
@@ -126,7 +170,6 @@ def getTopContexts(service: RetrievalService) -> Response:
   found_documents = asyncio.run(service.getTopContexts(search_query, course_name, doc_groups, top_n))
   response = jsonify(found_documents)
   response.headers.add('Access-Control-Allow-Origin', '*')
-  print(f"⏰ Runtime of getTopContexts in main.py: {(time.monotonic() - start_time):.2f} seconds")
   return response
 
 
@@ -12,6 +12,7 @@ from tenacity import retry, stop_after_attempt, wait_exponential
 
 from ai_ta_backend.database.sql import SQLDatabase
 from ai_ta_backend.service.sentry_service import SentryService
+from ai_ta_backend.utils.embedding_codec import decode_context_embeddings
 
 from ollama import Client
 
@@ -755,31 +756,36 @@ class NomicService():
             created_at = datetime.datetime.strptime(row['created_at'], 
                                                   "%Y-%m-%dT%H:%M:%S.%f%z")
 
-            for idx, context in enumerate(row['contexts'], 1):
-                # Validate embedding before adding
-                embedding = context.get('embedding')
-                if embedding is not None and isinstance(embedding, (list, np.ndarray)):
-                    # Convert to list if numpy array
-                    if isinstance(embedding, np.ndarray):
-                        embedding = embedding.tolist()
-                    
-                    # Check if embedding has the expected dimension
-                    if len(embedding) > 0:  # Add your expected dimension check here
-                        embeddings.append(embedding)
-                        metadata.append({
-                            "id": f"{row['id']}_{idx}",
-                            "created_at": created_at,
-                            "s3_path": row['s3_path'],
-                            "url": row['url'] or "",
-                            "base_url": row['base_url'] or "",
-                            "readable_filename": row['readable_filename'],
-                            "modified_at": current_time,
-                            "text": context['text']
-                        })
+            # Decoded straight from the float32 blob (or legacy JSON lists), row i belongs to contexts[i]
+            try:
+                row_embeddings = decode_context_embeddings(row)
+            except ValueError as e:
+                # blob doesn't match the row's contexts, skip this document rather than the whole map
+                print(f"Skipping document {row['id']}, unreadable embeddings: {e}")
+                continue
+            if not row_embeddings.size:
+                continue
+            if embeddings and row_embeddings.shape[1] != embeddings[0].shape[0]:
+                print(f"Skipping document {row['id']}, embeddings have {row_embeddings.shape[1]} dimensions, "
+                      f"expected {embeddings[0].shape[0]}")
+                continue
+
+            for idx, (context, embedding) in enumerate(zip(row['contexts'], row_embeddings), 1):
+                embeddings.append(embedding)
+                metadata.append({
+                    "id": f"{row['id']}_{idx}",
+                    "created_at": created_at,
+                    "s3_path": row['s3_path'],
+                    "url": row['url'] or "",
+                    "base_url": row['base_url'] or "",
+                    "readable_filename": row['readable_filename'],
+                    "modified_at": current_time,
+                    "text": context['text']
+                })
 
         # Convert to numpy array only if we have valid embeddings
         if embeddings and len(embeddings) > 20:
-            embeddings = np.array(embeddings)
+            embeddings = np.vstack(embeddings)
             print(f"Embeddings shape: {embeddings.shape}")
             return [embeddings, pd.DataFrame(metadata)]
         else:
@@ -1,10 +1,30 @@
+import atexit
+import json
 import os
+import queue
+import random
 
 from injector import inject
 from posthog import Posthog
 
+from ai_ta_backend.utils.metrics import (
+    ANALYTICS_EVENTS_DROPPED_TOTAL,
+    ANALYTICS_EVENTS_TOTAL,
+)
+
+DISTINCT_ID = "distinct_id_of_the_user"
+
 
 class PosthogService:
+  """
+  `capture` only puts the event on the PostHog client's queue; the client's consumer thread uploads it in batches
+  (POSTHOG_FLUSH_AT events, or every POSTHOG_FLUSH_INTERVAL_SECONDS). The queue holds at most POSTHOG_BUFFER_SIZE
+  events. If PostHog falls behind, the oldest queued event is dropped to make room, the request never waits.
+  Whatever is queued at exit is flushed.
+
+  High-volume events can be sampled with POSTHOG_EVENT_SAMPLE_RATES, e.g. {"getTopContexts_success_DI": 0.1}.
+  Sampled events carry a `sample_rate` property to weight them by.
+  """
 
   @inject
   def __init__(self):
@@ -12,7 +32,39 @@ class PosthogService:
         sync_mode=False,
         project_api_key=os.environ["POSTHOG_API_KEY"],
         host="https://app.posthog.com",
+        max_queue_size=int(os.getenv('POSTHOG_BUFFER_SIZE', 10_000)),
+        flush_at=int(os.getenv('POSTHOG_FLUSH_AT', 100)),
+        flush_interval=float(os.getenv('POSTHOG_FLUSH_INTERVAL_SECONDS', 1.0)),
     )
+    self.sample_rates = json.loads(os.getenv('POSTHOG_EVENT_SAMPLE_RATES') or '{}')
+    # The client only stops its consumer thread at exit, upload what's still queued first.
+    atexit.register(self.posthog.flush)
 
   def capture(self, event_name, properties):
-    self.posthog.capture("distinct_id_of_the_user", event=event_name, properties=properties)
\ No newline at end of file
+    sample_rate = self.sample_rates.get(event_name, 1.0)
+    if sample_rate < 1.0:
+      if random.random() >= sample_rate:
+        ANALYTICS_EVENTS_TOTAL.labels(event_name, 'sampled_out').inc()
+        return
+      properties = {**properties, 'sample_rate': sample_rate}
+
+    if self.posthog.disabled:
+      return
+    queued, _ = self.posthog.capture(DISTINCT_ID, event=event_name, properties=properties)
+    if not queued:
+      # The client's queue is full: the oldest event goes, not this one.
+      self._drop_oldest()
+      queued, _ = self.posthog.capture(DISTINCT_ID, event=event_name, properties=properties)
+    if queued:
+      ANALYTICS_EVENTS_TOTAL.labels(event_name, 'queued').inc()
+    else:
+      ANALYTICS_EVENTS_DROPPED_TOTAL.inc()  # refilled by other requests in the meantime
+
+  def _drop_oldest(self):
+    try:
+      self.posthog.queue.get_nowait()
+    except queue.Empty:
+      return  # the consumer thread emptied it
+    # `flush` joins the queue, so a dropped event still has to be marked done.
+    self.posthog.queue.task_done()
+    ANALYTICS_EVENTS_DROPPED_TOTAL.inc()
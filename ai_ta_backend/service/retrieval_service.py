@@ -29,6 +29,13 @@ from ai_ta_backend.executors.thread_pool_executor import ThreadPoolExecutorAdapt
 # from ai_ta_backend.service.nomic_service import NomicService
 from ai_ta_backend.service.posthog_service import PosthogService
 from ai_ta_backend.service.sentry_service import SentryService
+from ai_ta_backend.utils.metrics import observe_dependency
+from ai_ta_backend.utils.stage_timing import (
+    current_timings,
+    in_request_context,
+    stage,
+    timed_stage,
+)
 
 
 class RetrievalService:
@@ -115,9 +122,9 @@ class RetrievalService:
       with self.thread_pool_executor as executor:
         loop = asyncio.get_event_loop()
         tasks = [
-            loop.run_in_executor(executor, self.sqlDb.getDisabledDocGroups, course_name),
-            loop.run_in_executor(executor, self.sqlDb.getPublicDocGroups, course_name),
-            loop.run_in_executor(executor, self._embed_query_and_measure_latency, search_query, embedding_client)
+            loop.run_in_executor(executor, in_request_context(self._get_disabled_doc_groups), course_name),
+            loop.run_in_executor(executor, in_request_context(self._get_public_doc_groups), course_name),
+            loop.run_in_executor(executor, in_request_context(self._embed_query), search_query, embedding_client)
         ]
 
       disabled_doc_groups_response, public_doc_groups_response, user_query_embedding = await asyncio.gather(*tasks)
@@ -125,9 +132,6 @@ class RetrievalService:
       disabled_doc_groups = [doc_group['name'] for doc_group in disabled_doc_groups_response.data]
       public_doc_groups = [doc_group['doc_groups'] for doc_group in public_doc_groups_response.data]
 
-      time_for_parallel_operations = time.monotonic() - start_time_overall
-      start_time_vector_search = time.monotonic()
-
       # Perform vector search
       found_docs: list[Document] = self.vector_search(search_query=search_query,
                                                       course_name=course_name,
@@ -137,32 +141,32 @@ class RetrievalService:
                                                       public_doc_groups=public_doc_groups,
                                                       top_n=top_n)
 
-      time_to_retrieve_docs = time.monotonic() - start_time_vector_search
-
       valid_docs = []
       for doc in found_docs:
         valid_docs.append(doc)
 
-      print(f"Course: {course_name} ||| search_query: {search_query}\n"
-            f"⏰ Runtime of getTopContexts: {(time.monotonic() - start_time_overall):.2f} seconds\n"
-            f"Runtime for parallel operations: {time_for_parallel_operations:.2f} seconds, "
-            f"Runtime to complete vector_search: {time_to_retrieve_docs:.2f} seconds")
-      if len(valid_docs) == 0:
-        return []
-
+      # One event per search, it replaces vector_search_invoked and vector_search_succeeded.
+      timings = current_timings()
       self.posthog.capture(
           event_name="getTopContexts_success_DI",
           properties={
               "user_query": search_query,
               "course_name": course_name,
+              "doc_groups": doc_groups,
               # "total_tokens_used": token_counter,
               "total_contexts_used": len(valid_docs),
               "total_unique_docs_retrieved": len(found_docs),
+              "qdrant_latency_sec": timings.get('vector_search'),
+              "openai_embedding_latency_sec": timings.get('embedding'),
               "getTopContext_total_latency_sec": time.monotonic() - start_time_overall,
           },
       )
 
-      return self.format_for_json(valid_docs)
+      if len(valid_docs) == 0:
+        return []
+
+      with stage('format'):
+        return self.format_for_json(valid_docs)
     except Exception as e:
       # return full traceback to front end
       # err: str = f"ERROR: In /getTopContexts. Course: {course_name} ||| search_query: {search_query}\nTraceback: {traceback.extract_tb(e.__traceback__)}❌❌ Error in {inspect.currentframe().f_code.co_name}:\n{e}"  # type: ignore
@@ -540,12 +544,18 @@ class RetrievalService:
     if public_doc_groups is None:
       public_doc_groups = []
 
-    # Capture the search invoked event to PostHog
-    self._capture_search_invoked_event(search_query, course_name, doc_groups)
-
     # Perform the vector search
-    start_time_vector_search = time.monotonic()
+    with stage('vector_search'):
+      search_results = self._search_vector_database(search_query, course_name, doc_groups, user_query_embedding,
+                                                    disabled_doc_groups, public_doc_groups, top_n)
 
+    # Process the search results by extracting the page content and metadata
+    with stage('process_results'):
+      found_docs = self._process_search_results(search_results, course_name)
+    return found_docs
+
+  def _search_vector_database(self, search_query, course_name, doc_groups, user_query_embedding, disabled_doc_groups,
+                              public_doc_groups, top_n):
     # ----------------------------
     # SPECIAL CASE FOR VYRIAD, CROPWIZARD
     # ----------------------------
@@ -561,39 +571,21 @@ class RetrievalService:
     else:
       search_results = self.vdb.vector_search(search_query, course_name, doc_groups, user_query_embedding, top_n,
                                               disabled_doc_groups, public_doc_groups)
-    self.qdrant_latency_sec = time.monotonic() - start_time_vector_search
+    return search_results
 
-    # Process the search results by extracting the page content and metadata
-    start_time_process_search_results = time.monotonic()
-    found_docs = self._process_search_results(search_results, course_name)
-    time_for_process_search_results = time.monotonic() - start_time_process_search_results
-
-    # Capture the search succeeded event to PostHog with the vector scores
-    start_time_capture_search_succeeded_event = time.monotonic()
-    self._capture_search_succeeded_event(search_query, course_name, search_results)
-    time_for_capture_search_succeeded_event = time.monotonic() - start_time_capture_search_succeeded_event
-
-    print(f"Runtime for embedding query: {self.openai_embedding_latency:.2f} seconds\n"
-          f"Runtime for vector search: {self.qdrant_latency_sec:.2f} seconds\n"
-          f"Runtime for process search results: {time_for_process_search_results:.2f} seconds\n"
-          f"Runtime for capture search succeeded event: {time_for_capture_search_succeeded_event:.2f} seconds")
-    return found_docs
+  @timed_stage('disabled_doc_groups')
+  def _get_disabled_doc_groups(self, course_name):
+    return self.sqlDb.getDisabledDocGroups(course_name)
 
-  def _embed_query_and_measure_latency(self, search_query, embedding_client):
-    openai_start_time = time.monotonic()
-    user_query_embedding = embedding_client.embed_query(search_query)
-    self.openai_embedding_latency = time.monotonic() - openai_start_time
-    return user_query_embedding
-
-  def _capture_search_invoked_event(self, search_query, course_name, doc_groups):
-    self.posthog.capture(
-        event_name="vector_search_invoked",
-        properties={
-            "user_query": search_query,
-            "course_name": course_name,
-            "doc_groups": doc_groups,
-        },
-    )
+  @timed_stage('public_doc_groups')
+  def _get_public_doc_groups(self, course_name):
+    return self.sqlDb.getPublicDocGroups(course_name)
+
+  @timed_stage('embedding')
+  def _embed_query(self, search_query, embedding_client):
+    dependency = 'ollama' if embedding_client is self.nomic_embeddings else 'openai'
+    with observe_dependency(dependency, 'embed_query'):
+      return embedding_client.embed_query(search_query)
 
   def _process_search_results(self, search_results, course_name):
     found_docs: list[Document] = []
@@ -612,24 +604,6 @@ class RetrievalService:
         self.sentry.capture_exception(e)
     return found_docs
 
-  def _capture_search_succeeded_event(self, search_query, course_name, search_results):
-    vector_score_calc_latency_sec = time.monotonic()
-    # Removed because it takes 0.15 seconds to _calculate_vector_scores... not worth it rn.
-    # max_vector_score, min_vector_score, avg_vector_score = self._calculate_vector_scores(search_results)
-    self.posthog.capture(
-        event_name="vector_search_succeeded",
-        properties={
-            "user_query": search_query,
-            "course_name": course_name,
-            "qdrant_latency_sec": self.qdrant_latency_sec,
-            "openai_embedding_latency_sec": self.openai_embedding_latency,
-            # "max_vector_score": max_vector_score,
-            # "min_vector_score": min_vector_score,
-            # "avg_vector_score": avg_vector_score,
-            "vector_score_calculation_latency_sec": time.monotonic() - vector_score_calc_latency_sec,
-        },
-    )
-
   def _calculate_vector_scores(self, search_results):
     max_vector_score = 0
     min_vector_score = 0
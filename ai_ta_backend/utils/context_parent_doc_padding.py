@@ -5,6 +5,8 @@ from functools import partial
 from multiprocessing import Manager
 
 DOCUMENTS_TABLE = os.environ['SUPABASE_DOCUMENTS_TABLE']
+# Everything padding reads. Skips the embeddings blob, padding never needs it.
+PADDING_COLUMNS = 'readable_filename, s3_path, url, base_url, contexts'
 # SUPABASE_CLIENT = supabase.create_client(supabase_url=os.environ['SUPABASE_URL'],
 #  supabase_key=os.environ['SUPABASE_API_KEY'])  # type: ignore
 
@@ -68,14 +70,13 @@ def supabase_context_padding(doc, course_name, result_docs):
   # query by url or s3_path
   if 'url' in doc.metadata.keys() and doc.metadata['url']:
     parent_doc_id = doc.metadata['url']
-    response = SUPABASE_CLIENT.table(DOCUMENTS_TABLE).select('*').eq('course_name',
-                                                                     course_name).eq('url', parent_doc_id).execute()
+    response = SUPABASE_CLIENT.table(DOCUMENTS_TABLE).select(PADDING_COLUMNS).eq('course_name', course_name).eq(
+        'url', parent_doc_id).execute()
 
   else:
     parent_doc_id = doc.metadata['s3_path']
-    response = SUPABASE_CLIENT.table(DOCUMENTS_TABLE).select('*').eq('course_name',
-                                                                     course_name).eq('s3_path',
-                                                                                     parent_doc_id).execute()
+    response = SUPABASE_CLIENT.table(DOCUMENTS_TABLE).select(PADDING_COLUMNS).eq('course_name', course_name).eq(
+        's3_path', parent_doc_id).execute()
 
   data = response.data
 
@@ -0,0 +1,27 @@
+import base64
+from typing import Dict
+
+import numpy as np
+
+
+def decode_context_embeddings(document: Dict) -> np.ndarray:
+  """
+  Embeddings of a Supabase documents row, as a (num_contexts, dims) float32 array. Row i is `contexts[i]`.
+
+  New rows store them in `context_embeddings`, one base64 float32 (little-endian) blob written by ingest.
+  Older rows have a JSON float list under `contexts[i]['embedding']`, those are decoded the slow way.
+  Returns an empty (0, 0) array if the row has no embeddings.
+  """
+  # also accepts a pandas row, where missing values are NaN
+  contexts = document.get('contexts')
+  contexts = contexts if isinstance(contexts, list) else []
+  blob = document.get('context_embeddings')
+  if isinstance(blob, str) and blob:
+    embeddings = np.frombuffer(base64.b64decode(blob), dtype='<f4')
+    num_rows = len(contexts) or 1
+    return embeddings.reshape(num_rows, -1)
+
+  legacy_embeddings = [context.get('embedding') for context in contexts]
+  if not contexts or not all(isinstance(embedding, list) and embedding for embedding in legacy_embeddings):
+    return np.zeros((0, 0), dtype=np.float32)
+  return np.asarray(legacy_embeddings, dtype=np.float32)
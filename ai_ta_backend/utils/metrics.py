@@ -0,0 +1,131 @@
+"""
+Prometheus metrics for the Flask backend, served on /metrics.
+
+Under gunicorn every worker is its own process. run.sh sets PROMETHEUS_MULTIPROC_DIR so each worker writes its
+samples there and `render_metrics()` aggregates all of them; gunicorn.conf.py clears the directory on start and
+marks exited workers dead. Without PROMETHEUS_MULTIPROC_DIR (e.g. `flask run`) the process's own registry is served.
+
+  http_requests_total / http_request_duration_seconds   per route (Flask endpoint), see main.py
+  http_requests_in_progress                             summed over live workers
+  executor_pending_tasks                                submitted but not finished, per executor adapter
+  executor_tasks_total / executor_task_duration_seconds background jobs by function and outcome
+  dependency_request_duration_seconds / dependency_errors_total   Qdrant, Supabase, OpenAI and Ollama calls
+  analytics_events_total / analytics_events_dropped_total          PostHog events queued, sampled out or dropped
+  request_stage_duration_seconds                        see utils/stage_timing.py
+"""
+
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300)
+
+HTTP_REQUESTS_TOTAL = Counter('http_requests_total', 'Requests handled, by route and status',
+                              ['method', 'endpoint', 'status'])
+HTTP_REQUEST_DURATION_SECONDS = Histogram('http_request_duration_seconds',
+                                          'Time to handle a request, by route', ['method', 'endpoint'],
+                                          buckets=LATENCY_BUCKETS)
+HTTP_REQUESTS_IN_PROGRESS = Gauge('http_requests_in_progress',
+                                  'Requests being handled right now',
+                                  multiprocess_mode='livesum')
+
+EXECUTOR_PENDING_TASKS = Gauge('executor_pending_tasks',
+                               'Tasks submitted to an executor that have not finished (queued or running)',
+                               ['executor'],
+                               multiprocess_mode='livesum')
+EXECUTOR_TASKS_TOTAL = Counter('executor_tasks_total', 'Finished executor tasks, by function and outcome',
+                               ['executor', 'task', 'status'])
+EXECUTOR_TASK_DURATION_SECONDS = Histogram('executor_task_duration_seconds',
+                                           'Time from submitting a task to it finishing, queueing included',
+                                           ['executor', 'task'],
+                                           buckets=LATENCY_BUCKETS + (900, 1800, 3600))
+
+DEPENDENCY_REQUEST_DURATION_SECONDS = Histogram('dependency_request_duration_seconds',
+                                                'Latency of calls to external services', ['dependency', 'operation'],
+                                                buckets=LATENCY_BUCKETS)
+DEPENDENCY_ERRORS_TOTAL = Counter('dependency_errors_total', 'Calls to external services that raised',
+                                  ['dependency', 'operation'])
+
+ANALYTICS_EVENTS_TOTAL = Counter('analytics_events_total', 'PostHog events captured, by event and outcome',
+                                 ['event', 'outcome'])
+ANALYTICS_EVENTS_DROPPED_TOTAL = Counter('analytics_events_dropped_total',
+                                         'PostHog events dropped because the client queue was full, oldest first')
+
+
+def render_metrics() -> Tuple[bytes, str]:
+  """The /metrics payload and its content type."""
+  if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+  else:
+    registry = REGISTRY
+  return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+@contextmanager
+def observe_dependency(dependency: str, operation: str):
+  """Time a call to an external service, counting it as an error if it raises."""
+  start_time = time.monotonic()
+  try:
+    yield
+  except Exception:
+    DEPENDENCY_ERRORS_TOTAL.labels(dependency, operation).inc()
+    raise
+  finally:
+    DEPENDENCY_REQUEST_DURATION_SECONDS.labels(dependency, operation).observe(time.monotonic() - start_time)
+
+
+def instrument_dependency_methods(dependency: str) -> Callable[[type], type]:
+  """Class decorator: every public method becomes an `observe_dependency(dependency, <method name>)` call."""
+
+  def decorator(cls: type) -> type:
+    for name, method in list(vars(cls).items()):
+      if name.startswith('_') or not inspect.isfunction(method):
+        continue
+      setattr(cls, name, _observed(dependency, name, method))
+    return cls
+
+  return decorator
+
+
+def _observed(dependency: str, operation: str, method: Callable) -> Callable:
+
+  @functools.wraps(method)
+  def observed(*args, **kwargs):
+    with observe_dependency(dependency, operation):
+      return method(*args, **kwargs)
+
+  return observed
+
+
+def track_executor_task(executor_name: str, fn: Callable, future):
+  """Count `future` as pending on `executor_name` until it finishes, then record how it went. Returns `future`."""
+  task = getattr(fn, '__name__', type(fn).__name__)
+  submitted_at = time.monotonic()
+  EXECUTOR_PENDING_TASKS.labels(executor_name).inc()
+
+  def on_done(done_future):
+    EXECUTOR_PENDING_TASKS.labels(executor_name).dec()
+    if done_future.cancelled():
+      status = 'cancelled'
+    else:
+      status = 'failed' if done_future.exception() is not None else 'succeeded'
+    EXECUTOR_TASKS_TOTAL.labels(executor_name, task, status).inc()
+    EXECUTOR_TASK_DURATION_SECONDS.labels(executor_name, task).observe(time.monotonic() - submitted_at)
+
+  future.add_done_callback(on_done)
+  return future
@@ -0,0 +1,156 @@
+"""
+Per-request stage timing.
+
+Wrap the expensive steps of a request in `stage('name')` (or decorate them with `@timed_stage('name')`). Each
+stage's wall time is
+  * added to the current request's timings, returned to the client as a `Server-Timing` header (see main.py) and
+    readable with `current_timings()`, e.g. for PostHog event properties,
+  * observed in the `request_stage_duration_seconds{stage}` Prometheus histogram, when prometheus_client is installed,
+  * recorded as an OpenTelemetry span when STAGE_TIMING_OTEL_SPANS is set and opentelemetry is installed.
+
+Timings live in a ContextVar, so concurrent requests (and RetrievalService instances) never see each other's.
+Code that hands work to a thread pool should submit `in_request_context(fn)`, `run_in_executor` does not carry
+the context over by itself.
+
+Set STAGE_TIMING_ENABLED=false to turn it all off: `stage()` then returns a shared no-op context manager and
+`timed_stage()` returns the function unchanged.
+"""
+
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, Optional
+
+STAGE_TIMING_ENABLED = os.getenv('STAGE_TIMING_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+try:
+  from prometheus_client import Histogram
+  STAGE_DURATION_SECONDS = Histogram('request_stage_duration_seconds',
+                                     'Wall time of each stage of a request', ['stage'],
+                                     buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+except ImportError:
+  STAGE_DURATION_SECONDS = None
+
+_tracer = None
+if os.getenv('STAGE_TIMING_OTEL_SPANS'):
+  try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer(__name__)
+  except ImportError:
+    pass
+
+_DISABLED = nullcontext()
+
+
+class RequestTimings:
+  """Seconds per stage for one request, in the order the stages first ran. Stages can run on several threads."""
+
+  def __init__(self):
+    self.start_time = time.monotonic()
+    self.seconds: Dict[str, float] = {}
+    self._lock = threading.Lock()
+
+  def add(self, name: str, seconds: float):
+    with self._lock:
+      self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+
+_request_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar('request_timings',
+                                                                                            default=None)
+
+
+class _Stage:
+
+  __slots__ = ('name', 'start_time', 'span')
+
+  def __init__(self, name: str):
+    self.name = name
+    self.span = None
+
+  def __enter__(self):
+    if _tracer is not None:
+      self.span = _tracer.start_as_current_span(self.name)
+      self.span.__enter__()
+    self.start_time = time.monotonic()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    seconds = time.monotonic() - self.start_time
+    timings = _request_timings.get()
+    if timings is not None:
+      timings.add(self.name, seconds)
+    if STAGE_DURATION_SECONDS is not None:
+      STAGE_DURATION_SECONDS.labels(stage=self.name).observe(seconds)
+    if self.span is not None:
+      self.span.__exit__(exc_type, exc_value, traceback)
+    return False
+
+
+def stage(name: str):
+  """Context manager timing the block as stage `name`."""
+  if not STAGE_TIMING_ENABLED:
+    return _DISABLED
+  return _Stage(name)
+
+
+def timed_stage(name: str) -> Callable[[Callable], Callable]:
+  """Decorator timing every call of a function (sync or async) as stage `name`."""
+
+  def decorator(fn: Callable) -> Callable:
+    if not STAGE_TIMING_ENABLED:
+      return fn
+
+    if inspect.iscoroutinefunction(fn):
+
+      @functools.wraps(fn)
+      async def timed_async(*args, **kwargs):
+        with _Stage(name):
+          return await fn(*args, **kwargs)
+
+      return timed_async
+
+    @functools.wraps(fn)
+    def timed(*args, **kwargs):
+      with _Stage(name):
+        return fn(*args, **kwargs)
+
+    return timed
+
+  return decorator
+
+
+def start_request():
+  """Start collecting stage timings for the request handled in the current context."""
+  if STAGE_TIMING_ENABLED:
+    _request_timings.set(RequestTimings())
+
+
+def end_request():
+  _request_timings.set(None)
+
+
+def current_timings() -> Dict[str, float]:
+  """Seconds per stage of the current request so far. Empty outside a request or when timing is disabled."""
+  timings = _request_timings.get()
+  return dict(timings.seconds) if timings is not None else {}
+
+
+def server_timing_header() -> Optional[str]:
+  """`Server-Timing` header value for the current request, e.g. `embedding;dur=412.3, total;dur=530.9`."""
+  timings = _request_timings.get()
+  if timings is None:
+    return None
+  entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.seconds.items()]
+  entries.append(f"total;dur={(time.monotonic() - timings.start_time) * 1000:.1f}")
+  return ', '.join(entries)
+
+
+def in_request_context(fn: Callable) -> Callable:
+  """`fn` bound to a copy of the current context, so stages it runs on another thread count towards this request."""
+  if not STAGE_TIMING_ENABLED:
+    return fn
+  return functools.partial(contextvars.copy_context().run, fn)
@@ -0,0 +1,87 @@
+"""
+Throughput of OpenAIAPIProcessor against the fake embeddings server, under a simulated rate limit.
+
+The processor is deliberately allowed more than the server will take, so the run measures how well it
+recovers from 429s. Reports wall time, inputs/sec, 429s received, CPU time (an idle-waiting scheduler
+should use a small fraction of the wall time) and peak RSS.
+
+  python benchmarks/embeddings_throughput.py --num_inputs 20000 --server_requests_per_minute 600
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from fake_embeddings_server import (
+    INVALID_INPUT_MARKER,
+    FakeEmbeddingsServer,
+    start_server,
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ai_ta_backend', 'beam'))
+
+from OpenaiEmbeddings import OpenAIAPIProcessor  # noqa: E402
+
+
+async def run(args):
+  server = FakeEmbeddingsServer(max_requests_per_minute=args.server_requests_per_minute,
+                                max_tokens_per_minute=args.server_tokens_per_minute,
+                                latency_seconds=args.latency_seconds)
+  runner, base_url = await start_server(server)
+  try:
+    input_texts = [{
+        'input': f"chunk {i} " + "lorem ipsum dolor sit amet " * args.words_per_input,
+        'model': 'text-embedding-ada-002'
+    } for i in range(args.num_inputs)]
+    if args.num_invalid_inputs:
+      for i in range(args.num_invalid_inputs):
+        input_texts[i * len(input_texts) // args.num_invalid_inputs]['input'] += INVALID_INPUT_MARKER
+
+    oai = OpenAIAPIProcessor(
+        input_prompts_list=input_texts,
+        request_url=f"{base_url}/v1/embeddings",
+        api_key='fake',
+        # ask for more than the server allows, to exercise rate limit handling
+        max_requests_per_minute=args.server_requests_per_minute * args.overcommit,
+        max_tokens_per_minute=args.server_tokens_per_minute * args.overcommit,
+        max_attempts=20,
+        logging_level=logging.ERROR,
+        token_encoding_name='cl100k_base',
+        max_inputs_per_request=args.max_inputs_per_request,
+        max_requests_in_flight=args.max_requests_in_flight,
+        spill_to_disk_path=os.path.join(tempfile.mkdtemp(), 'embeddings.npy') if args.spill_to_disk else None)
+
+    start_wall, start_cpu = time.monotonic(), time.process_time()
+    await oai.process_api_requests_from_file()
+    wall, cpu = time.monotonic() - start_wall, time.process_time() - start_cpu
+  finally:
+    await runner.cleanup()
+
+  num_embedded = int(oai.embedded.sum())
+  print(f"inputs:          {args.num_inputs} ({num_embedded} embedded, {args.num_invalid_inputs} invalid)")
+  print(f"requests:        {server.num_requests} ({server.num_rate_limited} rate limited)")
+  print(f"wall time:       {wall:.2f} s")
+  print(f"throughput:      {num_embedded / wall:.0f} inputs/s")
+  print(f"CPU time:        {cpu:.2f} s ({100 * cpu / wall:.0f}% of wall, includes the fake server)")
+  # ru_maxrss is KB on Linux
+  print(f"peak RSS:        {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--num_inputs', type=int, default=20_000)
+  parser.add_argument('--words_per_input', type=int, default=50)
+  parser.add_argument('--num_invalid_inputs', type=int, default=0)
+  parser.add_argument('--server_requests_per_minute', type=float, default=600)
+  parser.add_argument('--server_tokens_per_minute', type=float, default=5_000_000)
+  parser.add_argument('--overcommit', type=float, default=2.0)
+  parser.add_argument('--latency_seconds', type=float, default=0.05)
+  parser.add_argument('--max_inputs_per_request', type=int, default=256)
+  parser.add_argument('--max_requests_in_flight', type=int, default=50)
+  parser.add_argument('--spill_to_disk', action='store_true')
+  asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,128 @@
+"""
+In-process stand-ins for the S3, Supabase and PostHog clients `Ingest` uses, for benchmarks.
+
+They implement just the calls the ingest path makes, keep everything in memory, and do the work the real
+clients do locally (the Supabase stand-in JSON-encodes inserted rows like postgrest does) so timings stay honest.
+Qdrant needs no stand-in: `QdrantClient(':memory:')` runs the real client in local mode.
+"""
+
+import io
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class FakeS3Client:
+  """Serves objects from a {key: local file path} map. Uploads are kept in memory."""
+
+  def __init__(self, files: Optional[Dict[str, str]] = None):
+    self.files: Dict[str, str] = dict(files or {})
+    self.uploads: Dict[str, bytes] = {}
+
+  def get_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+    if Key in self.uploads:
+      return {'Body': io.BytesIO(self.uploads[Key]), 'ContentType': ''}
+    return {'Body': open(self.files[Key], 'rb'), 'ContentType': ''}
+
+  def upload_fileobj(self, fileobj, Bucket: str, Key: str, **kwargs):
+    self.uploads[Key] = fileobj.read()
+
+  def upload_file(self, Filename: str, Bucket: str, Key: str, **kwargs):
+    self.files[Key] = Filename
+
+  def delete_object(self, Bucket: str, Key: str):
+    self.files.pop(Key, None)
+    self.uploads.pop(Key, None)
+
+
+class _FakeResponse:
+
+  def __init__(self, data: List[Dict[str, Any]]):
+    self.data = data
+    self.count = len(data)
+
+  def __iter__(self):  # `data, count = client.rpc(...).execute()`
+    return iter((('data', self.data), ('count', self.count)))
+
+
+class _FakeQuery:
+  """Chainable like postgrest's request builders. Filters are applied to the in-memory rows on `execute()`."""
+
+  def __init__(self, client: 'FakeSupabaseClient', table_name: str):
+    self.client = client
+    self.table_name = table_name
+    self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+    self.action = 'select'
+    self.payload: Any = None
+
+  def select(self, *columns, **kwargs) -> '_FakeQuery':
+    return self
+
+  def insert(self, payload, **kwargs) -> '_FakeQuery':
+    self.action, self.payload = 'insert', payload
+    return self
+
+  def delete(self, **kwargs) -> '_FakeQuery':
+    self.action = 'delete'
+    return self
+
+  def eq(self, column: str, value: Any) -> '_FakeQuery':
+    self.filters.append(lambda row: row.get(column) == value)
+    return self
+
+  def like(self, column: str, pattern: str) -> '_FakeQuery':
+    needle = pattern.strip('%')
+    self.filters.append(lambda row: needle in (row.get(column) or ''))
+    return self
+
+  def order(self, *args, **kwargs) -> '_FakeQuery':
+    return self
+
+  def limit(self, *args, **kwargs) -> '_FakeQuery':
+    return self
+
+  def execute(self) -> _FakeResponse:
+    rows = self.client.tables.setdefault(self.table_name, [])
+    if self.action == 'insert':
+      start_time = time.monotonic()
+      new_rows = self.payload if isinstance(self.payload, list) else [self.payload]
+      encoded = json.dumps(new_rows)  # what postgrest-py does before the request
+      self.client.bytes_inserted += len(encoded)
+      for row in json.loads(encoded):
+        row['id'] = len(rows) + 1
+        rows.append(row)
+      self.client.insert_seconds += time.monotonic() - start_time
+      return _FakeResponse(rows[-len(new_rows):])
+    matching = [row for row in rows if all(condition(row) for condition in self.filters)]
+    if self.action == 'delete':
+      self.client.tables[self.table_name] = [row for row in rows if row not in matching]
+    return _FakeResponse(matching)
+
+
+class FakeSupabaseClient:
+
+  def __init__(self):
+    self.tables: Dict[str, List[Dict[str, Any]]] = {}
+    self.insert_seconds = 0.0
+    self.bytes_inserted = 0
+
+  def table(self, table_name: str) -> _FakeQuery:
+    return _FakeQuery(self, table_name)
+
+  def rpc(self, function_name: str, params: Dict[str, Any]) -> _FakeQuery:
+    query = _FakeQuery(self, f'rpc:{function_name}')
+    query.action, query.payload = 'insert', params
+    return query
+
+  def documents(self) -> List[Dict[str, Any]]:
+    return self.tables.get(os.getenv('REFACTORED_MATERIALS_SUPABASE_TABLE', 'documents'), [])
+
+
+class NullPosthog:
+
+  def capture(self, *args, **kwargs):
+    pass
+
+  def flush(self):
+    pass
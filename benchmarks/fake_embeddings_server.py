@@ -0,0 +1,156 @@
+"""
+A local stand-in for the OpenAI embeddings API, for benchmarks.
+
+Returns deterministic fake embeddings (so results can be checked) and enforces a simulated rate limit:
+requests over the per-minute request or token budget get a 429 with `retry-after-ms`, like the real API.
+Inputs containing INVALID_INPUT_MARKER are rejected with an `invalid_request_error`, to exercise batch splitting.
+Also answers Whisper transcriptions (`verbose_json`) with placeholder speech, so video ingest runs offline.
+
+Run standalone:
+  python benchmarks/fake_embeddings_server.py --port 8089 --max_requests_per_minute 3000
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+
+from aiohttp import web
+
+EMBEDDING_DIMS = 1536
+# Ingest uploads 32 kbps Opus segments, so the audio duration can be estimated from the upload size.
+AUDIO_BYTES_PER_SECOND = 32_000 / 8
+TRANSCRIPT_SEGMENT_SECONDS = 5.0
+INVALID_INPUT_MARKER = "<<invalid input>>"
+
+
+def fake_embedding(text: str, dims: int = EMBEDDING_DIMS):
+  """Deterministic per text, cheap to compute."""
+  seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+  rng = random.Random(seed)
+  return [rng.uniform(-1, 1) for _ in range(dims)]
+
+
+class FakeEmbeddingsServer:
+
+  def __init__(self,
+               max_requests_per_minute: float = 3_000,
+               max_tokens_per_minute: float = 1_000_000,
+               latency_seconds: float = 0.05,
+               dims: int = EMBEDDING_DIMS):
+    self.max_requests_per_minute = max_requests_per_minute
+    self.max_tokens_per_minute = max_tokens_per_minute
+    self.latency_seconds = latency_seconds
+    self.dims = dims
+    self.available_requests = max_requests_per_minute
+    self.available_tokens = max_tokens_per_minute
+    self.last_update_time = time.monotonic()
+    self.num_requests = 0
+    self.num_rate_limited = 0
+    self.num_inputs = 0
+    self.num_transcriptions = 0
+
+  def app(self) -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post('/v1/embeddings', self.embeddings)
+    app.router.add_post('/v1/audio/transcriptions', self.transcriptions)
+    return app
+
+  def _seconds_until_capacity(self, num_tokens: int) -> float:
+    """Refill the buckets, then return 0 if this request fits (and take its capacity), else seconds to wait."""
+    now = time.monotonic()
+    elapsed = now - self.last_update_time
+    self.last_update_time = now
+    self.available_requests = min(self.max_requests_per_minute,
+                                  self.available_requests + elapsed * self.max_requests_per_minute / 60)
+    self.available_tokens = min(self.max_tokens_per_minute,
+                                self.available_tokens + elapsed * self.max_tokens_per_minute / 60)
+    if self.available_requests >= 1 and self.available_tokens >= num_tokens:
+      self.available_requests -= 1
+      self.available_tokens -= num_tokens
+      return 0
+    request_wait = max(0, 1 - self.available_requests) * 60 / self.max_requests_per_minute
+    token_wait = max(0, num_tokens - self.available_tokens) * 60 / self.max_tokens_per_minute
+    return max(request_wait, token_wait)
+
+  async def embeddings(self, request: web.Request) -> web.Response:
+    self.num_requests += 1
+    body = await request.json()
+    inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+    num_tokens = sum(len(text) // 4 + 1 for text in inputs)  # rough, the server doesn't need to be exact
+
+    wait_seconds = self._seconds_until_capacity(num_tokens)
+    if wait_seconds > 0:
+      self.num_rate_limited += 1
+      return web.json_response(
+          {'error': {
+              'message': f'Rate limit reached. Please try again in {wait_seconds:.3f}s.',
+              'type': 'requests'
+          }},
+          status=429,
+          headers={'retry-after-ms': str(int(wait_seconds * 1000) + 1)})
+
+    if any(INVALID_INPUT_MARKER in text for text in inputs):
+      return web.json_response({'error': {'message': 'Invalid input.', 'type': 'invalid_request_error'}}, status=400)
+
+    await asyncio.sleep(self.latency_seconds)
+    self.num_inputs += len(inputs)
+    return web.json_response({
+        'object': 'list',
+        'model': body.get('model', 'text-embedding-ada-002'),
+        'data': [{
+            'object': 'embedding',
+            'index': i,
+            'embedding': fake_embedding(text, self.dims)
+        } for i, text in enumerate(inputs)],
+        'usage': {
+            'prompt_tokens': num_tokens,
+            'total_tokens': num_tokens
+        },
+    })
+
+  async def transcriptions(self, request: web.Request) -> web.Response:
+    self.num_transcriptions += 1
+    form = await request.post()
+    audio = form['file'].file.read()  # type: ignore
+    duration = max(TRANSCRIPT_SEGMENT_SECONDS, len(audio) / AUDIO_BYTES_PER_SECOND)
+    await asyncio.sleep(self.latency_seconds)
+    segments = []
+    start = 0.0
+    while start < duration:
+      end = min(duration, start + TRANSCRIPT_SEGMENT_SECONDS)
+      segments.append({
+          'id': len(segments),
+          'start': start,
+          'end': end,
+          'text': f" Placeholder speech from {start:.0f} to {end:.0f} seconds, lorem ipsum dolor sit amet."
+      })
+      start = end
+    return web.json_response({
+        'task': 'transcribe',
+        'duration': duration,
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+    })
+
+
+async def start_server(server: FakeEmbeddingsServer, host: str = '127.0.0.1', port: int = 0):
+  """Start in the current event loop. Returns (runner, base_url), call `await runner.cleanup()` when done."""
+  runner = web.AppRunner(server.app())
+  await runner.setup()
+  site = web.TCPSite(runner, host, port)
+  await site.start()
+  bound_port = site._server.sockets[0].getsockname()[1]  # type: ignore
+  return runner, f"http://{host}:{bound_port}"
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--port', type=int, default=8089)
+  parser.add_argument('--max_requests_per_minute', type=float, default=3_000)
+  parser.add_argument('--max_tokens_per_minute', type=float, default=1_000_000)
+  parser.add_argument('--latency_seconds', type=float, default=0.05)
+  args = parser.parse_args()
+  server = FakeEmbeddingsServer(args.max_requests_per_minute, args.max_tokens_per_minute, args.latency_seconds)
+  web.run_app(server.app(), port=args.port)
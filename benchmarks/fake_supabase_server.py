@@ -0,0 +1,62 @@
+"""
+A local stand-in for the two PostgREST endpoints /getTopContexts reads: the project's disabled doc groups and the
+doc groups shared with it. Serves a doc-group topology (written by `retrieval_latency.py seed`) over the same
+REST API supabase-py calls, with a configurable round-trip latency.
+"""
+
+import asyncio
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+# supabase-py only accepts keys shaped like a JWT
+FAKE_SUPABASE_KEY = 'fake.supabase.key'
+
+
+class FakeSupabaseServer:
+
+  def __init__(self, topology: Dict[str, Any], latency_seconds: float = 0.02):
+    """
+    `topology`: {'doc_groups': [{name, course_name, enabled, private, doc_count}],
+                 'sharing': [{'destination_project_name', 'doc_group': {name, course_name}}]}
+    """
+    self.latency_seconds = latency_seconds
+    self.doc_groups: List[Dict[str, Any]] = topology.get('doc_groups', [])
+    by_key = {(group['course_name'], group['name']): group for group in self.doc_groups}
+    self.shared_with: Dict[str, List[Dict[str, Any]]] = {}
+    for share in topology.get('sharing', []):
+      group = by_key[(share['doc_group']['course_name'], share['doc_group']['name'])]
+      self.shared_with.setdefault(share['destination_project_name'], []).append(group)
+    self.num_requests = 0
+
+  def app(self) -> web.Application:
+    app = web.Application()
+    app.router.add_get('/rest/v1/doc_groups', self.get_doc_groups)
+    app.router.add_get('/rest/v1/doc_groups_sharing', self.get_doc_groups_sharing)
+    return app
+
+  async def get_doc_groups(self, request: web.Request) -> web.Response:
+    self.num_requests += 1
+    await asyncio.sleep(self.latency_seconds)
+    rows = [
+        group for group in self.doc_groups
+        if _matches(request, 'course_name', group['course_name']) and _matches(request, 'enabled', group['enabled'])
+    ]
+    return web.json_response([{'name': group['name']} for group in rows])
+
+  async def get_doc_groups_sharing(self, request: web.Request) -> web.Response:
+    self.num_requests += 1
+    await asyncio.sleep(self.latency_seconds)
+    destination = request.query.get('destination_project_name', '').removeprefix('eq.')
+    return web.json_response([{'doc_groups': group} for group in self.shared_with.get(destination, [])])
+
+
+def _matches(request: web.Request, column: str, value: Any) -> bool:
+  """PostgREST `column=eq.value` filters. Missing filters match everything."""
+  condition = request.query.get(column)
+  if condition is None:
+    return True
+  expected = condition.removeprefix('eq.')
+  if isinstance(value, bool):
+    return expected == str(value).lower()
+  return expected == str(value)
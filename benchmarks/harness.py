@@ -0,0 +1,112 @@
+"""
+Shared helpers for the benchmark scripts: stage timing, running fake servers in the background, percentiles,
+and saving results for later comparison.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+
+class StageTimer:
+  """Accumulates wall time per stage by wrapping methods in place."""
+
+  def __init__(self):
+    self.seconds: Dict[str, float] = defaultdict(float)
+
+  def wrap(self, owner, method_name: str, stage: str):
+    original = getattr(owner, method_name)
+
+    if asyncio.iscoroutinefunction(original):
+
+      async def timed_async(*args, **kwargs):
+        start_time = time.monotonic()
+        try:
+          return await original(*args, **kwargs)
+        finally:
+          self.seconds[stage] += time.monotonic() - start_time
+
+      setattr(owner, method_name, functools.wraps(original)(timed_async))
+    else:
+
+      def timed(*args, **kwargs):
+        start_time = time.monotonic()
+        try:
+          return original(*args, **kwargs)
+        finally:
+          self.seconds[stage] += time.monotonic() - start_time
+
+      setattr(owner, method_name, functools.wraps(original)(timed))
+
+  def reset(self) -> Dict[str, float]:
+    """Return the times so far and start over."""
+    seconds, self.seconds = dict(self.seconds), defaultdict(float)
+    return seconds
+
+
+def start_servers_in_thread(*servers) -> List[str]:
+  """
+  Run fake servers (anything with an aiohttp `app()`) on one background event loop, so the code under test can
+  use its own loops and threads. Returns their base urls.
+  """
+  from fake_embeddings_server import start_server
+  loop = asyncio.new_event_loop()
+  started = threading.Event()
+  base_urls: List[str] = []
+
+  def serve():
+    asyncio.set_event_loop(loop)
+    for server in servers:
+      _, base_url = loop.run_until_complete(start_server(server))
+      base_urls.append(base_url)
+    started.set()
+    loop.run_forever()
+
+  threading.Thread(target=serve, daemon=True).start()
+  started.wait()
+  return base_urls
+
+
+def percentiles(values: Sequence[float], points: Sequence[int] = (50, 95, 99)) -> Dict[str, Optional[float]]:
+  """Nearest-rank percentiles, e.g. {'p50': ..., 'p95': ..., 'p99': ...}."""
+  ordered = sorted(values)
+  if not ordered:
+    return {f'p{point}': None for point in points}
+  return {f'p{point}': ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))] for point in points}
+
+
+def git_commit() -> Optional[str]:
+  try:
+    return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True,
+                          check=True).stdout.strip()
+  except Exception:
+    return None
+
+
+def save_results(benchmark_name: str,
+                 args: Dict[str, Any],
+                 results: List[Dict[str, Any]],
+                 output: Optional[str] = None) -> str:
+  """Save results as JSON, by default to benchmarks/results/<name>-<UTC timestamp>.json. Returns the path."""
+  output = output or os.path.join(BENCHMARKS_DIR, 'results',
+                                  f"{benchmark_name}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json")
+  os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+  saved = {
+      'created_at': datetime.now(timezone.utc).isoformat(),
+      'git_commit': git_commit(),
+      'args': args,
+      'results': results,
+  }
+  with open(output, 'w') as f:
+    json.dump(saved, f, indent=2)
+  return output
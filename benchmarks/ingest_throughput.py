@@ -0,0 +1,238 @@
+"""
+Ingest throughput over the fixtures in test-docs/, and scaled-up synthetic versions of them.
+
+Every file goes through the real `Ingest.bulk_ingest` path (type detection, the `_ingest_single_*` method,
+splitting, embedding, Qdrant upsert, Supabase insert) with the external services replaced locally:
+embeddings and Whisper by benchmarks/fake_embeddings_server.py, Qdrant by its in-memory local mode, and S3,
+Supabase and PostHog by benchmarks/fake_backends.py. Each file runs in its own process, for a clean peak RSS
+and a cold embedding cache.
+
+Reports per file: total seconds, per-stage seconds, chunks, chunks/sec and peak RSS. Stages:
+  download    S3File.download
+  split       TokenTextSplitter.create_documents
+  embed       the embeddings API calls (Qdrant uploads overlap with these)
+  upsert      waiting for the remaining Qdrant uploads and the final count check
+  sql_insert  encoding and inserting the Supabase row
+  parse       everything else: loading, OCR, transcription, duplicate checks
+
+Results are saved as JSON; pass an earlier result file to --compare to print the change per file.
+Needs the ingest requirements (see ai_ta_backend/beam/ingest.py) plus aiohttp installed locally.
+
+  python benchmarks/ingest_throughput.py --scales 1 10
+  python benchmarks/ingest_throughput.py --only .pdf .csv --compare benchmarks/results/ingest_throughput-20261019T120000Z.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from harness import REPO_DIR, StageTimer, save_results, start_servers_in_thread
+
+sys.path.append(os.path.join(REPO_DIR, 'ai_ta_backend', 'beam'))
+
+COURSE_NAME = 'ingest-benchmark'
+STAGES = ['download', 'parse', 'split', 'embed', 'upsert', 'sql_insert']
+# Formats we can grow by repeating their contents. The others only run at scale 1.
+TEXT_SUFFIXES = {'.txt', '.md', '.py', '.html', '.srt', '.vtt', '.json'}
+
+
+def run_one(path: str, args) -> Dict[str, Any]:
+  """Ingest one file in this process. Only called in the per-file child process."""
+  cache_dir = tempfile.mkdtemp(prefix='ingest-benchmark-cache-')
+  os.environ.update({
+      'INGEST_LOCAL_WORKER': '1',
+      'INGEST_CACHE_DIR': cache_dir,
+      'QDRANT_COLLECTION_NAME': 'benchmark',
+      'REFACTORED_MATERIALS_SUPABASE_TABLE': 'documents',
+      'S3_BUCKET_NAME': 'benchmark',
+      'VLADS_OPENAI_KEY': 'fake',
+  })
+  os.environ.pop('EMBEDDING_CACHE_REDIS_URL', None)
+
+  from fake_backends import FakeS3Client, FakeSupabaseClient, NullPosthog
+  from fake_embeddings_server import EMBEDDING_DIMS, FakeEmbeddingsServer
+  server = FakeEmbeddingsServer(max_requests_per_minute=args.server_requests_per_minute,
+                                max_tokens_per_minute=args.server_tokens_per_minute,
+                                latency_seconds=args.latency_seconds)
+  base_url, = start_servers_in_thread(server)
+  os.environ['OPENAI_EMBEDDINGS_URL'] = f"{base_url}/v1/embeddings"
+
+  import ingest
+  import openai
+  import OpenaiEmbeddings
+  import qdrant_uploader
+  import s3_file
+  import text_splitting
+  from qdrant_client import QdrantClient, models
+  openai.api_base = f"{base_url}/v1"
+  openai.api_key = 'fake'
+
+  qdrant_client = QdrantClient(':memory:')
+  qdrant_client.create_collection('benchmark',
+                                  vectors_config=models.VectorParams(size=EMBEDDING_DIMS,
+                                                                     distance=models.Distance.COSINE))
+  s3_path = f"courses/{COURSE_NAME}/{uuid.uuid4()}-{os.path.basename(path)}"
+  supabase_client = FakeSupabaseClient()
+  ingester = ingest.Ingest(qdrant_client, qdrant_client, None, FakeS3Client({s3_path: path}), supabase_client,
+                           NullPosthog())
+
+  timer = StageTimer()
+  timer.wrap(s3_file.S3File, 'download', 'download')
+  timer.wrap(text_splitting.TokenTextSplitter, 'create_documents', 'split')
+  timer.wrap(OpenaiEmbeddings.OpenAIAPIProcessor, 'process_api_requests_from_file', 'embed')
+  timer.wrap(qdrant_uploader.QdrantUploader, 'flush', 'upsert')
+  timer.wrap(qdrant_uploader.QdrantUploader, 'wait_for_count', 'upsert')
+
+  baseline_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+  start_time = time.monotonic()
+  result = ingester.bulk_ingest(COURSE_NAME, s3_path)
+  total_seconds = time.monotonic() - start_time
+  shutil.rmtree(cache_dir, ignore_errors=True)
+
+  stages = dict(timer.seconds)
+  stages['sql_insert'] = supabase_client.insert_seconds
+  stages['parse'] = max(0.0, total_seconds - sum(stages.values()))
+  num_chunks = sum(len(document.get('contexts') or []) for document in supabase_client.documents())
+  return {
+      'status': 'success' if result.get('success_ingest') else 'failure',
+      'error': None if result.get('success_ingest') else str(result.get('failure_ingest'))[:2000],
+      'bytes': os.path.getsize(path),
+      'seconds': round(total_seconds, 4),
+      'stages': {
+          stage: round(stages.get(stage, 0.0), 4) for stage in STAGES
+      },
+      'chunks': num_chunks,
+      'chunks_per_second': round(num_chunks / total_seconds, 2) if total_seconds else None,
+      'embedding_requests': server.num_requests,
+      'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+      'baseline_rss_mb': round(baseline_rss_mb, 1),
+      'children_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),  # ffmpeg etc.
+  }
+
+
+def make_scaled(path: str, scale: int, output_dir: str) -> Optional[str]:
+  """A copy of `path` with its contents repeated `scale` times, or None for formats we can't grow."""
+  if scale == 1:
+    return path
+  suffix = os.path.splitext(path)[1].lower()
+  scaled_path = os.path.join(output_dir, f"x{scale}-{os.path.basename(path)}")
+  if suffix in TEXT_SUFFIXES:
+    with open(path, encoding='utf-8', errors='ignore') as f:
+      text = f.read()
+    with open(scaled_path, 'w', encoding='utf-8') as f:
+      f.write('\n\n'.join([text] * scale))
+  elif suffix == '.csv':
+    with open(path, encoding='utf-8', errors='ignore') as f:
+      header, *rows = f.read().splitlines()
+    with open(scaled_path, 'w', encoding='utf-8') as f:
+      f.write('\n'.join([header] + rows * scale) + '\n')
+  elif suffix == '.pdf':
+    import fitz
+    source = fitz.open(path)
+    scaled = fitz.open()
+    for _ in range(scale):
+      scaled.insert_pdf(source)
+    scaled.save(scaled_path)
+  elif suffix == '.xlsx':
+    from openpyxl import load_workbook
+    workbook = load_workbook(path)
+    for sheet in workbook.worksheets:
+      rows = list(sheet.iter_rows(min_row=2, values_only=True))
+      for _ in range(scale - 1):
+        for row in rows:
+          sheet.append(row)
+    workbook.save(scaled_path)
+  else:
+    return None
+  return scaled_path
+
+
+def print_results(results: List[Dict[str, Any]]):
+  header = f"{'file':<22} {'scale':>5} {'status':<8} {'seconds':>8} " + ' '.join(f"{stage:>10}" for stage in STAGES)
+  print(header + f" {'chunks':>7} {'chunks/s':>9} {'rss MB':>7}")
+  for result in results:
+    stages = ' '.join(f"{result.get('stages', {}).get(stage, 0):>10.3f}" for stage in STAGES)
+    print(f"{result['fixture']:<22} {result['scale']:>5} {result['status']:<8} {result.get('seconds', 0):>8.3f} "
+          f"{stages} {result.get('chunks', 0):>7} {result.get('chunks_per_second') or 0:>9.1f} "
+          f"{result.get('peak_rss_mb', 0):>7.1f}")
+    if result.get('error'):
+      print(f"    error: {result['error'][:300]}")
+
+
+def print_comparison(results: List[Dict[str, Any]], baseline_path: str):
+  with open(baseline_path) as f:
+    baseline = {(result['fixture'], result['scale']): result for result in json.load(f)['results']}
+  print(f"\nChange vs {baseline_path} (negative seconds is faster):")
+  for result in results:
+    previous = baseline.get((result['fixture'], result['scale']))
+    if not previous or previous['status'] != 'success' or result['status'] != 'success':
+      continue
+    seconds_change = (result['seconds'] - previous['seconds']) / previous['seconds'] * 100
+    rss_change = result['peak_rss_mb'] - previous['peak_rss_mb']
+    print(f"{result['fixture']:<22} x{result['scale']:<4} seconds {seconds_change:+7.1f}%   "
+          f"chunks {previous['chunks']} -> {result['chunks']}   peak RSS {rss_change:+.1f} MB")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--docs_dir', default=os.path.join(REPO_DIR, 'test-docs'))
+  parser.add_argument('--only', nargs='*', default=None, help='Only these extensions, e.g. .pdf .csv')
+  parser.add_argument('--scales', nargs='+', type=int, default=[1, 10])
+  parser.add_argument('--latency_seconds', type=float, default=0.05, help='Fake embeddings API latency')
+  parser.add_argument('--server_requests_per_minute', type=float, default=10_000)
+  parser.add_argument('--server_tokens_per_minute', type=float, default=10_000_000)
+  parser.add_argument('--output', default=None, help='Where to save the results (default: benchmarks/results/)')
+  parser.add_argument('--compare', default=None, help='An earlier results file to compare against')
+  parser.add_argument('--run_one', default=None, help=argparse.SUPPRESS)
+  parser.add_argument('--result_file', default=None, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.run_one:
+    with open(args.result_file, 'w') as f:
+      json.dump(run_one(args.run_one, args), f)
+    return
+
+  fixtures = sorted(
+      os.path.join(args.docs_dir, filename)
+      for filename in os.listdir(args.docs_dir)
+      if not args.only or os.path.splitext(filename)[1].lower() in args.only)
+  passthrough = ['--latency_seconds', str(args.latency_seconds)]
+  passthrough += ['--server_requests_per_minute', str(args.server_requests_per_minute)]
+  passthrough += ['--server_tokens_per_minute', str(args.server_tokens_per_minute)]
+
+  results: List[Dict[str, Any]] = []
+  with tempfile.TemporaryDirectory(prefix='ingest-benchmark-') as work_dir:
+    for scale in args.scales:
+      for fixture in fixtures:
+        path = make_scaled(fixture, scale, work_dir)
+        if path is None:
+          continue
+        result_file = os.path.join(work_dir, 'result.json')
+        print(f"Ingesting {os.path.basename(fixture)} x{scale}...", flush=True)
+        command = [sys.executable, __file__, '--run_one', path, '--result_file', result_file] + passthrough
+        child = subprocess.run(command, capture_output=True, text=True)
+        if child.returncode == 0:
+          with open(result_file) as f:
+            result = json.load(f)
+        else:
+          result = {'status': 'crashed', 'error': child.stderr[-2000:]}
+        results.append({'fixture': os.path.basename(fixture), 'scale': scale, **result})
+
+  print_results(results)
+  run_args = {key: value for key, value in vars(args).items() if key not in ('run_one', 'result_file')}
+  output = save_results('ingest_throughput', run_args, results, output=args.output)
+  print(f"\nSaved results to {output}")
+  if args.compare:
+    print_comparison(results, args.compare)
+
+
+if __name__ == '__main__':
+  main()
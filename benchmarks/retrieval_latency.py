@@ -0,0 +1,349 @@
+"""
+Latency and throughput of /getTopContexts, end to end, against a local Qdrant.
+
+  seed    Fill a Qdrant collection with a synthetic corpus: courses, doc groups per course, and points tagged with
+          some of their course's groups, payloads shaped like ingest's. Also writes the doc-group topology (which
+          groups are disabled, which are shared with which projects) that the fake Supabase serves.
+  load    Start the app with the gunicorn settings from run.sh and send concurrent requests at each --concurrency
+          level. Reports p50/p95/p99 latency, throughput and errors per level, plus the per-stage breakdown from
+          the Server-Timing header.
+  stages  Run the app in-process, one request at a time, and report each stage from the Server-Timing header:
+          doc-group lookups, query embedding, vector search and formatting.
+
+Embeddings come from benchmarks/fake_embeddings_server.py and the doc-group lookups from
+benchmarks/fake_supabase_server.py, both with configurable latency, so the numbers isolate our own code and Qdrant.
+
+  docker run -p 6333:6333 qdrant/qdrant
+  python benchmarks/retrieval_latency.py seed --num_points 200000 --num_courses 20 --doc_groups_per_course 8
+  python benchmarks/retrieval_latency.py load --concurrency 1 8 32 64 --requests_per_level 500
+  python benchmarks/retrieval_latency.py stages --num_requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from harness import (
+    BENCHMARKS_DIR,
+    REPO_DIR,
+    percentiles,
+    save_results,
+    start_servers_in_thread,
+)
+
+DEFAULT_TOPOLOGY_PATH = os.path.join(BENCHMARKS_DIR, 'results', 'retrieval_topology.json')
+WORDS = ('lecture exam homework syllabus regression gradient matrix protein enzyme soil nitrogen yield circuit '
+         'voltage transistor theorem proof lemma derivative integral entropy kernel vector tensor cell').split()
+
+
+def seed(args):
+  import numpy as np
+  from qdrant_client import QdrantClient, models
+
+  rng = random.Random(args.seed)
+  np_rng = np.random.default_rng(args.seed)
+  client = QdrantClient(url=args.qdrant_url, api_key=args.qdrant_api_key or None, timeout=60)
+  client.recreate_collection(args.collection,
+                             vectors_config=models.VectorParams(size=args.dims, distance=models.Distance.COSINE))
+  for field in ('course_name', 'doc_groups'):
+    client.create_payload_index(args.collection, field_name=field, field_schema=models.PayloadSchemaType.KEYWORD)
+
+  courses = [f"bench-course-{i}" for i in range(args.num_courses)]
+  groups = {course: [f"group-{j}" for j in range(args.doc_groups_per_course)] for course in courses}
+  for start in range(0, args.num_points, args.batch_size):
+    count = min(args.batch_size, args.num_points - start)
+    vectors = np_rng.standard_normal((count, args.dims), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    points = []
+    for offset, vector in enumerate(vectors):
+      point_id = start + offset
+      course = courses[point_id % len(courses)]
+      document = point_id // args.chunks_per_document
+      points.append(
+          models.PointStruct(
+              id=point_id,
+              vector=vector.tolist(),
+              payload={
+                  'course_name': course,
+                  's3_path': f"courses/{course}/document-{document}.pdf",
+                  'readable_filename': f"document-{document}.pdf",
+                  'pagenumber': point_id % 40,
+                  'timestamp': '',
+                  'url': '',
+                  'base_url': '',
+                  'chunk_index': point_id % args.chunks_per_document,
+                  'doc_groups': rng.sample(groups[course], min(args.groups_per_point, len(groups[course]))),
+                  'page_content': ' '.join(rng.choices(WORDS, k=args.words_per_chunk)),
+              }))
+    client.upsert(args.collection, points=points, wait=True)
+    print(f"Seeded {start + count}/{args.num_points} points", flush=True)
+
+  topology: Dict[str, Any] = {'courses': courses, 'doc_groups': [], 'sharing': []}
+  for course in courses:
+    for j, name in enumerate(groups[course]):
+      topology['doc_groups'].append({
+          'name': name,
+          'course_name': course,
+          'enabled': j >= args.disabled_doc_groups_per_course,
+          'private': False,
+          'doc_count': args.num_points // (len(courses) * args.chunks_per_document),
+      })
+  enabled_groups = [group for group in topology['doc_groups'] if group['enabled']]
+  for course in courses:
+    candidates = [group for group in enabled_groups if group['course_name'] != course]
+    for group in rng.sample(candidates, min(args.shared_doc_groups_per_course, len(candidates))):
+      topology['sharing'].append({
+          'destination_project_name': course,
+          'doc_group': {
+              'name': group['name'],
+              'course_name': group['course_name']
+          }
+      })
+  os.makedirs(os.path.dirname(os.path.abspath(args.topology)), exist_ok=True)
+  with open(args.topology, 'w') as f:
+    json.dump(topology, f, indent=2)
+  print(f"Wrote doc-group topology to {args.topology}")
+
+
+def app_env(args, openai_base_url: str, supabase_url: str) -> Dict[str, str]:
+  """Environment for the Flask app: local Qdrant, fake Supabase and OpenAI, dummy values for unused services."""
+  from fake_supabase_server import FAKE_SUPABASE_KEY
+  qdrant_port = urlparse(args.qdrant_url).port or 6333
+  pythonpath = os.pathsep.join([REPO_DIR, os.path.join(REPO_DIR, 'ai_ta_backend'), os.getenv('PYTHONPATH', '')])
+  return {
+      **os.environ,
+      'PYTHONPATH': pythonpath,
+      'QDRANT_URL': args.qdrant_url,
+      'QDRANT_API_KEY': args.qdrant_api_key,
+      'QDRANT_COLLECTION_NAME': args.collection,
+      'VYRIAD_QDRANT_URL': args.qdrant_url,
+      'VYRIAD_QDRANT_PORT': str(qdrant_port),
+      'VYRIAD_QDRANT_API_KEY': args.qdrant_api_key,
+      'SUPABASE_URL': supabase_url,
+      'SUPABASE_API_KEY': FAKE_SUPABASE_KEY,
+      'OPENAI_API_BASE': f"{openai_base_url}/v1",
+      'OPENAI_API_TYPE': 'openai',
+      'VLADS_OPENAI_KEY': 'fake',
+      'OLLAMA_SERVER_URL': openai_base_url,
+      'AWS_ACCESS_KEY_ID': os.getenv('AWS_ACCESS_KEY_ID', 'fake'),
+      'AWS_SECRET_ACCESS_KEY': os.getenv('AWS_SECRET_ACCESS_KEY', 'fake'),
+      'POSTHOG_API_KEY': os.getenv('POSTHOG_API_KEY', 'fake'),
+      'SENTRY_DSN': '',
+  }
+
+
+def start_fake_services(args):
+  from fake_embeddings_server import FakeEmbeddingsServer
+  from fake_supabase_server import FakeSupabaseServer
+  with open(args.topology) as f:
+    topology = json.load(f)
+  embeddings_server = FakeEmbeddingsServer(max_requests_per_minute=1_000_000,
+                                           max_tokens_per_minute=1_000_000_000,
+                                           latency_seconds=args.embedding_latency_seconds)
+  supabase_server = FakeSupabaseServer(topology, latency_seconds=args.supabase_latency_seconds)
+  openai_base_url, supabase_url = start_servers_in_thread(embeddings_server, supabase_server)
+  return topology, openai_base_url, supabase_url
+
+
+def request_bodies(topology: Dict[str, Any], count: int, top_n: int, seed_value: int) -> List[Dict[str, Any]]:
+  """A reproducible query mix: random courses, half searching all documents and half one doc group."""
+  rng = random.Random(seed_value)
+  groups_by_course: Dict[str, List[str]] = {}
+  for group in topology['doc_groups']:
+    groups_by_course.setdefault(group['course_name'], []).append(group['name'])
+  bodies = []
+  for _ in range(count):
+    course = rng.choice(topology['courses'])
+    doc_groups = ['All Documents'] if rng.random() < 0.5 else [rng.choice(groups_by_course[course])]
+    bodies.append({
+        'course_name': course,
+        'search_query': ' '.join(rng.choices(WORDS, k=rng.randint(4, 16))),
+        'doc_groups': doc_groups,
+        'top_n': top_n,
+    })
+  return bodies
+
+
+def gunicorn_command(bind: str) -> List[str]:
+  """The gunicorn invocation from run.sh, so the benchmark always uses the deployed worker settings."""
+  with open(os.path.join(REPO_DIR, 'run.sh')) as f:
+    exec_line = next(line for line in f if line.strip().startswith('exec') and 'gunicorn' in line)
+  run_sh_args = shlex.split(exec_line)
+  return [sys.executable, '-m', 'gunicorn', *run_sh_args[run_sh_args.index('gunicorn') + 1:], '--bind', bind]
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout_seconds: float = 180):
+  deadline = time.monotonic() + timeout_seconds
+  while time.monotonic() < deadline:
+    if process.poll() is not None:
+      raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+    try:
+      with urllib.request.urlopen(base_url + '/', timeout=2):
+        return
+    except Exception:
+      time.sleep(0.5)
+  raise TimeoutError(f"The app didn't come up within {timeout_seconds:.0f}s")
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+  """`embed;dur=12.3, search;dur=40` -> {'embed': 12.3, 'search': 40.0} (milliseconds)."""
+  stages: Dict[str, float] = {}
+  for metric in (header or '').split(','):
+    name, _, params = metric.strip().partition(';')
+    for param in params.split(';'):
+      key, _, value = param.strip().partition('=')
+      if name and key == 'dur':
+        stages[name] = float(value)
+  return stages
+
+
+async def generate_load(base_url: str, bodies: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+  import aiohttp
+  latencies: List[float] = []
+  stage_ms: Dict[str, List[float]] = {}
+  errors: Dict[str, int] = {}
+  queue: asyncio.Queue = asyncio.Queue()
+  for body in bodies:
+    queue.put_nowait(body)
+
+  async def user(session):
+    while not queue.empty():
+      body = queue.get_nowait()
+      start_time = time.monotonic()
+      try:
+        async with session.post(f"{base_url}/getTopContexts", json=body) as response:
+          result = await response.json(content_type=None)
+          if response.status != 200 or isinstance(result, str):
+            errors[str(response.status)] = errors.get(str(response.status), 0) + 1
+            continue
+          for stage, duration in parse_server_timing(response.headers.get('Server-Timing')).items():
+            stage_ms.setdefault(stage, []).append(duration)
+      except Exception as e:
+        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        continue
+      latencies.append(time.monotonic() - start_time)
+
+  timeout = aiohttp.ClientTimeout(total=300)
+  async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+    start_time = time.monotonic()
+    await asyncio.gather(*(user(session) for _ in range(concurrency)))
+    wall_seconds = time.monotonic() - start_time
+
+  return {
+      'concurrency': concurrency,
+      'requests': len(bodies),
+      'succeeded': len(latencies),
+      'errors': errors,
+      'wall_seconds': round(wall_seconds, 3),
+      'requests_per_second': round(len(latencies) / wall_seconds, 2),
+      'latency_ms': {
+          key: value and round(value * 1000, 1) for key, value in percentiles(latencies).items()
+      },
+      'stages_ms': {
+          stage: percentiles(values) for stage, values in sorted(stage_ms.items())
+      },
+  }
+
+
+def load(args):
+  topology, openai_base_url, supabase_url = start_fake_services(args)
+  bind = f"127.0.0.1:{args.port}"
+  process = subprocess.Popen(gunicorn_command(bind), cwd=REPO_DIR, env=app_env(args, openai_base_url, supabase_url))
+  results = []
+  try:
+    wait_until_ready(f"http://{bind}", process)
+    asyncio.run(generate_load(f"http://{bind}", request_bodies(topology, args.warmup_requests, args.top_n, -1), 4))
+    for level, concurrency in enumerate(args.concurrency):
+      bodies = request_bodies(topology, args.requests_per_level, args.top_n, args.seed + level)
+      result = asyncio.run(generate_load(f"http://{bind}", bodies, concurrency))
+      results.append(result)
+      latency = result['latency_ms']
+      print(f"concurrency {concurrency:>4}: {result['requests_per_second']:>8.1f} req/s   p50 {latency['p50']} ms   "
+            f"p95 {latency['p95']} ms   p99 {latency['p99']} ms   errors {result['errors'] or 0}")
+      for stage, stage_percentiles in result['stages_ms'].items():
+        print(f"    {stage:<14} p50 {stage_percentiles['p50']} ms   p95 {stage_percentiles['p95']} ms")
+  finally:
+    process.terminate()
+    process.wait(timeout=30)
+  print(f"\nSaved results to {save_results('retrieval_latency', vars(args), results, output=args.output)}")
+
+
+def stages(args):
+  topology, openai_base_url, supabase_url = start_fake_services(args)
+  os.environ.update(app_env(args, openai_base_url, supabase_url))
+  sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, 'ai_ta_backend')]
+  os.environ['STAGE_TIMING_ENABLED'] = 'true'
+  from ai_ta_backend.main import app
+
+  client = app.test_client()
+  totals: List[float] = []
+  stage_ms: Dict[str, List[float]] = {}
+  for body in request_bodies(topology, args.num_requests, args.top_n, args.seed):
+    start_time = time.monotonic()
+    response = client.post('/getTopContexts', json=body)
+    totals.append((time.monotonic() - start_time) * 1000)
+    if response.status_code != 200:
+      print(f"Request failed with {response.status_code}: {response.get_data(as_text=True)[:500]}")
+    for stage, duration in parse_server_timing(response.headers.get('Server-Timing')).items():
+      stage_ms.setdefault(stage, []).append(duration)
+
+  def rounded(values):
+    return {key: value and round(value, 2) for key, value in percentiles(values).items()}
+
+  result = {'requests': len(totals), 'total_ms': rounded(totals)}
+  result['stages_ms'] = {stage: rounded(values) for stage, values in stage_ms.items() if stage != 'total'}
+  print(f"{'stage':<14} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+  for stage, stage_percentiles in [('total', result['total_ms'])] + list(result['stages_ms'].items()):
+    print(f"{stage:<14} {stage_percentiles['p50']:>9} {stage_percentiles['p95']:>9} {stage_percentiles['p99']:>9}")
+  print(f"\nSaved results to {save_results('retrieval_stages', vars(args), [result], output=args.output)}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--qdrant_url', default=os.getenv('BENCHMARK_QDRANT_URL', 'http://localhost:6333'))
+  parser.add_argument('--qdrant_api_key', default='')
+  parser.add_argument('--collection', default='retrieval_benchmark')
+  parser.add_argument('--topology', default=DEFAULT_TOPOLOGY_PATH)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', default=None)
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  seed_parser = subparsers.add_parser('seed')
+  seed_parser.add_argument('--num_points', type=int, default=100_000)
+  seed_parser.add_argument('--num_courses', type=int, default=10)
+  seed_parser.add_argument('--doc_groups_per_course', type=int, default=5)
+  seed_parser.add_argument('--groups_per_point', type=int, default=1)
+  seed_parser.add_argument('--disabled_doc_groups_per_course', type=int, default=1)
+  seed_parser.add_argument('--shared_doc_groups_per_course', type=int, default=2)
+  seed_parser.add_argument('--chunks_per_document', type=int, default=50)
+  seed_parser.add_argument('--words_per_chunk', type=int, default=250)
+  seed_parser.add_argument('--dims', type=int, default=1536)
+  seed_parser.add_argument('--batch_size', type=int, default=1_000)
+
+  for name in ('load', 'stages'):
+    subparser = subparsers.add_parser(name)
+    subparser.add_argument('--top_n', type=int, default=100)
+    subparser.add_argument('--embedding_latency_seconds', type=float, default=0.15)
+    subparser.add_argument('--supabase_latency_seconds', type=float, default=0.03)
+  load_parser = subparsers.choices['load']
+  load_parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16, 64])
+  load_parser.add_argument('--requests_per_level', type=int, default=300)
+  load_parser.add_argument('--warmup_requests', type=int, default=20)
+  load_parser.add_argument('--port', type=int, default=8765)
+  subparsers.choices['stages'].add_argument('--num_requests', type=int, default=100)
+
+  args = parser.parse_args()
+  {'seed': seed, 'load': load, 'stages': stages}[args.command](args)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,24 @@
+"""
+Gunicorn server hooks. The worker settings are on the command line in run.sh.
+
+Prometheus multiprocess mode: each worker writes its metrics to files in PROMETHEUS_MULTIPROC_DIR and /metrics
+adds them up (ai_ta_backend/utils/metrics.py), so a scrape covers every worker of the replica.
+"""
+
+import glob
+import os
+
+
+def on_starting(server):
+  multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+  if multiproc_dir:
+    # Samples left over from the previous run would be counted again.
+    os.makedirs(multiproc_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+      os.remove(path)
+
+
+def child_exit(server, worker):
+  if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
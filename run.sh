@@ -6,4 +6,6 @@
 # ray start --head --num-cpus 6 --object-store-memory 300000000
 
 export PYTHONPATH=${PYTHONPATH}:$(pwd)/ai_ta_backend
-exec uv run gunicorn --workers=3 --threads=100 --worker-class=gthread ai_ta_backend.main:app --timeout 1800
+# Shared by the workers so /metrics aggregates all of them, see gunicorn.conf.py
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}
+exec uv run gunicorn --config gunicorn.conf.py --workers=3 --threads=100 --worker-class=gthread ai_ta_backend.main:app --timeout 1800
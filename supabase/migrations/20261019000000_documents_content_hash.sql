@@ -0,0 +1,8 @@
+-- Content-addressed duplicate detection for ingest.
+-- SHA-256 of the raw file bytes (or of the text, for web pages). Looked up by (course_name, content_hash)
+-- before parsing, so duplicate uploads never transfer or compare `contexts`.
+-- Per-chunk hashes are stored inside `contexts` as `chunk_hash`.
+ALTER TABLE public.documents ADD COLUMN IF NOT EXISTS content_hash text;
+
+CREATE INDEX IF NOT EXISTS documents_course_name_content_hash_idx
+  ON public.documents (course_name, content_hash);
@@ -0,0 +1,4 @@
+-- Chunk embeddings move out of the contexts JSON into one compact column.
+-- context_embeddings: base64 of a float32 (little-endian, row-major) array, row i is contexts[i].
+-- Rows written before this keep their embeddings in contexts[i].embedding, readers handle both.
+ALTER TABLE public.documents ADD COLUMN IF NOT EXISTS context_embeddings text;